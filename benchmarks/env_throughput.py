@@ -0,0 +1,59 @@
+"""Environment steps per second for QixEnv, VectorEnv and ParallelVectorEnv.
+
+    python benchmarks/env_throughput.py --envs 64 --workers 16
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from env import QixEnv, VectorEnv, ParallelVectorEnv, ACTIONS
+
+
+def single(steps, seed):
+    env = QixEnv()
+    env.reset(seed=seed)
+    actions = np.random.default_rng(seed).integers(0, len(ACTIONS), steps).tolist()
+    start = time.perf_counter()
+    for action in actions:
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def vector(env, steps, seed):
+    env.reset(seed=seed)
+    rng = np.random.default_rng(seed)
+    batches = max(1, steps // env.num_envs)
+    actions = rng.integers(0, len(ACTIONS), (batches, env.num_envs))
+    start = time.perf_counter()
+    for batch in actions:
+        env.step(batch)
+    elapsed = time.perf_counter() - start
+    env.close()
+    return batches * env.num_envs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=100000, help="environment steps per measurement")
+    parser.add_argument('--envs', type=int, default=64, help="games per vector env")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="ParallelVectorEnv processes")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"QixEnv:             {single(args.steps, args.seed):10.0f} steps/s")
+    print(f"VectorEnv:          {vector(VectorEnv(args.envs), args.steps, args.seed):10.0f} steps/s")
+    parallel = ParallelVectorEnv(args.envs, workers=args.workers)
+    print(f"ParallelVectorEnv:  {vector(parallel, args.steps, args.seed):10.0f} steps/s "
+          f"({args.workers} workers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+"""Scripted scenario benchmarks for the game's per-frame hot paths.
+
+Runs without a window (SDL_VIDEODRIVER=dummy) and times every frame in
+phases: event handling, movement, enemy update, collision, area
+calculation, particle effects, render and flip. Results go out as JSON so runs from two
+commits can be compared:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pygame
+
+from display import Display
+from main import window_size
+from path import PlayerPath
+from render import PlayRenderer, load_fonts, draw_pause_menu
+from simulation import (QixSimulation, Inputs, NO_INPUT, BORDER_LEFT, BORDER_TOP, STATE_PLAYING,
+                        EVENT_DEATH, DEATH_SPARX)
+
+PHASES = ['events', 'movement', 'enemies', 'collision', 'area', 'effects', 'render', 'flip']
+
+# Phase each QixSimulation.step() span is charged to
+SIM_PHASES = {
+    'capture': 'area',
+    'movement': 'movement',
+    'sparx_update': 'enemies',
+    'sparx_collision': 'collision',
+    'qix_collision': 'collision',
+    'qix_update': 'enemies',
+}
+
+BOARD_SIZE = (700, 700)
+
+# Keep scripted push lines this far inside the border, out of the Sparx' reach
+WALK_INSET = 40
+
+
+class FrameTimings:
+    """Seconds spent in each phase, one list entry per frame"""
+
+    def __init__(self):
+        self.phases = {phase: [] for phase in PHASES}
+        self.current = None
+
+    def start_frame(self):
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to `phase`"""
+        now = time.perf_counter()
+        self.current[SIM_PHASES.get(phase, phase)] += now - self.mark
+        self.mark = now
+
+    def end_frame(self):
+        for phase, seconds in self.current.items():
+            self.phases[phase].append(seconds)
+
+    def summary(self):
+        phases = {phase: np.array(times) * 1000 for phase, times in self.phases.items()}
+        frames = sum(phases.values())
+        result = {'frames': len(frames), 'frame_ms': stats(frames), 'phases_ms': {}}
+        for phase, times in phases.items():
+            result['phases_ms'][phase] = stats(times)
+        return result
+
+
+def stats(times):
+    return {
+        'mean': round(float(times.mean()), 4),
+        'p50': round(float(np.percentile(times, 50)), 4),
+        'p99': round(float(np.percentile(times, 99)), 4),
+        'max': round(float(times.max()), 4),
+    }
+
+
+class RandomWalk:
+    """Scripted arrow key input that wanders inside the border without reversing"""
+
+    def __init__(self, sim, seed):
+        self.sim = sim
+        self.rng = random.Random(seed)
+        self.direction = None
+        self.hold = 0
+
+    def allowed(self, direction):
+        sim = self.sim
+        x, y = sim.xpos, sim.ypos
+        step = sim.speed
+        low_x, low_y = sim.min_x + WALK_INSET, sim.min_y + WALK_INSET
+        high_x, high_y = sim.max_x - WALK_INSET, sim.max_y - WALK_INSET
+        return {
+            'left': x - step >= low_x,
+            'right': x + step <= high_x,
+            'up': y - step >= low_y,
+            'down': y + step <= high_y,
+        }[direction]
+
+    def next_inputs(self):
+        opposite = {'left': 'right', 'right': 'left', 'up': 'down', 'down': 'up'}
+        if self.hold <= 0 or not self.allowed(self.direction):
+            choices = [d for d in opposite if d != opposite.get(self.direction) and self.allowed(d)]
+            self.direction = self.rng.choice(choices or list(opposite))
+            self.hold = self.rng.randint(1, 6)
+        self.hold -= 1
+        return Inputs(**{self.direction: True})
+
+
+def start_interior_push(sim):
+    """Put the player in the middle of the board with a push line just started"""
+    sim.xpos, sim.ypos = sim.board_width // 2, sim.board_height // 2
+    sim.push_enabled = True
+    sim.start_path([sim.player_center()])
+    # Deaths would throw the scripted line away; collisions are still checked
+    sim.lose_life = lambda cause, events: None
+
+
+def grow_path(sim, walk, vertices):
+    """Push the line along the walk until it has `vertices` points, enemies frozen"""
+    while len(sim.player_path) < vertices:
+        sim.move_player(walk.next_inputs())
+
+
+def random_polygon(rng, sim):
+    """A rectangle or a staircase polygon somewhere on the board"""
+    left = rng.randrange(BORDER_LEFT, sim.board_width - 150)
+    top = rng.randrange(BORDER_TOP, sim.board_height - 150)
+    width, height = rng.randrange(10, 100), rng.randrange(10, 100)
+    if rng.random() < 0.5:
+        points = [(left, top), (left + width, top), (left + width, top + height), (left, top + height)]
+    else:
+        steps = rng.randrange(3, 12)
+        points = [(left, top)]
+        for i in range(1, steps + 1):
+            x = left + width * i // steps
+            y = top + height * i // steps
+            points += [(x, points[-1][1]), (x, y)]
+        points.append((left, points[-1][1]))
+    return PlayerPath(points).freeze()
+
+
+def play_frame(sim, display, renderer, timings, inputs=NO_INPUT, capture=None, death=False):
+    """One PLAY frame of one tick, split into phases.
+
+    `capture` is a polygon claimed during the frame, charged to 'area'.
+    `death` raises a death event, for the effects, without costing a life.
+    """
+    timings.start_frame()
+    pygame.event.pump()
+    for _ in pygame.event.get():
+        pass
+    pygame.key.get_pressed()
+    timings.lap('events')
+
+    renderer.capture(sim)
+    timings.lap('render')
+
+    sim.lap = timings.lap
+    events = sim.step(inputs)
+    if death:
+        events.append((EVENT_DEATH, DEATH_SPARX))
+    if capture is not None:
+        sim.capture(capture, events)
+        # Keep playing past the win
+        sim.state = STATE_PLAYING
+    sim.territory_percentage()
+    timings.lap('area')
+
+    renderer.tick_effects(sim, events)
+    timings.lap('effects')
+
+    rects = renderer.draw(sim)
+    timings.lap('render')
+    display.present(rects)
+    timings.lap('flip')
+    timings.end_frame()
+
+
+def push_path_2000(display, fonts, frames, seed):
+    """A 2,000 vertex push line being extended every frame"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed)
+    walk = RandomWalk(sim, seed)
+    start_interior_push(sim)
+    grow_path(sim, walk, 2000)
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for _ in range(frames):
+        play_frame(sim, display, renderer, timings, walk.next_inputs())
+    return timings
+
+
+def captures_200(display, fonts, frames, seed):
+    """One capture a frame until 200 polygons are claimed, then steady play"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed)
+    rng = random.Random(seed)
+    polygons = [random_polygon(rng, sim) for _ in range(200)]
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for frame in range(frames):
+        capture = polygons[frame] if frame < len(polygons) else None
+        play_frame(sim, display, renderer, timings, capture=capture)
+    return timings
+
+
+def sparx_100(display, fonts, frames, seed):
+    """100 Sparx on the border while the player pushes a line"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed, sparx_count=100)
+    walk = RandomWalk(sim, seed)
+    start_interior_push(sim)
+    grow_path(sim, walk, 200)
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for _ in range(frames):
+        play_frame(sim, display, renderer, timings, walk.next_inputs())
+    return timings
+
+
+def particles_4000(display, fonts, frames, seed):
+    """A full particle pool: 200 Sparx throwing sparks, a capture every 10 frames and a death every 15"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed, sparx_count=200)
+    rng = random.Random(seed)
+    walk = RandomWalk(sim, seed)
+    start_interior_push(sim)
+    grow_path(sim, walk, 200)
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for frame in range(frames):
+        capture = random_polygon(rng, sim) if frame % 10 == 0 else None
+        play_frame(sim, display, renderer, timings, walk.next_inputs(), capture=capture, death=frame % 15 == 0)
+    return timings
+
+
+def sparx_edges(display, fonts, frames, seed):
+    """2 Sparx on opposite corners of the board throwing sparks, and nothing else on screen"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed, sparx_count=2)
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for _ in range(frames):
+        play_frame(sim, display, renderer, timings)
+    return timings
+
+
+def board_4000(display, fonts, frames, seed):
+    """A 4000x4000 board with 400 captures, the camera scrolling after the player around the border"""
+    sim = QixSimulation(4000, 4000, seed=seed, sparx_count=4)
+    rng = random.Random(seed)
+    for _ in range(400):
+        sim.capture(random_polygon(rng, sim), [])
+    sim.state = STATE_PLAYING
+
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for frame in range(frames):
+        # Along the bottom of the board and up the right side
+        inputs = Inputs(right=True) if sim.xpos < sim.max_x else Inputs(up=True)
+        play_frame(sim, display, renderer, timings, inputs)
+    return timings
+
+
+def pause_idle(display, fonts, frames, seed):
+    """Sitting on the pause menu, moving the selection once a second.
+
+    Like the game, the menu is only drawn when the selection changes; the
+    game sleeps in between, which is left out here.
+    """
+    timings = FrameTimings()
+    shown = None
+    for frame in range(frames):
+        timings.start_frame()
+        pygame.event.pump()
+        for _ in pygame.event.get():
+            pass
+        timings.lap('events')
+        selection = frame // 60 % 3
+        if selection != shown:
+            draw_pause_menu(display.surface, fonts, selection)
+            timings.lap('render')
+            display.present()
+            timings.lap('flip')
+            shown = selection
+        timings.end_frame()
+    return timings
+
+
+def resize_1080p(display, fonts, frames, seed):
+    """Mid-round play with the window switching between 700x700 and 1920x1080"""
+    sim = QixSimulation(*BOARD_SIZE, seed=seed, sparx_count=4)
+    rng = random.Random(seed)
+    for _ in range(20):
+        sim.capture(random_polygon(rng, sim), [])
+    walk = RandomWalk(sim, seed)
+    start_interior_push(sim)
+    grow_path(sim, walk, 100)
+
+    original = display.window.get_size()
+    sizes = [(1920, 1080), BOARD_SIZE]
+    renderer = PlayRenderer(display.surface, fonts)
+    timings = FrameTimings()
+    for frame in range(frames):
+        if frame % 60 == 0:
+            # What the game does on VIDEORESIZE
+            display.resize(sizes[frame // 60 % 2])
+        play_frame(sim, display, renderer, timings, walk.next_inputs())
+    display.resize(original)
+    return timings
+
+
+SCENARIOS = {
+    'push_path_2000': push_path_2000,
+    'captures_200': captures_200,
+    'sparx_100': sparx_100,
+    'particles_4000': particles_4000,
+    'sparx_edges': sparx_edges,
+    'board_4000': board_4000,
+    'pause_idle': pause_idle,
+    'resize_1080p': resize_1080p,
+}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'video_driver': pygame.display.get_driver(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print frame time changes against a baseline run, returning the regressed scenarios"""
+    regressed = []
+    for name, result in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        for stat in ('p50', 'p99'):
+            before, after = old['frame_ms'][stat], result['frame_ms'][stat]
+            change = (after - before) / before if before else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressed.append(name)
+            print(f"{name:16} {stat}: {before:8.3f} ms -> {after:8.3f} ms ({change:+.1%}){flag}",
+                  file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600, help="frames per scenario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="run only this scenario (repeatable)")
+    parser.add_argument('--window', metavar='WxH', type=window_size, help="window size the 700x700 game is scaled into")
+    parser.add_argument('--output', metavar='PATH', help="write JSON results here instead of stdout")
+    parser.add_argument('--compare', metavar='PATH', help="baseline JSON to compare frame times against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="relative frame time increase counted as a regression")
+    args = parser.parse_args()
+
+    pygame.display.init()
+    pygame.font.init()
+    display = Display(BOARD_SIZE, args.window)
+    fonts = load_fonts()
+
+    results = {'environment': environment(), 'frames': args.frames, 'seed': args.seed, 'scenarios': {}}
+    for name in args.scenario or SCENARIOS:
+        timings = SCENARIOS[name](display, fonts, args.frames, args.seed)
+        summary = results['scenarios'][name] = timings.summary()
+        frame = summary['frame_ms']
+        print(f"{name:16} p50 {frame['p50']:8.3f} ms  p99 {frame['p99']:8.3f} ms", file=sys.stderr)
+    pygame.quit()
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
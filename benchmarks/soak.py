@@ -0,0 +1,373 @@
+"""Headless soak and fuzz test: many long games checked every tick.
+
+    python benchmarks/soak.py --games 1000000 --repro-dir repros --output soak.json
+    python benchmarks/soak.py --reproduce repros/player_outside_border-1-4711.qixr
+
+Games are spread over a process pool, one worker per core. Each one is
+derived from --seed and its index, with a random Sparx and Qix count and
+either a random or a capturing bot at the controls. After every tick the
+game is checked against the invariants in check_invariants().
+
+A game that breaks one is replayed with ever more of its inputs blanked
+out, keeping each change that still breaks the same invariant, and what
+is left is written to --repro-dir as a replay. `main.py --replay` shows
+it and --reproduce re-checks it. The summary also reports per-tick cost
+as games go on and how much memory each worker grew by, so slowdowns
+and leaks that only appear in long sessions show up too.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Not on Windows
+    resource = None
+
+import numpy as np
+
+from replay import ReplayReader, ReplayWriter, DECODED, encode_inputs
+from simulation import QixSimulation, Inputs, NO_INPUT, STATE_PLAYING
+
+BOTS = ['random', 'capture']
+DIRECTIONS = ['left', 'right', 'up', 'down']
+PERPENDICULAR = {'left': ['up', 'down'], 'right': ['up', 'down'], 'up': ['left', 'right'],
+                 'down': ['left', 'right']}
+
+BLOCK_TICKS = 500         # Per-tick cost is reported per block of this many ticks
+MAX_SHRINK_RUNS = 300     # Replays spent minimising one violation
+BATCH_GAMES = 50          # Games handed to a worker at a time
+
+# Repros each worker has written per invariant; a bug hit by every game
+# only needs a handful
+repros_written = {}
+
+
+def check_invariants(sim):
+    """Name and details of the first invariant the simulation breaks, or None"""
+    if sim.lives < 0:
+        return 'lives_negative', f"lives {sim.lives}"
+    if sim.lives == 0 and sim.state == STATE_PLAYING:
+        return 'dead_but_playing', "no lives left but the round goes on"
+    x, y = sim.xpos, sim.ypos
+    if not (math.isfinite(x) and math.isfinite(y)):
+        return 'player_nan', f"player at ({x}, {y})"
+    if not (sim.min_x <= x <= sim.max_x and sim.min_y <= y <= sim.max_y):
+        return 'player_outside_border', f"player at ({x}, {y})"
+    if not np.isfinite(sim.qix.pos).all():
+        return 'qix_nan', f"qix at {sim.qix.pos.tolist()}"
+    coverage = sim.territory_percentage()
+    if not 0 <= coverage <= 100:
+        return 'coverage_out_of_range', f"coverage {coverage}%"
+    if not sim.push_enabled and len(sim.player_path):
+        return 'path_without_push', f"{len(sim.player_path)} point path while not pushing"
+    return None
+
+
+def random_bot(sim, rng):
+    """Mash the keys: random directions held for a few ticks, SPACE now and then"""
+    while True:
+        held = Inputs(**{rng.choice(DIRECTIONS): True}) if rng.random() < 0.9 else NO_INPUT
+        for _ in range(rng.randint(1, 20)):
+            yield held._replace(space=rng.random() < 0.03)
+
+
+def capture_bot(sim, rng):
+    """Walk the border, then push out an L and close it, over and over"""
+    while True:
+        walk = Inputs(**{rng.choice(DIRECTIONS): True})
+        for _ in range(rng.randint(0, 40)):
+            yield walk
+        out = rng.choice(DIRECTIONS)
+        yield Inputs(space=True)
+        for _ in range(rng.randint(2, 60)):
+            yield Inputs(**{out: True})
+        across = rng.choice(PERPENDICULAR[out])
+        for _ in range(rng.randint(2, 60)):
+            yield Inputs(**{across: True})
+        yield Inputs(space=True)
+
+
+def soak_seed(text):
+    """Parse --seed, which becomes the top 32 bits of every game's 64-bit seed"""
+    seed = int(text)
+    if not 0 <= seed < 1 << 32:
+        raise argparse.ArgumentTypeError(f"{seed} is outside 0 to {(1 << 32) - 1}")
+    return seed
+
+
+def game_spec(seed, index):
+    """Everything that decides game `index` of a soak seeded with `seed`"""
+    game_seed = (seed << 32) + index
+    rng = random.Random(game_seed)
+    return {'index': index, 'seed': game_seed, 'sparx_count': rng.randint(1, 8),
+            'qix_count': rng.randint(1, 3), 'bot': rng.choice(BOTS)}
+
+
+def new_sim(spec):
+    return QixSimulation(seed=spec['seed'], sparx_count=spec['sparx_count'], qix_count=spec['qix_count'])
+
+
+def play_game(spec, max_ticks):
+    """Play one game to its end, returning its stats and the first violation"""
+    sim = new_sim(spec)
+    bot = (random_bot if spec['bot'] == 'random' else capture_bot)(sim, random.Random(spec['seed']))
+    inputs = bytearray()
+    blocks = []
+    longest_path = 0
+    violation = None
+    clock = time.perf_counter
+    started = block_start = clock()
+    step = sim.step
+    while sim.state == STATE_PLAYING and sim.tick < max_ticks:
+        tick_inputs = next(bot)
+        inputs.append(encode_inputs(tick_inputs))
+        step(tick_inputs)
+        violation = check_invariants(sim)
+        if violation:
+            break
+        if len(sim.player_path) > longest_path:
+            longest_path = len(sim.player_path)
+        if sim.tick % BLOCK_TICKS == 0:
+            now = clock()
+            blocks.append((now - block_start) / BLOCK_TICKS)
+            block_start = now
+    return {
+        'ticks': sim.tick,
+        'seconds': clock() - started,
+        'blocks': blocks,
+        'longest_path': longest_path,
+        'captures': len(sim.filled_areas),
+        'state': sim.state,
+        'violation': violation,
+        'inputs': inputs,
+    }
+
+
+def replay_inputs(spec, inputs):
+    """Run recorded input bytes, returning the first violation and its tick"""
+    sim = new_sim(spec)
+    for bits in inputs:
+        if sim.state != STATE_PLAYING:
+            break
+        sim.step(DECODED[bits])
+        violation = check_invariants(sim)
+        if violation:
+            return violation, sim.tick
+    return None, sim.tick
+
+
+def shrink(spec, inputs, name):
+    """Blank out as many inputs as possible while `name` is still broken.
+
+    Classic delta debugging on the input bytes: halves, then quarters and
+    so on are replaced with no input, and the inputs after the violation
+    are dropped each time it moves earlier.
+    """
+    inputs = bytearray(inputs)
+    runs = 0
+    chunk = len(inputs) // 2
+    while chunk >= 1 and runs < MAX_SHRINK_RUNS:
+        start = 0
+        while start < len(inputs) and runs < MAX_SHRINK_RUNS:
+            if any(inputs[start:start + chunk]):
+                candidate = inputs[:start] + bytes(len(inputs[start:start + chunk])) + inputs[start + chunk:]
+                violation, tick = replay_inputs(spec, candidate)
+                runs += 1
+                if violation and violation[0] == name:
+                    inputs = candidate[:tick]
+            start += chunk
+        chunk //= 2
+    return inputs
+
+
+def write_repro(directory, spec, inputs):
+    """Save a violating game as a replay, named after the invariant, soak seed and game"""
+    violation, tick = replay_inputs(spec, inputs)
+    path = os.path.join(directory, f"{violation[0]}-{spec['seed'] >> 32}-{spec['index']}.qixr")
+    sim = new_sim(spec)
+    writer = ReplayWriter(path)
+    writer.start_round(sim)
+    for bits in inputs[:tick]:
+        writer.record(DECODED[bits])
+        sim.step(DECODED[bits])
+    writer.end_round(sim)
+    writer.close()
+    return path
+
+
+def peak_memory_kb():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_batch(job):
+    """Worker: play games [start, stop) and return their combined results"""
+    seed, start, stop, max_ticks, repro_dir, max_repros = job
+    memory_before = peak_memory_kb()
+    ticks = seconds = captures = 0
+    block_totals, block_counts = [], []
+    longest_path = 0
+    slowest = (0.0, None)
+    violations = []
+    for index in range(start, stop):
+        spec = game_spec(seed, index)
+        result = play_game(spec, max_ticks)
+        ticks += result['ticks']
+        seconds += result['seconds']
+        captures += result['captures']
+        longest_path = max(longest_path, result['longest_path'])
+        for i, cost in enumerate(result['blocks']):
+            if i == len(block_totals):
+                block_totals.append(0.0)
+                block_counts.append(0)
+            block_totals[i] += cost
+            block_counts[i] += 1
+        if result['ticks'] and result['seconds'] / result['ticks'] > slowest[0]:
+            slowest = (result['seconds'] / result['ticks'], index)
+
+        if result['violation']:
+            name, detail = result['violation']
+            report = dict(spec, invariant=name, detail=detail, tick=result['ticks'])
+            if repro_dir and repros_written.get(name, 0) < max_repros:
+                repros_written[name] = repros_written.get(name, 0) + 1
+                inputs = shrink(spec, result['inputs'], name)
+                report['repro'] = write_repro(repro_dir, spec, inputs)
+                report['repro_ticks'] = len(inputs)
+                report['repro_inputs'] = sum(1 for bits in inputs if bits)
+            violations.append(report)
+
+    return {
+        'pid': os.getpid(),
+        'games': stop - start,
+        'ticks': ticks,
+        'seconds': seconds,
+        'captures': captures,
+        'block_totals': block_totals,
+        'block_counts': block_counts,
+        'longest_path': longest_path,
+        'slowest': slowest,
+        'memory_before_kb': memory_before,
+        'memory_after_kb': peak_memory_kb(),
+        'violations': violations,
+    }
+
+
+def soak(args):
+    jobs = [(args.seed, start, min(start + BATCH_GAMES, args.games), args.max_ticks, args.repro_dir,
+             args.max_repros)
+            for start in range(0, args.games, BATCH_GAMES)]
+    workers = args.workers or multiprocessing.cpu_count()
+
+    games = ticks = sim_seconds = captures = longest_path = 0
+    block_totals, block_counts = [], []
+    slowest = (0.0, None)
+    memory = {}  # pid: (peak when first seen, latest peak)
+    violations = []
+    started = last_report = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for batch in pool.imap_unordered(run_batch, jobs):
+            games += batch['games']
+            ticks += batch['ticks']
+            sim_seconds += batch['seconds']
+            captures += batch['captures']
+            longest_path = max(longest_path, batch['longest_path'])
+            slowest = max(slowest, batch['slowest'], key=lambda s: s[0])
+            for i, (total, count) in enumerate(zip(batch['block_totals'], batch['block_counts'])):
+                if i == len(block_totals):
+                    block_totals.append(0.0)
+                    block_counts.append(0)
+                block_totals[i] += total
+                block_counts[i] += count
+            first = memory.get(batch['pid'], (batch['memory_before_kb'],))[0]
+            memory[batch['pid']] = (first, batch['memory_after_kb'])
+            for report in batch['violations']:
+                violations.append(report)
+                print(f"game {report['index']}: {report['invariant']} at tick {report['tick']} "
+                      f"({report['detail']}) {report.get('repro', '')}", file=sys.stderr)
+
+            now = time.perf_counter()
+            if now - last_report >= args.report_every or games == args.games:
+                last_report = now
+                rate = games / (now - started)
+                print(f"{games}/{args.games} games, {rate:.0f} games/s, "
+                      f"eta {(args.games - games) / rate / 60:.1f} min, {len(violations)} violations",
+                      file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'settings': vars(args),
+        'workers': workers,
+        'games': games,
+        'ticks': ticks,
+        'captures': captures,
+        'elapsed_s': elapsed,
+        'games_per_s': games / elapsed,
+        'ticks_per_s': ticks / elapsed,
+        'mean_tick_us': sim_seconds / max(ticks, 1) * 1e6,
+        'tick_us_by_block': [round(total / count * 1e6, 2) for total, count in zip(block_totals, block_counts)],
+        'block_ticks': BLOCK_TICKS,
+        'slowest_game': {'index': slowest[1], 'tick_us': slowest[0] * 1e6},
+        'longest_path': longest_path,
+        'worker_memory_growth_kb': {str(pid): after - before for pid, (before, after) in memory.items()},
+        'violations': violations,
+    }
+
+
+def reproduce(path):
+    """Play the rounds of a repro replay, reporting each violation found"""
+    broken = 0
+    with ReplayReader(path) as reader:
+        for header, inputs in reader:
+            spec = {'seed': header.seed, 'sparx_count': header.sparx_count, 'qix_count': header.qix_count}
+            violation, tick = replay_inputs(spec, bytes(encode_inputs(i) for i in inputs))
+            if violation:
+                broken += 1
+                print(f"seed {header.seed}: {violation[0]} at tick {tick} ({violation[1]})")
+            else:
+                print(f"seed {header.seed}: no violation in {tick} ticks")
+    return 1 if broken else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=soak_seed, default=1)
+    parser.add_argument('--max-ticks', type=int, default=36000, help="longest game, in ticks (10 minutes)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--repro-dir', metavar='DIR', help="write a minimised replay of each violation here")
+    parser.add_argument('--max-repros', type=int, default=5,
+                        help="most repros each worker writes per invariant")
+    parser.add_argument('--report-every', type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument('--output', metavar='PATH', help="write JSON results here instead of stdout")
+    parser.add_argument('--reproduce', metavar='REPLAY', help="re-check a repro replay and exit")
+    args = parser.parse_args()
+
+    if args.reproduce:
+        return reproduce(args.reproduce)
+    if args.repro_dir:
+        os.makedirs(args.repro_dir, exist_ok=True)
+
+    results = soak(args)
+    print(f"{results['games']} games, {results['ticks']} ticks in {results['elapsed_s']:.1f} s "
+          f"({results['games_per_s']:.0f} games/s), {len(results['violations'])} violations", file=sys.stderr)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+    return 1 if results['violations'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Launch-to-first-frame time of the game, measured over fresh processes.
+
+    python benchmarks/startup.py --runs 20 --output startup.json
+
+Each run starts `main.py --measure-startup` under the dummy video driver,
+which quits as soon as the first frame is on screen. `launch_ms` also
+counts interpreter startup, from just before the process is spawned.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ['imports_ms', 'init_ms', 'first_frame_ms', 'total_ms', 'launch_ms']
+
+
+def launch(env):
+    spawned = time.time()
+    result = subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '--measure-startup'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    report = json.loads(next(line for line in result.stdout.splitlines() if line.startswith('{')))
+    report['launch_ms'] = (report.pop('first_frame_time') - spawned) * 1000
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', metavar='PATH', help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    # The first launch warms the OS file cache and is not counted
+    launch(env)
+    runs = [launch(env) for _ in range(args.runs)]
+
+    results = {}
+    for phase in PHASES:
+        times = np.array([run[phase] for run in runs])
+        results[phase] = {'p50': float(np.percentile(times, 50)), 'min': float(times.min()),
+                          'max': float(times.max())}
+        print(f"{phase:16} p50 {results[phase]['p50']:8.2f} ms  min {results[phase]['min']:8.2f} ms",
+              file=sys.stderr)
+
+    report = json.dumps({'runs': args.runs, 'startup': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
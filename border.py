@@ -0,0 +1,395 @@
+import heapq
+import math
+from bisect import bisect_left, bisect_right, insort
+
+from spatial import SegmentGrid
+
+# Distance either side of an edge at which the territory grid is sampled
+SIDE_OFFSET = 2.5
+
+# Edge orientations; a line is identified by its orientation and its fixed
+# coordinate (y for a row, x for a column)
+ROW, COLUMN = 0, 1
+
+# Turn preference at a corner, relative to the current heading: right, straight, left, back
+TURNS = [lambda dx, dy: (-dy, dx), lambda dx, dy: (dx, dy),
+         lambda dx, dy: (dy, -dx), lambda dx, dy: (-dx, -dy)]
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+def direction(start, end):
+    return sign(end[0] - start[0]), sign(end[1] - start[1])
+
+
+def on_line(axis, coord, t):
+    """Board point at position `t` along a line"""
+    return (t, coord) if axis == ROW else (coord, t)
+
+
+def nearest_on_segment(start, end, x, y):
+    """Closest point to (x, y) on an axis-aligned segment"""
+    (x0, y0), (x1, y1) = start, end
+    return (min(max(x, min(x0, x1)), max(x0, x1)), min(max(y, min(y0, y1)), max(y0, y1)))
+
+
+def merge_intervals(spans):
+    spans = sorted(spans)
+    merged = [list(spans[0])]
+    for a, b in spans[1:]:
+        if a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return [tuple(span) for span in merged]
+
+
+def ring_cells(cx, cy, ring):
+    """Grid cells at Chebyshev distance `ring` from (cx, cy)"""
+    if ring == 0:
+        yield cx, cy
+        return
+    for gx in range(cx - ring, cx + ring + 1):
+        yield gx, cy - ring
+        yield gx, cy + ring
+    for gy in range(cy - ring + 1, cy + ring):
+        yield cx - ring, gy
+        yield cx + ring, gy
+
+
+class BorderGraph:
+    """The edges that separate unclaimed territory from claimed territory
+    or the outside of the board.
+
+    Starts as the outer rectangle. Every captured polygon adds its
+    axis-aligned edges, and the edges near it are checked against the
+    territory grid again: a stretch of edge stays on the border only while
+    the board is unclaimed on at least one side of it. Edges claimed on
+    both sides along their whole length are dropped.
+
+    The border is a graph of straight edges meeting at corners, split
+    wherever another edge joins. A capture only rebuilds the rows and
+    columns that pass near it. Edges are filed in a SegmentGrid, so
+    on-border and nearest-point queries look at a few buckets instead of
+    every edge.
+    """
+
+    def __init__(self, left, top, right, bottom, territory, step, cell_size=32):
+        self.bounds = (left, top, right, bottom)
+        self.territory = territory
+        self.step = step
+        self.cell_size = cell_size
+        # Per orientation, keyed by line coordinate:
+        # source edges [(start, end, live stretches)] from the polygons claimed so far
+        self.sources = ({}, {})
+        # their live stretches merged into spans, and the sorted line coordinates
+        self.spans = ({}, {})
+        self.keys = ([], [])
+        # the edges each line is currently split into
+        self.line_edges = ({}, {})
+        self.neighbors = {}
+        self.grid = SegmentGrid(margin=0, cell_size=cell_size)
+        self.edge_count = 0
+
+        self.corners = [(left, top), (right, top), (right, bottom), (left, bottom)]
+        self.update(self.bounds, self.corners)
+
+    def copy(self, territory):
+        """An independent copy of the graph that reads `territory` from now on"""
+        graph = BorderGraph.__new__(BorderGraph)
+        graph.__dict__.update(self.__dict__)
+        graph.territory = territory
+        # Lists and dicts that update() changes in place are copied, the
+        # tuples and lists it only ever replaces are shared
+        graph.sources = tuple({coord: list(edges) for coord, edges in sources.items()}
+                              for sources in self.sources)
+        graph.spans = tuple(dict(spans) for spans in self.spans)
+        graph.keys = tuple(list(keys) for keys in self.keys)
+        graph.line_edges = tuple(dict(edges) for edges in self.line_edges)
+        graph.neighbors = {corner: dict(ways) for corner, ways in self.neighbors.items()}
+        graph.grid = self.grid.copy()
+        return graph
+
+    def claim(self, polygon):
+        """Update the border after `polygon` was claimed on the territory grid"""
+        xs, ys = polygon.coords[0::2], polygon.coords[1::2]
+        reach = SIDE_OFFSET + self.step
+        region = (min(xs) - reach, min(ys) - reach, max(xs) + reach, max(ys) + reach)
+        self.update(region, list(polygon))
+
+    def update(self, region, points):
+        """Recheck the source edges crossing `region`, then add the edges of a new polygon"""
+        left, top, right, bottom = region
+        # Range of line coordinates, then range along the line, for rows and columns
+        ranges = ((top, bottom, left, right), (left, right, top, bottom))
+        affected = (set(), set())
+        for axis in (ROW, COLUMN):
+            low, high, start, end = ranges[axis]
+            keys, sources = self.keys[axis], self.sources[axis]
+            for coord in keys[bisect_left(keys, low):bisect_right(keys, high)]:
+                kept = []
+                for s0, s1, stretches in sources[coord]:
+                    if s1 >= start and s0 <= end:
+                        stretches = self.live_stretches(axis, coord, s0, s1)
+                        affected[axis].add(coord)
+                    # Claims never give territory back, so a dead edge stays dead
+                    if stretches:
+                        kept.append((s0, s1, stretches))
+                sources[coord] = kept
+
+        n = len(points)
+        for i in range(n):
+            (x0, y0), (x1, y1) = points[i], points[(i + 1) % n]
+            if (x0 == x1) == (y0 == y1):
+                # Diagonal or empty; only axis-aligned edges can carry the border
+                continue
+            axis, coord = (ROW, y0) if y0 == y1 else (COLUMN, x0)
+            s0, s1 = (min(x0, x1), max(x0, x1)) if axis == ROW else (min(y0, y1), max(y0, y1))
+            if coord not in self.sources[axis]:
+                self.sources[axis][coord] = []
+                insort(self.keys[axis], coord)
+            self.sources[axis][coord].append((s0, s1, self.live_stretches(axis, coord, s0, s1)))
+            affected[axis].add(coord)
+
+        # Merge every changed line's stretches before splitting any of them
+        for axis in (ROW, COLUMN):
+            for coord in affected[axis]:
+                stretches = [span for _, _, spans in self.sources[axis][coord] for span in spans]
+                if stretches:
+                    self.spans[axis][coord] = merge_intervals(stretches)
+                else:
+                    self.spans[axis].pop(coord, None)
+                    del self.sources[axis][coord]
+                    keys = self.keys[axis]
+                    del keys[bisect_left(keys, coord)]
+        for axis in (ROW, COLUMN):
+            for coord in affected[axis]:
+                self.split_line(axis, coord)
+
+    def open_at(self, x, y):
+        """Whether a point is unclaimed board, strictly inside the outer border"""
+        left, top, right, bottom = self.bounds
+        return left < x < right and top < y < bottom and not self.territory.contains(x, y)
+
+    def live_stretches(self, axis, coord, start, end):
+        """Parts of an edge with unclaimed board on at least one side, as (start, end) pairs"""
+        step, open_at = self.step, self.open_at
+        before, after = coord - SIDE_OFFSET, coord + SIDE_OFFSET
+        stretches = []
+        run_start = None
+        for offset in range(start, end, step):
+            middle = (offset + min(offset + step, end)) / 2
+            if axis == ROW:
+                alive = open_at(middle, before) or open_at(middle, after)
+            else:
+                alive = open_at(before, middle) or open_at(after, middle)
+            if alive and run_start is None:
+                run_start = offset
+            elif not alive and run_start is not None:
+                stretches.append((run_start, offset))
+                run_start = None
+        if run_start is not None:
+            stretches.append((run_start, end))
+        return stretches
+
+    def split_line(self, axis, coord):
+        """Replace a line's edges, cutting its spans wherever a crossing line touches them"""
+        for edge in self.line_edges[axis].pop(coord, ()):
+            self.remove_edge(edge)
+
+        other = 1 - axis
+        other_keys, other_spans = self.keys[other], self.spans[other]
+        edges = []
+        for a, b in self.spans[axis].get(coord, ()):
+            cuts = {a, b}
+            for crossing in other_keys[bisect_left(other_keys, a):bisect_right(other_keys, b)]:
+                for c0, c1 in other_spans[crossing]:
+                    if c0 <= coord <= c1:
+                        cuts.add(crossing)
+                        break
+            cuts = sorted(cuts)
+            for t0, t1 in zip(cuts, cuts[1:]):
+                edge = (on_line(axis, coord, t0), on_line(axis, coord, t1))
+                self.add_edge(edge)
+                edges.append(edge)
+        if edges:
+            self.line_edges[axis][coord] = edges
+
+    def add_edge(self, edge):
+        a, b = edge
+        self.neighbors.setdefault(a, {})[direction(a, b)] = b
+        self.neighbors.setdefault(b, {})[direction(b, a)] = a
+        self.grid.add(edge, a, b)
+        self.edge_count += 1
+
+    def remove_edge(self, edge):
+        a, b = edge
+        for corner, way in ((a, direction(a, b)), (b, direction(b, a))):
+            options = self.neighbors[corner]
+            del options[way]
+            if not options:
+                del self.neighbors[corner]
+        self.grid.remove(edge, a, b)
+        self.edge_count -= 1
+
+    @property
+    def edges(self):
+        return [edge for lines in self.line_edges for edges in lines.values() for edge in edges]
+
+    def edges_at(self, x, y):
+        """The border edges passing through a point"""
+        found = []
+        for edge in self.grid.query(x, y):
+            (x0, y0), (x1, y1) = edge
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                found.append(edge)
+        return found
+
+    def on_border(self, x, y):
+        return bool(self.edges_at(x, y))
+
+    def along_border(self, start, end):
+        """Whether a straight move from `start` to `end` stays on one border edge"""
+        for a, b in self.edges_at(*end):
+            if nearest_on_segment(a, b, *start) == start:
+                return True
+        return False
+
+    def nearest_point(self, x, y):
+        """Closest point on the border to (x, y), or None when nothing is left of it"""
+        if not self.edge_count:
+            return None
+        cs, buckets = self.cell_size, self.grid.buckets
+        cx, cy = int(x // cs), int(y // cs)
+        # Every edge lies inside the outer border, so no ring past it can hold one
+        left, top, right, bottom = self.bounds
+        last_ring = max(cx - int(left // cs), int(right // cs) - cx, cy - int(top // cs), int(bottom // cs) - cy)
+        best, best_distance = None, math.inf
+        for ring in range(max(last_ring, 0) + 1):
+            for cell in ring_cells(cx, cy, ring):
+                for a, b in buckets.get(cell, ()):
+                    point = nearest_on_segment(a, b, x, y)
+                    distance = math.dist(point, (x, y))
+                    if distance < best_distance:
+                        best, best_distance = point, distance
+            # Anything in a further ring is at least this far away
+            if best_distance <= ring * cs:
+                break
+        return best
+
+    def next_corner(self, previous, corner):
+        """Corner to head for after reaching `corner` from `previous`.
+
+        Turns right where it can, so a Sparx follows the border with the
+        unclaimed side of it on its right.
+        """
+        options = self.neighbors.get(corner)
+        if not options:
+            return corner
+        dx, dy = direction(previous, corner)
+        if dx == dy == 0:
+            return next(iter(options.values()))
+        for turn in TURNS:
+            target = options.get(turn(dx, dy))
+            if target is not None:
+                return target
+        return corner
+
+    def right_is_open(self, start, end):
+        """Whether the board on the right of a move from `start` to `end` is unclaimed"""
+        dx, dy = direction(start, end)
+        mx, my = (start[0] + end[0]) / 2, (start[1] + end[1]) / 2
+        return self.open_at(mx - dy * SIDE_OFFSET, my + dx * SIDE_OFFSET)
+
+    def heading(self, x, y, dx, dy):
+        """Put a walker at (x, y) heading (dx, dy) back on the border.
+
+        Returns (point, origin, target): where it now stands, the corner it
+        came from and the corner it should head for next. Returns None if
+        there is no border left.
+        """
+        point = (x, y)
+        edges = self.edges_at(x, y)
+        if not edges:
+            point = self.nearest_point(x, y)
+            if point is None:
+                return None
+            edges = self.edges_at(*point)
+        # Prefer an edge running the way the walker already was
+        edges.sort(key=lambda edge: direction(*edge) not in ((dx, dy), (-dx, -dy)))
+        a, b = edges[0]
+        if point in (a, b):
+            if (dx, dy) == (0, 0):
+                dx, dy = direction(point, b if point == a else a)
+            # Stand on the corner and pick a way on from there
+            return point, (point[0] - dx, point[1] - dy), point
+        forward = direction(a, b) == (dx, dy)
+        if self.right_is_open(a, b) != self.right_is_open(b, a):
+            forward = self.right_is_open(a, b)
+        return (point, a, b) if forward else (point, b, a)
+
+    def route(self, start, end, avoid=None):
+        """Corners passed on the shortest walk along the border from `start` to `end`.
+
+        Both points must lie on the border. `avoid` is a step (from, to)
+        of another walk that this one may not take; when it leaves
+        `start`, the walk may not leave that way at all or come back
+        through `start`. Returns None when they are not connected.
+        """
+        if start == end:
+            return []
+        start_edges, end_edges = self.edges_at(*start), self.edges_at(*end)
+        if not start_edges or not end_edges:
+            return None
+        barred = direction(start, avoid[1]) if avoid is not None and avoid[0] == start else None
+        if barred != direction(start, end):
+            for a, b in start_edges:
+                if nearest_on_segment(a, b, *end) == end:
+                    # Same edge, straight there
+                    return []
+
+        # Last leg from the corners at either end of the goal's edge
+        finish = {}
+        for a, b in end_edges:
+            for corner in (a, b):
+                if avoid == (corner, end):
+                    continue
+                if barred is not None and nearest_on_segment(corner, end, *start) == start:
+                    # Would double back over the start
+                    continue
+                finish[corner] = math.dist(corner, end)
+
+        # Dijkstra over the corners; entries are (distance, order, corner, previous)
+        # with the goal itself entered as corner None
+        queue = []
+        order = 0
+        for a, b in start_edges:
+            for corner in (a, b):
+                if direction(start, corner) != barred:
+                    queue.append((math.dist(start, corner), order, corner, None))
+                    order += 1
+        heapq.heapify(queue)
+        came_from = {}
+        if barred is not None:
+            came_from[start] = None
+        while queue:
+            distance, _, corner, previous = heapq.heappop(queue)
+            if corner is None:
+                path = []
+                while previous is not None:
+                    path.append(previous)
+                    previous = came_from[previous]
+                return path[::-1]
+            if corner in came_from:
+                continue
+            came_from[corner] = previous
+            if corner in finish:
+                heapq.heappush(queue, (distance + finish[corner], order, None, corner))
+                order += 1
+            for neighbor in self.neighbors.get(corner, {}).values():
+                if neighbor not in came_from and avoid != (corner, neighbor):
+                    heapq.heappush(queue, (distance + math.dist(corner, neighbor), order, neighbor, corner))
+                    order += 1
+        return None
@@ -0,0 +1,133 @@
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import pygame
+
+from simulation import Inputs
+
+# Edge-triggered actions, each dispatched once to whichever state is active
+QUIT = 'quit'
+RESIZE = 'resize'
+EXPOSE = 'expose'
+MENU_UP = 'up'
+MENU_DOWN = 'down'
+CONFIRM = 'confirm'
+BACK = 'back'
+PUSH = 'push'
+PROFILER = 'profiler'
+
+KEY_ACTIONS = {
+    pygame.K_UP: MENU_UP,
+    pygame.K_DOWN: MENU_DOWN,
+    pygame.K_RETURN: CONFIRM,
+    pygame.K_ESCAPE: BACK,
+    pygame.K_SPACE: PUSH,
+    pygame.K_F3: PROFILER,
+}
+
+# `seen` is when the event was taken off the queue and `earliest` the
+# previous poll, so the event arrived somewhere between the two
+Action = namedtuple('Action', ['kind', 'seen', 'earliest', 'size'], defaults=[None])
+
+
+class InputPipeline:
+    """The one place window and keyboard events are read each frame.
+
+    poll() drains the event queue once, turns the events into timestamped
+    Actions and samples the held arrow keys. The caller dispatches each
+    Action to the active state, which consumes it. PUSH presses for the
+    simulation are buffered with queue_push() and handed out one per tick
+    by take_push(), so two presses in one frame are two toggles and a press
+    on a frame that runs no tick waits for the next one.
+
+    Screens with nothing moving on them call wait() instead of polling
+    every frame, which sleeps until an event arrives.
+
+    Every consumed action stays pending until presented() is called after
+    the frame is shown, which records its input-to-present latency. Events
+    carry no timestamps of their own, so the latency is known to lie
+    between `seen` and `earliest`; both ends are kept.
+    """
+
+    def __init__(self, history=600, clock=time.perf_counter):
+        self.clock = clock
+        self.last_poll = clock()
+        self.held = Inputs()
+        self.pushes = deque()
+        self.pending = deque()
+        self.latencies = deque(maxlen=history)
+        self.woken_by = None
+
+    def poll(self):
+        """Drain the event queue into a list of Actions and refresh the held keys"""
+        now, earliest = self.clock(), self.last_poll
+        self.last_poll = now
+        actions = []
+        events = pygame.event.get()
+        if self.woken_by is not None:
+            events.insert(0, self.woken_by)
+            self.woken_by = None
+        for event in events:
+            if event.type == pygame.QUIT:
+                actions.append(Action(QUIT, now, earliest))
+            elif event.type == pygame.VIDEORESIZE:
+                actions.append(Action(RESIZE, now, earliest, event.size))
+            elif event.type == pygame.VIDEOEXPOSE:
+                actions.append(Action(EXPOSE, now, earliest))
+            elif event.type == pygame.KEYDOWN and event.key in KEY_ACTIONS:
+                actions.append(Action(KEY_ACTIONS[event.key], now, earliest))
+        keys = pygame.key.get_pressed()
+        self.held = Inputs(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], keys[pygame.K_UP], keys[pygame.K_DOWN])
+        return actions
+
+    def wait(self, timeout):
+        """Block until an event arrives or `timeout` milliseconds pass.
+
+        The event is handed out by the next poll(). It arrived just before
+        this returns, so that poll's latency range starts here rather than
+        at the previous poll, however long ago that was.
+        """
+        event = pygame.event.wait(timeout)
+        if event.type != pygame.NOEVENT:
+            self.woken_by = event
+            self.last_poll = self.clock()
+
+    def consumed(self, action):
+        """Mark an action as acted on; its latency is taken at the next present"""
+        self.pending.append(action)
+
+    def queue_push(self, action):
+        self.pushes.append(action)
+
+    def take_push(self):
+        """Whether the coming simulation tick should toggle pushing"""
+        if not self.pushes:
+            return False
+        self.consumed(self.pushes.popleft())
+        return True
+
+    def clear_pushes(self):
+        self.pushes.clear()
+
+    def presented(self):
+        """Record the latency of every action consumed since the last present"""
+        pending = self.pending
+        if not pending:
+            return
+        now = self.clock()
+        # Popped one at a time, as take_push() may be adding to it from the simulation thread
+        while pending:
+            action = pending.popleft()
+            self.latencies.append((now - action.seen, now - action.earliest))
+
+    def latency_summary(self):
+        """p50/p99 input-to-present latency in milliseconds, as (low, high) bounds"""
+        if not self.latencies:
+            return None
+        times = np.array(self.latencies) * 1000
+        return {
+            'samples': len(times),
+            'p50': tuple(float(v) for v in np.percentile(times, 50, axis=0)),
+            'p99': tuple(float(v) for v in np.percentile(times, 99, axis=0)),
+        }
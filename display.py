@@ -0,0 +1,119 @@
+import numpy as np
+import pygame
+
+LETTERBOX_COLOR = (0, 0, 0)
+
+
+def fit_viewport(logical_size, window_size):
+    """Largest rect with the logical aspect ratio centred in the window"""
+    logical_w, logical_h = logical_size
+    window_w, window_h = window_size
+    scale = min(window_w / logical_w, window_h / logical_h)
+    width = max(1, round(logical_w * scale))
+    height = max(1, round(logical_h * scale))
+    return pygame.Rect((window_w - width) // 2, (window_h - height) // 2, width, height)
+
+
+def sample_map(logical, window):
+    """Logical pixel that pygame.transform.scale shows at each of `window` pixels"""
+    probe = pygame.Surface((logical, 1), 0, 32)
+    pygame.surfarray.pixels2d(probe)[:, 0] = np.arange(logical)
+    return pygame.surfarray.array2d(pygame.transform.scale(probe, (window, 1)))[:, 0].astype(np.intp)
+
+
+class Display:
+    """A resizable window showing a fixed size logical surface.
+
+    Everything is drawn into `surface`, which keeps the logical size no
+    matter how big the window is, so drawing costs the same on any display.
+    present() scales the changed parts into an aspect-correct viewport in
+    the window and leaves black bars around it. Call resize() on
+    VIDEORESIZE and similar events so the viewport follows the window.
+
+    With `scaled` set, pygame.SCALED hands the scaling and letterboxing to
+    SDL's renderer instead, which can do it on the GPU.
+    """
+
+    def __init__(self, logical_size, window_size=None, scaled=False, caption=None):
+        self.logical_size = logical_size
+        self.scaled = scaled
+        if caption:
+            pygame.display.set_caption(caption)
+        if scaled:
+            self.window = pygame.display.set_mode(logical_size, pygame.SCALED | pygame.RESIZABLE)
+            self.surface = self.window
+        else:
+            self.window = pygame.display.set_mode(window_size or logical_size, pygame.RESIZABLE)
+            self.surface = pygame.Surface(logical_size).convert()
+        self.viewport = None
+        self.columns = self.rows = None
+        self.full_present = True
+        self.resize()
+
+    def resize(self, size=None):
+        """Follow a new window size; the next present() repaints the whole window"""
+        if not self.scaled:
+            if size is not None and self.window.get_size() != tuple(size):
+                # Older SDL versions do not resize the display surface by themselves
+                self.window = pygame.display.set_mode(size, pygame.RESIZABLE)
+            self.window = pygame.display.get_surface()
+            self.viewport = fit_viewport(self.logical_size, self.window.get_size())
+            if self.viewport.size != self.logical_size:
+                self.columns = sample_map(self.logical_size[0], self.viewport.width)
+                self.rows = sample_map(self.logical_size[1], self.viewport.height)
+        self.full_present = True
+
+    def present(self, rects=None):
+        """Show the logical surface, or just `rects` of it, in the window"""
+        if self.scaled:
+            if rects is None or self.full_present:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+            self.full_present = False
+            return
+
+        surface, window, viewport = self.surface, self.window, self.viewport
+        if rects is None or self.full_present:
+            window.fill(LETTERBOX_COLOR)
+            if viewport.size == self.logical_size:
+                window.blit(surface, viewport)
+            else:
+                pygame.transform.scale(surface, viewport.size, window.subsurface(viewport))
+            pygame.display.flip()
+            self.full_present = False
+            return
+
+        if viewport.size == self.logical_size:
+            for rect in rects:
+                window.blit(surface, rect.move(viewport.topleft), rect)
+            pygame.display.update([rect.move(viewport.topleft) for rect in rects])
+            return
+
+        width, height = self.logical_size
+        if sum(rect.width * rect.height for rect in rects) * 2 >= width * height:
+            # Scaling everything in one go beats many large copies
+            pygame.transform.scale(surface, viewport.size, window.subsurface(viewport))
+            pygame.display.update(viewport)
+            return
+
+        # Copy the window pixels that sample each changed area, picking the
+        # same source pixels as the full scale above so no seams show
+        # (pixel arrays are indexed [x, y]; transposed, each row is contiguous)
+        columns, rows = self.columns, self.rows
+        source = pygame.surfarray.pixels2d(surface).T
+        target = pygame.surfarray.pixels2d(window).T
+        updated = []
+        for rect in rects:
+            x0, x1 = np.searchsorted(columns, (rect.left, rect.right))
+            y0, y1 = np.searchsorted(rows, (rect.top, rect.bottom))
+            if x1 <= x0 or y1 <= y0:
+                continue
+            x, y = viewport.x + x0, viewport.y + y0
+            area = source[rect.top:rect.bottom, rect.left:rect.right]
+            target[y:viewport.y + y1, x:viewport.x + x1] = \
+                area.take(columns[x0:x1] - rect.left, axis=1).take(rows[y0:y1] - rect.top, axis=0)
+            updated.append(pygame.Rect(x, y, x1 - x0, y1 - y0))
+        # The pixel arrays lock their surfaces until they are gone
+        del source, target
+        pygame.display.update(updated)
@@ -0,0 +1,236 @@
+import numpy as np
+import pygame
+
+from simulation import EVENT_CAPTURE, EVENT_DEATH
+
+# Particle kinds, each drawn with its own row of sprites
+SPARK, BURST, FILL = range(3)
+KIND_COLORS = [(255, 170, 0), (220, 20, 20), (40, 110, 200)]
+
+# Sprites per kind, from a fresh particle to one about to expire. Each
+# stage is smaller and closer to the background color, so particles fade
+# out without per-pixel alpha.
+SPRITE_STAGES = 4
+SPRITE_SIZE = 5
+
+MAX_PARTICLES = 4096
+GRAVITY = 0.04
+DRAG = 0.97
+
+SPARK_INTERVAL = 4  # Ticks between sparks from each Sparx
+SPARK_SPEED, SPARK_TICKS = 1.5, 16
+BURST_PARTICLES, BURST_SPEED, BURST_TICKS = 120, 4.0, 45
+FILL_SPACING, FILL_PARTICLES, FILL_SPEED, FILL_TICKS = 6, 400, 1.0, 40
+
+# draw() returns a dirty rect per PARTICLE_CELL square holding particles,
+# or one rect around them all once there are MAX_PARTICLE_RECTS squares
+PARTICLE_CELL = 64
+MAX_PARTICLE_RECTS = 48
+
+
+class ParticlePool:
+    """Up to `capacity` particles held in arrays allocated once.
+
+    Live particles fill the first `count` columns, oldest first. update()
+    moves and ages them all in one vectorized pass, then packs the
+    survivors down through scratch arrays, so nothing is allocated per
+    particle. When the pool is full, new particles replace the oldest.
+
+    `sprite` is each particle's first sprite index (kind * SPRITE_STAGES);
+    stages() adds how far through its life it is.
+    """
+
+    def __init__(self, capacity=MAX_PARTICLES, seed=None, gravity=GRAVITY, drag=DRAG):
+        self.capacity = capacity
+        self.gravity = gravity
+        self.drag = drag
+        self.rng = np.random.default_rng(seed)
+        self.pos = np.zeros((2, capacity))
+        self.vel = np.zeros((2, capacity))
+        self.age = np.zeros(capacity, dtype=np.int32)
+        self.life = np.ones(capacity, dtype=np.int32)
+        self.sprite = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        # Scratch space for update() and stages()
+        self.keep = np.zeros(capacity, dtype=bool)
+        self.packed = np.zeros((2, capacity))
+        self.packed_int = np.zeros(capacity, dtype=np.int32)
+        self.stage = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, x, y, count, speed, life, kind):
+        """Add `count` particles flying off at random angles and speeds up to `speed`.
+
+        `x` and `y` are one point or arrays of `count` points. Lifetimes are
+        spread between half and all of `life` ticks, so a burst thins out
+        rather than vanishing at once.
+        """
+        count = min(count, self.capacity)
+        if count <= 0:
+            return
+        if np.ndim(x):
+            x, y = x[:count], y[:count]
+        overflow = self.count + count - self.capacity
+        if overflow > 0:
+            self.drop_oldest(overflow)
+
+        start, end = self.count, self.count + count
+        rng = self.rng
+        angle = rng.uniform(0, 2 * np.pi, count)
+        velocity = rng.uniform(0.2, 1.0, count) * speed
+        self.pos[0, start:end] = x
+        self.pos[1, start:end] = y
+        np.multiply(np.cos(angle), velocity, out=self.vel[0, start:end])
+        np.multiply(np.sin(angle), velocity, out=self.vel[1, start:end])
+        self.age[start:end] = 0
+        self.life[start:end] = rng.integers(max(1, life // 2), life + 1, count)
+        self.sprite[start:end] = kind * SPRITE_STAGES
+        self.count = end
+
+    def drop_oldest(self, n):
+        n = min(n, self.count)
+        left = self.count - n
+        for array in (self.pos, self.vel):
+            array[:, :left] = array[:, n:self.count]
+        for array in (self.age, self.life, self.sprite):
+            array[:left] = array[n:self.count]
+        self.count = left
+
+    def update(self):
+        """Move and age every live particle by one tick, dropping the expired ones"""
+        n = self.count
+        if n == 0:
+            return
+        pos, vel = self.pos[:, :n], self.vel[:, :n]
+        pos += vel
+        vel *= self.drag
+        vel[1] += self.gravity
+        age = self.age[:n]
+        age += 1
+
+        keep = self.keep[:n]
+        np.less(age, self.life[:n], out=keep)
+        alive = int(np.count_nonzero(keep))
+        if alive == n:
+            return
+        packed, packed_int = self.packed[:, :alive], self.packed_int[:alive]
+        for array in (self.pos, self.vel):
+            np.compress(keep, array[:, :n], axis=1, out=packed)
+            array[:, :alive] = packed
+        for array in (self.age, self.life, self.sprite):
+            np.compress(keep, array[:n], out=packed_int)
+            array[:alive] = packed_int
+        self.count = alive
+
+    def stages(self):
+        """Sprite index of every live particle, in a scratch array valid until the next call"""
+        n = self.count
+        stage = self.stage[:n]
+        np.multiply(self.age[:n], SPRITE_STAGES, out=stage)
+        np.floor_divide(stage, self.life[:n], out=stage)
+        stage += self.sprite[:n]
+        return stage
+
+
+def build_sprites(background):
+    """Square sprites for every kind and stage, fading toward `background`"""
+    sprites = []
+    for color in KIND_COLORS:
+        for stage in range(SPRITE_STAGES):
+            fade = stage / SPRITE_STAGES
+            size = max(1, round(SPRITE_SIZE * (1 - fade / 2)))
+            sprite = pygame.Surface((size, size))
+            sprite.fill([round(c + (b - c) * fade) for c, b in zip(color, background)])
+            sprites.append(sprite)
+    return sprites
+
+
+class ParticleEffects:
+    """Capture fills, death bursts and Sparx sparks for the PLAY screen.
+
+    tick() runs once per simulation tick with the events it raised and
+    advances every particle; draw() blits them all with one Surface.blits
+    call from sprites rendered on first use, and returns rects around them
+    for the dirty rect list.
+    """
+
+    def __init__(self, capacity=MAX_PARTICLES, background=(255, 255, 255), seed=None):
+        self.pool = ParticlePool(capacity, seed)
+        self.background = background
+        self.sprites = None
+
+    def clear(self):
+        self.pool.clear()
+
+    def tick(self, tick, events, player_center, sparx):
+        """Start effects for a tick's events and advance every particle.
+
+        `player_center` is where the player was before the tick, which is
+        where a death happened; the simulation has already moved the
+        player back to the border by now. `sparx` holds the Sparx
+        positions after the tick, as a (2, n) array.
+        """
+        pool = self.pool
+        for event in events:
+            if event[0] == EVENT_CAPTURE:
+                self.capture_fill(event[1])
+            elif event[0] == EVENT_DEATH:
+                pool.emit(*player_center, BURST_PARTICLES, BURST_SPEED, BURST_TICKS, BURST)
+        if tick % SPARK_INTERVAL == 0 and sparx.shape[1]:
+            pool.emit(sparx[0], sparx[1], sparx.shape[1], SPARK_SPEED, SPARK_TICKS, SPARK)
+        pool.update()
+
+    def capture_fill(self, polygon):
+        """Particles spaced evenly around a newly claimed polygon's outline"""
+        points = np.array(polygon.coords, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 2:
+            return
+        points = np.vstack([points, points[:1]])
+        along = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+        count = min(FILL_PARTICLES, int(along[-1] // FILL_SPACING))
+        if count <= 0:
+            return
+        spots = np.linspace(0, along[-1], count, endpoint=False)
+        self.pool.emit(np.interp(spots, along, points[:, 0]), np.interp(spots, along, points[:, 1]),
+                       count, FILL_SPEED, FILL_TICKS, FILL)
+
+    def draw(self, surface, camera=(0, 0)):
+        """Blit every live particle, seen from `camera`, and return the rects around them.
+
+        Particles are grouped by the PARTICLE_CELL square they are drawn in,
+        with one rect around each group, so sparks at opposite edges do not
+        mark the whole field dirty. Past MAX_PARTICLE_RECTS groups a single
+        rect around them all is returned instead.
+        """
+        pool = self.pool; n = pool.count
+        if n == 0: return []
+        if self.sprites is None: self.sprites = build_sprites(self.background)
+        corners = pool.packed[:, :n]
+        np.subtract(pool.pos[:, :n], SPRITE_SIZE // 2, out=corners)
+        corners[0] -= camera[0]; corners[1] -= camera[1]
+        sprites = pool.stages().tolist()
+        surface.blits(zip(map(self.sprites.__getitem__, sprites), zip(*corners.tolist())), doreturn=False)
+
+        cells = (corners // PARTICLE_CELL).astype(np.int64)
+        cells -= cells.min(axis=1, keepdims=True)
+        keys = cells[1] * (int(cells[0].max()) + 1) + cells[0]
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        if len(starts) >= MAX_PARTICLE_RECTS:
+            lefts, tops = corners.min(axis=1, keepdims=True).tolist()
+            rights, bottoms = corners.max(axis=1, keepdims=True).tolist()
+        else:
+            starts = np.concatenate([[0], starts])
+            grouped = corners[:, order]
+            lefts, tops = np.minimum.reduceat(grouped, starts, axis=1).tolist()
+            rights, bottoms = np.maximum.reduceat(grouped, starts, axis=1).tolist()
+        bounds = surface.get_rect()
+        size = SPRITE_SIZE + 1
+        return [pygame.Rect(int(left), int(top), int(right-left)+size, int(bottom-top)+size).clip(bounds)
+                for left, top, right, bottom in zip(lefts, tops, rights, bottoms)]
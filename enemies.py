@@ -0,0 +1,535 @@
+import math
+
+import numpy as np
+
+from spatial import segment_hits_rect, point_in_quad
+
+# Up to this many enemies a plain loop over the coordinates beats the fixed
+# cost of NumPy calls, so smaller swarms are kept in lists of tuples
+SMALL_SWARM = 8
+
+
+def first_overlap(pos, center_x, center_y, reach_x, reach_y):
+    """Index of the first position within reach of the center on both axes, or -1.
+
+    `pos` is a (2, n) array, or the list of (x, y) tuples a small swarm keeps.
+    """
+    if isinstance(pos, list):
+        for i, (x, y) in enumerate(pos):
+            if abs(x - center_x) < reach_x and abs(y - center_y) < reach_y:
+                return i
+        return -1
+    hits = (np.abs(pos[0] - center_x) < reach_x) & (np.abs(pos[1] - center_y) < reach_y)
+    first = int(hits.argmax())
+    return first if hits[first] else -1
+
+
+def to_tuples(values):
+    """A (rows, n) array as the list of one tuple per column that a small swarm keeps"""
+    return list(zip(*values.tolist()))
+
+
+def to_array(columns, rows, dtype=np.float64):
+    """A list of one tuple per column as a (rows, n) array"""
+    return np.array(columns, dtype=dtype).reshape(len(columns), rows).T
+
+
+def column_of(values, i):
+    """Column `i` of either form as a tuple"""
+    return values[i] if isinstance(values, list) else tuple(values[:, i].tolist())
+
+
+def set_column(values, i, column):
+    if isinstance(values, list):
+        values[i] = tuple(column)
+    else:
+        values[:, i] = column
+
+
+class SparxSwarm:
+    """Every Sparx as NumPy arrays, stepped as one batch.
+
+    Positions and velocities are (2, n) arrays, row 0 holding x and row 1
+    holding y. Each Sparx walks the border from corner to corner, moving
+    `speed` along both axes toward its target corner each tick. A Sparx
+    standing on its target asks the border graph for the next corner and
+    rests for that tick.
+
+    Velocities only change when a Sparx reaches a corner or lines up with
+    it on one axis, so each Sparx records the tick at which that happens.
+    A normal tick is a single in-place addition, and steering only runs for
+    the Sparx that are due.
+
+    A swarm of up to SMALL_SWARM Sparx keeps `current`, `vel`, `origin`
+    and `target` as lists of one (x, y) tuple per Sparx and `steer_tick`
+    as a list instead, and steps them one Sparx at a time. `pos` is built
+    from the list when read.
+    """
+
+    def __init__(self, border, speed, radius):
+        self.border = border
+        self.speed = speed
+        self.radius = radius
+        self.small = True
+        self.current = []  # Each Sparx's position, see `pos`
+        self.vel = []
+        # Corner each Sparx last left and the one it is heading for
+        self.origin = []
+        self.target = []
+        self.steer_tick = []
+        self.ticks = 0
+        self.next_steer = 0
+
+    def __len__(self):
+        return len(self.current) if self.small else self.current.shape[1]
+
+    @property
+    def pos(self):
+        return to_array(self.current, 2, np.int32) if self.small else self.current
+
+    @property
+    def x(self):
+        return self.pos[0]
+
+    @property
+    def y(self):
+        return self.pos[1]
+
+    def positions(self):
+        """Every Sparx's position as an (x, y) tuple"""
+        return self.current if self.small else to_tuples(self.current)
+
+    @staticmethod
+    def state_arrays(pos, vel, origin, target, steer_tick):
+        """(pos, vel, origin, target, steer_tick) as arrays, given as arrays or as a small swarm's lists"""
+        if not isinstance(pos, list):
+            return pos, vel, origin, target, steer_tick
+        points = np.array([pos, vel, origin, target], dtype=np.int32)
+        pos, vel, origin, target = points.reshape(4, len(pos), 2).transpose(0, 2, 1)
+        return pos, vel, origin, target, np.array(steer_tick, dtype=np.int64)
+
+    def arrays(self):
+        return self.state_arrays(self.current, self.vel, self.origin, self.target, self.steer_tick)
+
+    def keep(self, pos, vel, origin, target, steer_tick, copy=False):
+        """Take over state given as by state_arrays(), or copies of it if `copy`.
+
+        A small swarm's lists of tuples are taken as they are, and arrays
+        are turned into lists if there are few enough Sparx.
+        """
+        if isinstance(pos, list):
+            self.small = True
+            if copy:
+                pos, vel, origin, target, steer_tick = pos[:], vel[:], origin[:], target[:], steer_tick[:]
+        else:
+            self.small = pos.shape[1] <= SMALL_SWARM
+            if self.small:
+                pos, vel, origin, target = to_tuples(pos), to_tuples(vel), to_tuples(origin), to_tuples(target)
+                steer_tick = steer_tick.tolist()
+            elif copy:
+                pos, vel, origin, target = pos.copy(), vel.copy(), origin.copy(), target.copy()
+                steer_tick = steer_tick.copy()
+        self.current, self.vel, self.origin, self.target, self.steer_tick = pos, vel, origin, target, steer_tick
+
+    def add(self, x, y, origin, target):
+        pos, vel, origins, targets, steer_tick = self.arrays()
+        self.keep(np.append(pos, [[x], [y]], axis=1).astype(np.int32),
+                  np.append(vel, [[0], [0]], axis=1).astype(np.int32),
+                  np.append(origins, np.array(origin, dtype=np.int32).reshape(2, 1), axis=1),
+                  np.append(targets, np.array(target, dtype=np.int32).reshape(2, 1), axis=1),
+                  np.append(steer_tick, self.ticks))
+        self.next_steer = self.ticks
+
+    def spread(self, corners, count):
+        """Place `count` Sparx evenly around a loop of corners, the first on corner 0"""
+        lengths = [abs(bx - ax) + abs(by - ay)
+                   for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1])]
+        total = sum(lengths)
+        for i in range(count):
+            # Distance along the loop, kept on the speed grid so corners are hit exactly
+            distance = (total * i // count) // self.speed * self.speed
+            corner = 0
+            while distance >= lengths[corner]:
+                distance -= lengths[corner]
+                corner += 1
+            (ax, ay), (bx, by) = corners[corner], corners[(corner + 1) % len(corners)]
+            x = ax + np.sign(bx - ax) * distance
+            y = ay + np.sign(by - ay) * distance
+            if distance == 0:
+                # Standing on a corner, as if just arrived from the previous one
+                self.add(x, y, corners[corner - 1], corners[corner])
+            else:
+                self.add(x, y, corners[corner], corners[(corner + 1) % len(corners)])
+
+    def snapshot(self):
+        """Copies of everything update() changes, for restore().
+
+        A small swarm's state stays in lists, see state_arrays().
+        """
+        state = self.current, self.vel, self.origin, self.target, self.steer_tick
+        if self.small:
+            return (*(values[:] for values in state), self.ticks, self.next_steer)
+        return (*(values.copy() for values in state), self.ticks, self.next_steer)
+
+    def restore(self, state):
+        pos, vel, origin, target, steer_tick, self.ticks, self.next_steer = state
+        self.keep(pos, vel, origin, target, steer_tick, copy=True)
+
+    def retarget(self):
+        """Put every Sparx back on the border after it changed shape"""
+        pos, vel, origin, target, steer_tick = self.arrays()
+        heading = np.sign(target - origin).T.tolist()
+        for i, (x, y) in enumerate(zip(*pos.tolist())):
+            placed = self.border.heading(x, y, *heading[i])
+            if placed is None:
+                continue
+            pos[:, i], origin[:, i], target[:, i] = placed
+        vel[:] = 0
+        # Make every Sparx steer again on its next update
+        steer_tick[:] = self.ticks
+        self.keep(pos, vel, origin, target, steer_tick)
+        self.next_steer = self.ticks
+
+    def steer(self, which):
+        """Pick targets and velocities for the Sparx selected by `which`"""
+        delta = self.target[:, which] - self.current[:, which]
+        arrived = ~delta.any(axis=0)
+        next_corner = self.border.next_corner
+        for i in which[arrived].tolist():
+            corner = tuple(self.target[:, i].tolist())
+            self.target[:, i] = next_corner(tuple(self.origin[:, i].tolist()), corner)
+            self.origin[:, i] = corner
+
+        self.vel[:, which] = np.sign(delta) * self.speed
+        # Ticks until an axis lines up with (or steps past) the target
+        steps = np.where(delta != 0, -(-np.abs(delta) // self.speed), np.iinfo(np.int32).max)
+        # Resting Sparx steer again next tick
+        self.steer_tick[which] = self.ticks + np.where(arrived, 1, steps.min(axis=0))
+        self.next_steer = int(self.steer_tick.min())
+
+    def steer_small(self):
+        """steer() for every Sparx that is due, one at a time while the swarm is small"""
+        ticks, speed, next_corner = self.ticks, self.speed, self.border.next_corner
+        current, vel, origin, target, steer_tick = self.current, self.vel, self.origin, self.target, self.steer_tick
+        for i, due in enumerate(steer_tick):
+            if due > ticks:
+                continue
+            (x, y), (target_x, target_y) = current[i], target[i]
+            dx, dy = target_x - x, target_y - y
+            vel[i] = (((dx > 0) - (dx < 0)) * speed, ((dy > 0) - (dy < 0)) * speed)
+            if dx == dy == 0:
+                target[i] = next_corner(origin[i], target[i])
+                origin[i] = (target_x, target_y)
+                steer_tick[i] = ticks + 1
+            else:
+                steer_tick[i] = ticks + min(-(-abs(d) // speed) for d in (dx, dy) if d)
+        self.next_steer = min(steer_tick)
+
+    def update(self):
+        """Walk every Sparx one step along the border"""
+        if len(self) == 0:
+            return
+        if self.small:
+            if self.ticks >= self.next_steer:
+                self.steer_small()
+            self.current = [(x + vx, y + vy) for (x, y), (vx, vy) in zip(self.current, self.vel)]
+        else:
+            if self.ticks >= self.next_steer:
+                self.steer(np.flatnonzero(self.steer_tick <= self.ticks))
+            self.current += self.vel
+        self.ticks += 1
+
+    def first_overlapping(self, x, y, width, height):
+        """Index of the first Sparx whose hit box overlaps the given rect, or -1"""
+        # Same test as pygame.Rect.colliderect, folded into one range check per axis
+        return first_overlap(self.current, int(x) + width / 2, int(y) + height / 2,
+                             self.radius + width / 2, self.radius + height / 2)
+
+    def within(self, left, top, right, bottom):
+        """Indices of the Sparx whose center lies inside the given bounds"""
+        inside = (self.pos >= [[left], [top]]) & (self.pos <= [[right], [bottom]])
+        return np.flatnonzero(inside.all(axis=0))
+
+
+class QixSwarm:
+    """Every Qix as a line with a trail behind it, moved as one batch.
+
+    Each Qix is a line between two ends, held in a (4, n) array with rows
+    x0, y0, x1, y1; `pos` is the middle of each line, in the (2, n) layout
+    of SparxSwarm. Both ends share a heading but spin and stretch apart a
+    little, and every so often a Qix picks a new heading, speed, spin and
+    length at random. An end that would leave the play field, or run into
+    territory that was open where it came from, bounces the whole Qix off
+    that axis.
+
+    The trail is the line as it was every `trail_spacing` ticks, kept in a
+    fixed ring buffer of `trail_length` slots, so the cost per tick does
+    not depend on how long the trail is. `prev` holds the ends before the
+    last move, for the swept collision tests.
+
+    A swarm of up to SMALL_SWARM Qix keeps `current`, `vel`, `prev` and
+    each trail slot as lists of one (x0, y0, x1, y1) tuple per Qix
+    instead, which are cheaper to step than arrays that size. `ends` and
+    `pos` are built from the lists when read.
+    """
+
+    def __init__(self, bounds, rng, speed, length, trail_length=8, trail_spacing=3,
+                 steer_ticks=(10, 40), spin=0.6):
+        self.bounds = bounds
+        self.rng = rng
+        self.speed = speed
+        self.length = length
+        self.trail_spacing = trail_spacing
+        self.steer_ticks = steer_ticks
+        self.spin = spin
+        self.small = True
+        self.current = []  # Each Qix's line, see `ends`
+        self.vel = []
+        self.prev = []
+        self.trail = [[] for _ in range(trail_length)]
+        self.head = 0  # Ring slot of the newest trail line
+        self.trail_extents = None  # Box around each trail, worked out when first needed
+        self.steer_tick = np.empty(0, dtype=np.int64)
+        self.ticks = 0
+        self.next_steer = 0
+
+    def __len__(self):
+        return len(self.current) if self.small else self.current.shape[1]
+
+    @property
+    def ends(self):
+        return to_array(self.current, 4) if self.small else self.current
+
+    @property
+    def pos(self):
+        ends = self.ends
+        return (ends[0:2] + ends[2:4]) * 0.5
+
+    @property
+    def x(self):
+        return self.pos[0]
+
+    @property
+    def y(self):
+        return self.pos[1]
+
+    @staticmethod
+    def state_arrays(ends, vel, prev, trail):
+        """(ends, vel, prev, trail) as arrays, given as arrays or as a small swarm's lists"""
+        if not isinstance(ends, list):
+            return ends, vel, prev, trail
+        count = len(ends)
+        lines = np.array([ends, vel, prev], dtype=np.float64)
+        ends, vel, prev = lines.reshape(3, count, 4).transpose(0, 2, 1)
+        trail = np.array(trail, dtype=np.float64).reshape(len(trail), count, 4).transpose(0, 2, 1)
+        return ends, vel, prev, trail
+
+    def arrays(self):
+        return self.state_arrays(self.current, self.vel, self.prev, self.trail)
+
+    def keep(self, ends, vel, prev, trail, copy=False):
+        """Take over state given as by state_arrays(), or copies of it if `copy`.
+
+        A small swarm's lists of tuples are taken as they are, and arrays
+        are turned into lists if there are few enough Qix. The trail slots
+        are replaced as the Qix moves, never changed, so only the list of
+        them is copied.
+        """
+        if isinstance(ends, list):
+            self.small = True
+            if copy:
+                ends, vel, prev, trail = ends[:], vel[:], prev[:], trail[:]
+        else:
+            self.small = ends.shape[1] <= SMALL_SWARM
+            if self.small:
+                ends, vel, prev = to_tuples(ends), to_tuples(vel), to_tuples(prev)
+                trail = [to_tuples(lines) for lines in trail]
+            elif copy:
+                ends, vel, prev, trail = ends.copy(), vel.copy(), prev.copy(), trail.copy()
+        self.current, self.vel, self.prev, self.trail = ends, vel, prev, trail
+        self.trail_extents = None
+
+    def add(self, x, y, dx, dy):
+        """Add a Qix centred on (x, y) heading along (dx, dy) at a random angle"""
+        angle = self.rng.uniform(0, math.pi)
+        half_x, half_y = math.cos(angle) * self.length / 2, math.sin(angle) * self.length / 2
+        line = np.array([[x - half_x], [y - half_y], [x + half_x], [y + half_y]])
+        ends, vel, prev, trail = self.arrays()
+        ends = np.append(ends, line, axis=1)
+        vel = np.append(vel, [[dx], [dy], [dx], [dy]], axis=1)
+        trail = np.append(trail, np.repeat(line[np.newaxis], len(trail), axis=0), axis=2)
+        self.keep(ends, vel, ends.copy(), trail)
+        self.steer_tick = np.append(self.steer_tick, self.ticks + self.rng.randint(*self.steer_ticks))
+        self.next_steer = int(self.steer_tick.min())
+
+    def move_onto(self, i, j):
+        """Put Qix `i` on Qix `j`'s line, move and trail, for a Qix shut in by a capture"""
+        ends, vel, prev, trail = self.arrays()
+        if not self.small:
+            ends, vel, prev, trail = ends.copy(), vel.copy(), prev.copy(), trail.copy()
+        for values in (ends, vel, prev):
+            values[:, i] = values[:, j]
+        trail[:, :, i] = trail[:, :, j]
+        self.keep(ends, vel, prev, trail)
+
+    def snapshot(self):
+        """Copies of everything update() changes, for restore().
+
+        A small swarm's state stays in lists, see state_arrays().
+        """
+        state = self.current, self.vel, self.prev, self.trail
+        if self.small:
+            state = [values[:] for values in state]
+        else:
+            state = [values.copy() for values in state]
+        return (*state, self.head, self.steer_tick.copy(), self.ticks, self.next_steer)
+
+    def restore(self, state):
+        ends, vel, prev, trail, self.head, steer_tick, self.ticks, self.next_steer = state
+        self.keep(ends, vel, prev, trail, copy=True)
+        self.steer_tick = steer_tick.copy()
+
+    def steer(self, which):
+        """Pick a new heading, speed, spin and stretch for the Qix selected by `which`"""
+        rng = self.rng
+        for i in which.tolist():
+            x0, y0, x1, y1 = column_of(self.current, i)
+            vx0, vy0, vx1, vy1 = column_of(self.vel, i)
+            heading = math.atan2(vy0 + vy1, vx0 + vx1) + rng.uniform(-1, 1)
+            speed = self.speed * rng.uniform(0.6, 1.4)
+            ticks = rng.randint(*self.steer_ticks)
+            spin = rng.uniform(-self.spin, self.spin)
+            # Grow or shrink toward a length near the usual one over the coming ticks
+            length = math.hypot(x1 - x0, y1 - y0) or 1.0
+            stretch = (self.length * rng.uniform(0.7, 1.3) - length) / (2 * ticks)
+            ux, uy = (x1 - x0) / length, (y1 - y0) / length
+            sx, sy = -uy * spin + ux * stretch, ux * spin + uy * stretch
+            cx, cy = math.cos(heading) * speed, math.sin(heading) * speed
+            set_column(self.vel, i, (cx - sx, cy - sy, cx + sx, cy + sy))
+            self.steer_tick[i] = self.ticks + ticks
+        self.next_steer = int(self.steer_tick.min())
+
+    def update(self, territory):
+        """Move every Qix, bouncing it off the border and claimed territory"""
+        if len(self) == 0:
+            return
+        self.ticks += 1
+        if self.ticks >= self.next_steer:
+            self.steer(np.flatnonzero(self.steer_tick <= self.ticks))
+        if self.small:
+            self.prev = self.current
+            self.current = [(x0 + vx0, y0 + vy0, x1 + vx1, y1 + vy1)
+                            for (x0, y0, x1, y1), (vx0, vy0, vx1, vy1) in zip(self.prev, self.vel)]
+        else:
+            np.copyto(self.prev, self.current)
+            self.current += self.vel
+        self.bounce(territory)
+        if self.ticks % self.trail_spacing == 0:
+            self.head = (self.head + 1) % len(self.trail)
+            self.trail[self.head] = self.current[:] if self.small else self.current
+            self.trail_extents = None
+
+    def bounce(self, territory):
+        """Put back every Qix with an end that was blocked and turn it around"""
+        left, top, right, bottom = self.bounds
+        contains = territory.contains
+        cells, cols, rows = territory.cells, territory.cols, territory.rows
+        grid_left, grid_top, cell_size = territory.left, territory.top, territory.cell_size
+
+        def blocked(x, y, from_x, from_y):
+            if not (left < x < right and top < y < bottom):
+                return True
+            return contains(x, y) and not contains(from_x, from_y)
+
+        moved = self.current if self.small else to_tuples(self.current)
+        before = None
+        for i, line in enumerate(moved):
+            flip_x = flip_y = False
+            for e in (0, 2):
+                x, y = line[e], line[e + 1]
+                if left < x < right and top < y < bottom:
+                    # contains() inlined for the common case of an end in open field
+                    col, row = int((x - grid_left) // cell_size), int((y - grid_top) // cell_size)
+                    if 0 <= col < cols and 0 <= row < rows and not cells[row * cols + col]:
+                        continue
+                if before is None:
+                    before = self.prev if self.small else to_tuples(self.prev)
+                from_x, from_y = before[i][e], before[i][e + 1]
+                if blocked(x, y, from_x, from_y):
+                    # Bounce off whichever axis the move was blocked along
+                    along_x, along_y = blocked(x, from_y, from_x, from_y), blocked(from_x, y, from_x, from_y)
+                    flip_x |= along_x or not along_y
+                    flip_y |= along_y or not along_x
+            if flip_x or flip_y:
+                set_column(self.current, i, before[i])
+                vx0, vy0, vx1, vy1 = column_of(self.vel, i)
+                if flip_x:
+                    vx0, vx1 = -vx0, -vx1
+                if flip_y:
+                    vy0, vy1 = -vy0, -vy1
+                set_column(self.vel, i, (vx0, vy0, vx1, vy1))
+
+    def lines(self, i):
+        """Every line of Qix `i` as (x0, y0, x1, y1), oldest trail line first and the current one last"""
+        size = len(self.trail)
+        order = [(self.head + 1 + k) % size for k in range(size)]
+        if self.small:
+            return [list(self.trail[k][i]) for k in order] + [list(self.current[i])]
+        return self.trail[order, :, i].tolist() + [self.current[:, i].tolist()]
+
+    def extents(self):
+        """(left, top, right, bottom) around each Qix's lines, trail and last move"""
+        if self.trail_extents is None:
+            if self.small:
+                self.trail_extents = []
+                for i in range(len(self)):
+                    lines = [lines[i] for lines in self.trail]
+                    xs = [line[e] for line in lines for e in (0, 2)]
+                    ys = [line[e] for line in lines for e in (1, 3)]
+                    self.trail_extents.append((min(xs), min(ys), max(xs), max(ys)))
+            else:
+                xs, ys = self.trail[:, 0::2], self.trail[:, 1::2]
+                self.trail_extents = list(zip(xs.min(axis=(0, 1)).tolist(), ys.min(axis=(0, 1)).tolist(),
+                                              xs.max(axis=(0, 1)).tolist(), ys.max(axis=(0, 1)).tolist()))
+        return [(min(left, sweep_left), min(top, sweep_top), max(right, sweep_right), max(bottom, sweep_bottom))
+                for (left, top, right, bottom), (sweep_left, sweep_top, sweep_right, sweep_bottom)
+                in zip(self.trail_extents, self.sweep_extents())]
+
+    def sweep_extents(self):
+        """(left, top, right, bottom) around the area each Qix's line crossed in its last move"""
+        if self.small:
+            current, prev = self.current, self.prev
+        else:
+            current, prev = to_tuples(self.current), to_tuples(self.prev)
+        return [(min(x0, x1, px0, px1), min(y0, y1, py0, py1), max(x0, x1, px0, px1), max(y0, y1, py0, py1))
+                for (x0, y0, x1, y1), (px0, py0, px1, py1) in zip(current, prev)]
+
+    def sweep_touches(self, i, left, top, right, bottom):
+        """Whether the area Qix `i`'s line crossed in its last move touches a box"""
+        ax0, ay0, bx0, by0 = column_of(self.prev, i)
+        ax1, ay1, bx1, by1 = column_of(self.current, i)
+        quad = ((ax0, ay0), (ax1, ay1), (bx1, by1), (bx0, by0))
+        for k in range(4):
+            (x0, y0), (x1, y1) = quad[k - 1], quad[k]
+            if segment_hits_rect(x0, y0, x1, y1, left, top, right, bottom):
+                return True
+        # A box small enough to fit inside the swept area without touching its edges
+        return point_in_quad(left, top, quad)
+
+    def touches(self, i, left, top, right, bottom, lines=None):
+        """Whether Qix `i`'s lines or last move touch a box, `lines` being lines(i) if already at hand"""
+        for line in lines or self.lines(i):
+            if segment_hits_rect(*line, left, top, right, bottom):
+                return True
+        return self.sweep_touches(i, left, top, right, bottom)
+
+    def first_touching(self, left, top, right, bottom):
+        """Index of the first Qix whose lines or last move touch a box, or -1"""
+        if len(self) == 0:
+            return -1
+        for i, (qix_left, qix_top, qix_right, qix_bottom) in enumerate(self.extents()):
+            if qix_right < left or qix_left > right or qix_bottom < top or qix_top > bottom:
+                continue
+            if self.touches(i, left, top, right, bottom):
+                return i
+        return -1
@@ -0,0 +1,325 @@
+"""Reinforcement learning environments around QixSimulation.
+
+QixEnv follows the Gymnasium conventions without depending on it:
+
+    env = QixEnv()
+    obs, info = env.reset(seed=1)
+    obs, reward, terminated, truncated, info = env.step(RIGHT)
+
+Actions are indices into ACTIONS. Observations are a dict of NumPy arrays:
+the claimed territory downsampled to `grid_scale` pixel cells, the player
+(x, y, pushing) and every Sparx and Qix position. The reward is the change
+in territory percentage since the previous step.
+
+VectorEnv steps N games in lockstep in this process; ParallelVectorEnv
+splits them over worker processes that write straight into shared memory.
+"""
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from simulation import QixSimulation, Inputs, NO_INPUT, STATE_PLAYING
+
+NOOP, LEFT, RIGHT, UP, DOWN, SPACE = range(6)
+ACTIONS = [
+    NO_INPUT,
+    Inputs(left=True),
+    Inputs(right=True),
+    Inputs(up=True),
+    Inputs(down=True),
+    Inputs(space=True),
+]
+
+
+def observation_spec(board_width=700, board_height=700, sparx_count=1, qix_count=1, grid_scale=10, **_):
+    """Shape and dtype of every observation array for these settings"""
+    probe = QixSimulation(board_width, board_height, seed=0, sparx_count=0, qix_count=0)
+    rows, cols = probe.territory.rows // grid_scale, probe.territory.cols // grid_scale
+    return {
+        'grid': ((rows, cols), np.uint8),
+        'player': ((3,), np.float32),
+        'sparx': ((sparx_count, 2), np.float32),
+        'qix': ((qix_count, 2), np.float32),
+    }
+
+
+class QixEnv:
+    """One game of Qix as an environment.
+
+    The observation arrays are owned by the environment and overwritten in
+    place by every reset() and step(); copy them to keep them. A vector env
+    passes `buffers` so the arrays live in its batch instead.
+
+    The grid holds how much of each cell is claimed, from 0 to 255. After
+    a capture only the cells under the new polygon's bounding box are
+    recomputed.
+    """
+
+    def __init__(self, board_width=700, board_height=700, sparx_count=1, qix_count=1,
+                 grid_scale=10, max_steps=10000, frame_skip=1, buffers=None):
+        self.board_width = board_width
+        self.board_height = board_height
+        self.sparx_count = sparx_count
+        self.qix_count = qix_count
+        self.grid_scale = grid_scale
+        self.max_steps = max_steps
+        self.frame_skip = frame_skip
+        self.action_count = len(ACTIONS)
+        self.spec = observation_spec(board_width, board_height, sparx_count, qix_count, grid_scale)
+        if buffers is None:
+            buffers = {key: np.zeros(shape, dtype) for key, (shape, dtype) in self.spec.items()}
+        self.obs = buffers
+        self.rng = random.Random()
+        self.sim = None
+        self.steps = 0
+        self.percentage = 0.0
+        self.grid_areas = 0
+
+    def reset(self, seed=None):
+        """Start a new game, seeded from `seed` or the environment's own generator"""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.sim = QixSimulation(self.board_width, self.board_height, seed=self.rng.randrange(1 << 63),
+                                 sparx_count=self.sparx_count, qix_count=self.qix_count)
+        self.steps = 0
+        self.percentage = 0.0
+        self.grid_areas = 0
+        self.obs['grid'].fill(0)
+        return self.observe(), self.info()
+
+    def step(self, action):
+        sim = self.sim
+        inputs = ACTIONS[action]
+        sim.step(inputs)
+        if self.frame_skip > 1:
+            # SPACE toggles, so only the first repeated tick presses it
+            held = inputs._replace(space=False)
+            for _ in range(self.frame_skip - 1):
+                if sim.state != STATE_PLAYING:
+                    break
+                sim.step(held)
+        self.steps += 1
+
+        percentage = sim.territory_percentage()
+        reward = percentage - self.percentage
+        self.percentage = percentage
+        terminated = sim.state != STATE_PLAYING
+        truncated = not terminated and self.steps >= self.max_steps
+        return self.observe(), reward, terminated, truncated, self.info()
+
+    def snapshot(self):
+        """The game and episode so far, for restore() to branch from"""
+        return self.sim.snapshot(), self.steps, self.percentage
+
+    def restore(self, state):
+        """Go back to a snapshot() of this environment, returning (obs, info)"""
+        snapshot, self.steps, self.percentage = state
+        self.sim.restore(snapshot)
+        # The claimed area may have shrunk, so the grid is rebuilt from scratch
+        self.obs['grid'].fill(0)
+        self.grid_areas = 0
+        return self.observe(), self.info()
+
+    def info(self):
+        return {'lives': self.sim.lives, 'territory': self.percentage, 'state': self.sim.state}
+
+    def observe(self):
+        sim, obs = self.sim, self.obs
+        if len(sim.filled_areas) != self.grid_areas:
+            self.update_grid()
+        player = obs['player']
+        player[0], player[1], player[2] = sim.xpos, sim.ypos, sim.push_enabled
+        obs['sparx'][:] = sim.sparx.pos.T
+        obs['qix'][:] = sim.qix.pos.T
+        return obs
+
+    def update_grid(self):
+        """Recompute the grid cells under the polygons captured since the last call"""
+        territory, scale, grid = self.sim.territory, self.grid_scale, self.obs['grid']
+        rows, cols = grid.shape
+        cells = np.frombuffer(territory.cells, dtype=np.uint8).reshape(territory.rows, territory.cols)
+        areas = self.sim.filled_areas
+        for area in areas[self.grid_areas:]:
+            xs, ys = area.coords[0::2], area.coords[1::2]
+            size = territory.cell_size * scale
+            col0 = max(0, int((min(xs) - territory.left) // size))
+            col1 = min(cols, int((max(xs) - territory.left) // size) + 1)
+            row0 = max(0, int((min(ys) - territory.top) // size))
+            row1 = min(rows, int((max(ys) - territory.top) // size) + 1)
+            if row1 <= row0 or col1 <= col0:
+                continue
+            # Average each scale x scale block of territory cells
+            blocks = cells[row0 * scale:row1 * scale, col0 * scale:col1 * scale]
+            blocks = blocks.reshape(row1 - row0, scale, col1 - col0, scale)
+            grid[row0:row1, col0:col1] = blocks.sum(axis=(1, 3)) * 255 // (scale * scale)
+        self.grid_areas = len(areas)
+
+
+def allocate_batch(num_envs, spec, make_array):
+    """Observation arrays with a leading env axis, plus the per-step result arrays"""
+    batch = {key: make_array((num_envs,) + shape, dtype) for key, (shape, dtype) in spec.items()}
+    batch['reward'] = make_array((num_envs,), np.float32)
+    batch['terminated'] = make_array((num_envs,), np.bool_)
+    batch['truncated'] = make_array((num_envs,), np.bool_)
+    batch['lives'] = make_array((num_envs,), np.int32)
+    batch['territory'] = make_array((num_envs,), np.float32)
+    batch['actions'] = make_array((num_envs,), np.int64)
+    return batch
+
+
+def run_slice(envs, batch, start, command, seeds=None):
+    """Reset or step envs[i] into row start + i of the batch, resetting finished games"""
+    actions = batch['actions']
+    reward, terminated, truncated = batch['reward'], batch['terminated'], batch['truncated']
+    lives, territory = batch['lives'], batch['territory']
+    for i, env in enumerate(envs, start):
+        if command == 'reset':
+            env.reset(None if seeds is None else seeds[i])
+            reward[i], terminated[i], truncated[i] = 0.0, False, False
+        else:
+            _, reward[i], terminated[i], truncated[i], _ = env.step(actions[i])
+            if terminated[i] or truncated[i]:
+                # Start the next game in place; the returned observation is its first
+                env.reset()
+        lives[i], territory[i] = env.sim.lives, env.percentage
+
+
+class VectorEnv:
+    """N independent games stepped in lockstep in this process.
+
+    reset() and step() return (obs, rewards, terminated, truncated, infos)
+    style batches whose arrays have the env index as their first axis.
+    Games that end are reset on the spot, so the observation returned for
+    them is the first one of their next game.
+    """
+
+    def __init__(self, num_envs, **env_kwargs):
+        self.num_envs = num_envs
+        self.spec = observation_spec(**env_kwargs)
+        self.batch = allocate_batch(num_envs, self.spec, np.zeros)
+        self.obs = {key: self.batch[key] for key in self.spec}
+        self.envs = [QixEnv(buffers={key: self.obs[key][i] for key in self.spec}, **env_kwargs)
+                     for i in range(num_envs)]
+
+    def seeds(self, seed):
+        return None if seed is None else [seed + i for i in range(self.num_envs)]
+
+    def infos(self):
+        return {'lives': self.batch['lives'], 'territory': self.batch['territory']}
+
+    def reset(self, seed=None):
+        run_slice(self.envs, self.batch, 0, 'reset', self.seeds(seed))
+        return self.obs, self.infos()
+
+    def step(self, actions):
+        self.batch['actions'][:] = actions
+        run_slice(self.envs, self.batch, 0, 'step')
+        batch = self.batch
+        return self.obs, batch['reward'], batch['terminated'], batch['truncated'], self.infos()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def worker_main(conn, shm_names, layout, start, stop, env_kwargs):
+    """Own envs start..stop of a ParallelVectorEnv, writing into its shared memory"""
+    blocks = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    batch = {key: np.ndarray(shape, dtype, buffer=block.buf)
+             for (key, shape, dtype), block in zip(layout, blocks)}
+    spec = observation_spec(**env_kwargs)
+    envs = [QixEnv(buffers={key: batch[key][i] for key in spec}, **env_kwargs)
+            for i in range(start, stop)]
+    try:
+        while True:
+            command, seeds = conn.recv()
+            if command == 'close':
+                break
+            run_slice(envs, batch, start, command, seeds)
+            conn.send(None)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    # The arrays point into the blocks and must go before they can close
+    del batch, envs
+    for block in blocks:
+        block.close()
+
+
+class ParallelVectorEnv(VectorEnv):
+    """VectorEnv whose games are split across worker processes.
+
+    Observations, actions and results live in shared memory, so a step only
+    sends a short command down each worker's pipe and waits for the reply.
+    """
+
+    def __init__(self, num_envs, workers=None, context=None, **env_kwargs):
+        self.num_envs = num_envs
+        self.spec = observation_spec(**env_kwargs)
+        workers = min(workers or multiprocessing.cpu_count(), num_envs)
+
+        self.blocks = []
+
+        def shared_array(shape, dtype):
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            array = np.ndarray(shape, dtype, buffer=block.buf)
+            array.fill(0)
+            return array
+
+        self.batch = allocate_batch(num_envs, self.spec, shared_array)
+        self.obs = {key: self.batch[key] for key in self.spec}
+        layout = [(key, array.shape, array.dtype) for key, array in self.batch.items()]
+        names = [block.name for block in self.blocks]
+
+        ctx = multiprocessing.get_context(context)
+        self.conns = []
+        self.processes = []
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+        for start, stop in zip(bounds, bounds[1:]):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=worker_main, daemon=True,
+                                  args=(child, names, layout, int(start), int(stop), env_kwargs))
+            process.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def command(self, command, seeds=None):
+        for conn in self.conns:
+            conn.send((command, seeds))
+        for conn in self.conns:
+            conn.recv()
+
+    def reset(self, seed=None):
+        self.command('reset', self.seeds(seed))
+        return self.obs, self.infos()
+
+    def step(self, actions):
+        self.batch['actions'][:] = actions
+        self.command('step')
+        batch = self.batch
+        return self.obs, batch['reward'], batch['terminated'], batch['truncated'], self.infos()
+
+    def close(self):
+        if not self.processes:
+            return
+        for conn in self.conns:
+            try:
+                conn.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+        self.obs = self.batch = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
@@ -1,16 +1,30 @@
-import pygame
-import random
+import argparse
+import json
+import os
+import sys
 import time
-import math
 
-pygame.init()
+# Taken before the pygame import below, for --measure-startup
+LAUNCHED = time.perf_counter()
+
+import pygame
+
+from controls import (InputPipeline, QUIT, RESIZE, EXPOSE, MENU_UP, MENU_DOWN, CONFIRM, BACK, PUSH,
+                      PROFILER)
+from display import Display
+from profiler import FrameProfiler
+from render import (PlayRenderer, ProfilerOverlay, text_cache, load_fonts, draw_main_menu,
+                    draw_instructions, draw_pause_menu, draw_end_screen)
+from replay import ReplayReader, ReplayWriter, run_headless
+from simthread import SimulationThread
+from simulation import QixSimulation, EVENT_LEVEL_PASSED, EVENT_GAME_OVER, MAX_BOARD_SIZE, MAX_SEED
+from telemetry import Telemetry, TelemetryWriter
+from timestep import FixedTimestep
+
+SCREEN_SIZE = (700, 700)
 
-# Screen setup
-screen_width, screen_height = 700, 700
-screen = pygame.display.set_mode((screen_width, screen_height), pygame.RESIZABLE)
-pygame.display.set_caption("Qix Game")
-running = True
-clock = pygame.time.Clock()
+# Longest a still screen sleeps waiting for input before going round the loop
+IDLE_TIMEOUT_MS = 500
 
 # Game States
 GAME_STATES = {
@@ -21,639 +35,409 @@ GAME_STATES = {
     'PAUSE': 4,
     'WIN_GAME': 5,  # New pause state
 }
-current_state = GAME_STATES['INSTRUCTIONS']
-
-# Menu selection
-menu_selection = 0
-pause_menu_selection = 0
-
-# Initialize game fonts
-pygame.font.init()
-title_font = pygame.font.Font(None, 64)
-font = pygame.font.Font(None, 36)
-small_font = pygame.font.Font(None, 28)
-
-# Game Variables (will be reset in reset_game)
-push_enabled = False
-width, height = 10, 10
-xpos, ypos = 0, 0
-speed = 5
-player_path = []
-filled_areas = []
-lives = 3
-invulnerable = False
-invulnerability_start_time = 0
-INVULNERABILITY_DURATION = 2
-sparx = []
-perimeter_path = []
-qix = {}
-total_area = 0
-covered_area = 0
-level_passed = False
-level_pass_time = 0
-LEVEL_PASS_DURATION = 2  # Duration to show level passed message
-
-def check_qix_collision():
-    """Check if player collides with Qix"""
-    global lives, current_state, invulnerable
-    
-    # Check if currently invulnerable
-    if invulnerable:
-        return False
-
-    # Create rects for player and Qix
-    player_rect = pygame.Rect(xpos, ypos, width, height)
-    qix_rect = pygame.Rect(qix['x'] - 14, qix['y'] - 14, 28, 28)
-    
-    # Check if player is pushing a line
-    if push_enabled and player_rect.colliderect(qix_rect):
-        lives -= 1
-        if lives <= 0:
-            current_state = GAME_STATES['END_GAME']
-        return True
-    
-    return False
-
-def check_sparx_collision():
-    """Check if player collides with Sparx or if Sparx touches the green line."""
-    global lives, invulnerable, push_enabled
-
-    if invulnerable:
-        if time.time() - invulnerability_start_time > INVULNERABILITY_DURATION:
-            invulnerable = False
-        return False
-
-    player_rect = pygame.Rect(xpos, ypos, width, height)
-    for s in sparx:
-        sparx_rect = pygame.Rect(s['x'] - 7, s['y'] - 7, 14, 14)
-        
-        if player_rect.colliderect(sparx_rect):
-            lives -= 1
-            if lives <= 0:
-                current_state = GAME_STATES['END_GAME']
-            reset_player_position()
-            return True
-
-        if push_enabled and len(player_path) > 1:
-            for i in range(len(player_path) - 1):
-                if line_intersects_circle(player_path[i], player_path[i + 1], (s['x'], s['y']), 7):
-                    lives -= 1
-                    if lives <= 0:
-                        current_state = GAME_STATES['END_GAME']
-                    reset_player_position()
-                    return True
-
-    return False
-
-def calculate_polygon_area(polygon):
-    """Calculate the area of a polygon using the shoelace formula"""
-    n = len(polygon)
-    area = 0.0
-    for i in range(n):
-        j = (i + 1) % n
-        area += polygon[i][0] * polygon[j][1]
-        area -= polygon[j][0] * polygon[i][1]
-    area = abs(area) / 2.0
-    return area
-
-def calculate_territory_percentage():
-    """Calculate the percentage of territory covered"""
-    global total_area, covered_area, level_passed, level_pass_time, current_state
-    
-    # Calculate total game area (excluding border)
-    if total_area == 0:
-        total_area = (screen_width - 100) * (screen_height - 90)
-    
-    # Sum up the areas of all filled polygons
-    covered_area = sum(calculate_polygon_area(area) for area in filled_areas)
-    
-    # Calculate percentage
-    percentage = (covered_area / total_area) * 100 if total_area > 0 else 0
-    
-    # Check for level completion
-    if percentage >= 20 and not level_passed:
-        level_passed = True
-        level_pass_time = time.time()
-        current_state = GAME_STATES['WIN_GAME']  # Transition to win state
-    
-    return percentage
-
-def line_intersects_circle(line_start, line_end, circle_center, circle_radius):
-    """
-    Check if a line segment intersects a circle
-    """
-    x1, y1 = line_start
-    x2, y2 = line_end
-    cx, cy = circle_center
-    
-    # Check if the line segment has zero length
-    if x1 == x2 and y1 == y2:
-        # If the point is within the circle radius, it's a collision
-        dist = math.sqrt((cx - x1)**2 + (cy - y1)**2)
-        return dist <= circle_radius + 1  # Add 1 for slight tolerance
-    
-    # Vector from line start to line end
-    line_vec_x = x2 - x1
-    line_vec_y = y2 - y1
-    
-    # Vector from line start to circle center
-    circle_vec_x = cx - x1
-    circle_vec_y = cy - y1
-    
-    # Calculate line length squared
-    line_length_sq = line_vec_x**2 + line_vec_y**2
-    
-    # Project circle vector onto line vector
-    t = max(0, min(1, (circle_vec_x * line_vec_x + circle_vec_y * line_vec_y) / line_length_sq))
-    
-    # Closest point on the line segment to the circle center
-    closest_x = x1 + t * line_vec_x
-    closest_y = y1 + t * line_vec_y
-    
-    # Distance between closest point and circle center
-    dist_x = cx - closest_x
-    dist_y = cy - closest_y
-    
-    # Check if distance is less than circle radius
-    return (dist_x**2 + dist_y**2) <= (circle_radius + 1)**2
-
-def reset_player_position():
-    """Reset player position to starting point"""
-    global xpos, ypos, push_enabled, player_path, invulnerable, invulnerability_start_time
-    xpos = screen_width / 2
-    ypos = screen_height - height - 50
-    push_enabled = False
-    player_path = []
-    invulnerable = True
-    invulnerability_start_time = time.time()
-
-def check_sparx_collision():
-    """Check if player collides with Sparx or if Sparx touches the green line."""
-    global lives, invulnerable, push_enabled
-
-    # Check if currently invulnerable
-    if invulnerable:
-        if time.time() - invulnerability_start_time > INVULNERABILITY_DURATION:
-            invulnerable = False
-        return False
-
-    player_rect = pygame.Rect(xpos, ypos, width, height)
-    for s in sparx:
-        sparx_rect = pygame.Rect(s['x'] - 7, s['y'] - 7, 14, 14)
-        
-        # Check if Sparx collides with the player
-        if player_rect.colliderect(sparx_rect):
-            lives -= 1
-            reset_player_position()
-            return True
-
-        # Check if Sparx touches the green line while pushing
-        if push_enabled and len(player_path) > 1:
-            for i in range(len(player_path) - 1):
-                if line_intersects_circle(player_path[i], player_path[i + 1], (s['x'], s['y']), 7):
-                    lives -= 1
-                    reset_player_position()
-                    return True
-
-    return False
-
-def check_sparx_line_collision():
-    """Check if Sparx touches the green push line and player is in contact"""
-    # Only check when push is enabled and there's a path
-    if not push_enabled or len(player_path) < 2:
-        return False
-    
-    # Check each Sparx against the entire player path
-    for s in sparx:
-        # Check if Sparx is touching the green line path
-        for i in range(len(player_path) - 1):
-            if line_intersects_circle(player_path[i], player_path[i+1], (s['x'], s['y']), 7):
-                return True
-    return False
-
-def draw_instructions():
-    """Draw game instructions screen"""
-    global menu_selection
-    screen.fill("black")  # Black background
-    
-    # If we're in the main menu
-    if current_state == GAME_STATES['INSTRUCTIONS']:
-        # MQIX Title
-        title = title_font.render("MQIX", True, (255, 255, 255))  # White text
-        screen.blit(title, (screen_width // 2 - title.get_width() // 2, 200))
-        
-        # Menu options
-        menu_options = [
-            ("Start", (255, 255, 255)),    # White
-            ("Instructions", (255, 255, 255)),  # Yellow
-            ("Exit", (255, 255, 255))      # White
-        ]
-        
-        for i, (option, color) in enumerate(menu_options):
-            # Change color of selected option
-            if i == menu_selection:
-                color = (255, 255, 0)  # Yellow for selected
-            
-            text = font.render(option, True, color)
-            text_rect = text.get_rect(center=(screen_width // 2, 300 + i * 50))
-            screen.blit(text, text_rect)
-    
-    # If we're in the instructions screen
-    elif current_state == GAME_STATES['INSTRUCTIONS_DETAIL']:
-        # Instructions Title
-        title = title_font.render("How to Play", True, (255, 255, 255))
-        screen.blit(title, (screen_width // 2 - title.get_width() // 2, 50))
-        
-        # Detailed instructions
-        instructions = [
-            "Objective: Cover at least 20% of the screen",
-            "1) Controls:",
-            "- Arrow Keys: Move around the border or when not pushing",
-            "- Spacebar: Start/Stop pushing to draw lines",
-            "- ESC: Pause Game",
-            "2) Gameplay:",
-            "- Move along the border to start pushing",
-            "- Create territories by drawing closed paths",
-            "- Avoid Sparx (orange circles) and Qix (purple circle)",
-            "- Don't get caught while pushing!",
-            "3) Enemies:",
-            "- Sparx: Patrol the border",
-            "- Qix: Moves freely inside the play area",
-            "4) Tips:",
-            "- Be strategic in your territory claims",
-            "- Watch out for enemy movements",
-            "Press ESC to Return to Menu"
-        ]
-        
-        for i, line in enumerate(instructions):
-            color = (255, 255, 255)  # White text
-            # Highlight section headers
-            if line.endswith(":"):
-                color = (255, 255, 0)  # Yellow for headers
-            
-            text = small_font.render(line, True, color)
-            screen.blit(text, (50, 150 + i * 30))
-
-def draw_pause_menu():
-    """Draw pause menu screen"""
-    global pause_menu_selection
-    screen.fill("black")  # Black background
-    
-    # Pause Title
-    pause_title = title_font.render("PAUSED", True, (255, 255, 255))
-    screen.blit(pause_title, (screen_width // 2 - pause_title.get_width() // 2, 200))
-    
-    # Pause menu options
-    pause_options = [
-        ("Resume", (255, 255, 255)),    # White
-        ("Main Menu", (255, 255, 255)), # White
-        ("Exit Game", (255, 255, 255))  # White
-    ]
-    
-    for i, (option, color) in enumerate(pause_options):
-        # Change color of selected option
-        if i == pause_menu_selection:
-            color = (255, 255, 0)  # Yellow for selected
-        
-        text = font.render(option, True, color)
-        text_rect = text.get_rect(center=(screen_width // 2, 300 + i * 50))
-        screen.blit(text, text_rect)
-
-def reset_game():
-    """Reset all game variables to initial state"""
-    global push_enabled, width, height, xpos, ypos, speed
-    global player_path, filled_areas, lives, invulnerable
-    global invulnerability_start_time, sparx, qix, current_state, perimeter_path
-    global total_area, covered_area, level_passed, level_pass_time
-    
-    push_enabled = False
-    width, height = 10, 10
-    xpos, ypos = screen_width / 2, screen_height - height - 50
-    speed = 5
-
-    player_path = []
-    filled_areas = []
-
-    # Area tracking
-    total_area = (screen_width - 100) * (screen_height - 90)
-    covered_area = 0
-
-    # Level pass tracking
-    level_passed = False
-    level_pass_time = 0
-
-    # Lives and Invulnerability
-    lives = 3
-    invulnerable = False
-    invulnerability_start_time = 0
-
-    # Sparx
-    sparx = [{'x': 50, 'y': 20, 'dx': 5, 'dy': 0, 'path_index': 0}]
-    perimeter_path = [(50, 20), (screen_width - 50, 20), (screen_width - 50, screen_height - 50), (50, screen_height - 50)]
-
-    # Qix
-    qix = {'x': screen_width / 2, 'y': screen_height / 2, 'dx': random.choice([-3, 3]), 'dy': random.choice([-3, 3])}
-    
-    current_state = GAME_STATES['PLAY']
-
-def draw_congrats_screen():
-    """Draw the congrats screen when the player wins"""
-    screen.fill("white")
-    
-    # Congrats Title
-    congrats_text = title_font.render("CONGRATULATIONS!", True, (0, 255, 0))
-    screen.blit(congrats_text, (screen_width // 2 - congrats_text.get_width() // 2, 200))
-    
-    # Percentage covered
-    percentage = calculate_territory_percentage()
-    covered_text = font.render(f"Territory Covered: {percentage:.2f}%", True, (0, 0, 0))
-    screen.blit(covered_text, (screen_width // 2 - covered_text.get_width() // 2, 250))
-    
-    # Instructions
-    restart_text = font.render("Press ENTER to Restart", True, (0, 0, 0))
-    quit_text = font.render("Press ESC to Return to Main Menu", True, (0, 0, 0))
-    screen.blit(restart_text, (screen_width // 2 - restart_text.get_width() // 2, 300))
-    screen.blit(quit_text, (screen_width // 2 - quit_text.get_width() // 2, 350))
-
-def draw_game_over():
-    """Draw game over screen"""
-    screen.fill("white")
-    
-    # Game Over Title
-    game_over_text = title_font.render("GAME OVER", True, (255, 0, 0))
-    screen.blit(game_over_text, (screen_width // 2 - game_over_text.get_width() // 2, 200))
-    
-    # Percentage covered
-    percentage = calculate_territory_percentage()
-    covered_text = font.render(f"Territory Covered: {percentage:.2f}%", True, (0, 0, 0))
-    screen.blit(covered_text, (screen_width // 2 - covered_text.get_width() // 2, 250))
-    
-    # Instructions
-    restart_text = font.render("Press ENTER to Restart", True, (0, 0, 0))
-    quit_text = font.render("Press ESC to Return to Main Menu", True, (0, 0, 0))
-    screen.blit(restart_text, (screen_width // 2 - restart_text.get_width() // 2, 300))
-    screen.blit(quit_text, (screen_width // 2 - quit_text.get_width() // 2, 350))
-
-# Main game loop
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        
-        if current_state == GAME_STATES['INSTRUCTIONS']:
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Qix Game")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate cap, 0 for uncapped (game speed is unaffected)")
+    parser.add_argument("--fast", action="store_true", help="run the game logic (or replay) as fast as possible")
+    parser.add_argument("--seed", type=seed_value, help=f"seed every round with this value, 0 to {MAX_SEED}")
+    parser.add_argument("--record", metavar="PATH", help="record every round played to a replay file")
+    parser.add_argument("--replay", metavar="PATH", help="play back the rounds in a replay file")
+    parser.add_argument("--headless", action="store_true", help="with --replay, check the replay without opening a window")
+    parser.add_argument("--profile", action="store_true", default=bool(os.environ.get("QIX_PROFILE")),
+                        help="start with the frame profiler on (F3 toggles it, or set QIX_PROFILE=1)")
+    parser.add_argument("--window", metavar="WxH", type=window_size,
+                        help="initial window size, e.g. 1920x1080 (the game is scaled to fit)")
+    parser.add_argument("--board", metavar="WxH", type=board_size,
+                        help=f"board size, e.g. 4000x4000, up to {MAX_BOARD_SIZE} a side (default the screen size); "
+                             "the view scrolls to follow you")
+    parser.add_argument("--telemetry", metavar="PATH", default=os.environ.get("QIX_TELEMETRY"),
+                        help="log captures, deaths, pauses and frame times to PATH (or set QIX_TELEMETRY)")
+    parser.add_argument("--sim-thread", action="store_true",
+                        help="run the game logic on its own thread, so drawing and ticks do not hold each other up")
+    parser.add_argument("--gpu-scale", action="store_true", help="let SDL scale the game to the window (pygame.SCALED)")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="print the time from launch to the first frame as JSON, then quit")
+    parser.add_argument("--profile-out", metavar="PATH", default=os.environ.get("QIX_PROFILE_OUT"),
+                        help="on exit, write profiled frames to PATH (.json or .csv)")
+    return parser
+
+
+def board_size(text):
+    """Parse --board WxH, rejecting sizes the simulation cannot hold"""
+    try:
+        width, height = (int(n) for n in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH, e.g. 4000x4000, not {text!r}")
+    if not 0 < width <= MAX_BOARD_SIZE or not 0 < height <= MAX_BOARD_SIZE:
+        raise argparse.ArgumentTypeError(f"{width}x{height} is outside 1x1 to {MAX_BOARD_SIZE}x{MAX_BOARD_SIZE}")
+    return width, height
+
+
+def window_size(text):
+    """Parse --window WxH"""
+    try:
+        width, height = (int(n) for n in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH, e.g. 1920x1080, not {text!r}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"{width}x{height} is not a window size")
+    return width, height
+
+
+def seed_value(text):
+    """Parse --seed, rejecting seeds a replay cannot store"""
+    try:
+        seed = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a whole number, not {text!r}")
+    if not 0 <= seed <= MAX_SEED:
+        raise argparse.ArgumentTypeError(f"{seed} is outside 0 to {MAX_SEED}")
+    return seed
+
+
+def state_after(events, state):
+    """The game state once a tick's events have been seen"""
+    for event in events:
+        if event[0] == EVENT_LEVEL_PASSED:
+            state = GAME_STATES['WIN_GAME']  # Transition to win state
+        elif event[0] == EVENT_GAME_OVER:
+            state = GAME_STATES['END_GAME']
+    return state
+
+
+def startup_report(launched, started, initialized, first_frame):
+    """Startup phases in milliseconds, plus the wall clock time the first frame was shown"""
+    return {
+        'imports_ms': (started - launched) * 1000,
+        'init_ms': (initialized - started) * 1000,
+        'first_frame_ms': (first_frame - initialized) * 1000,
+        'total_ms': (first_frame - launched) * 1000,
+        'first_frame_time': time.time() - (time.perf_counter() - first_frame),
+    }
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.replay and args.headless:
+        return run_headless(args.replay)
+
+    # Only the subsystems the game uses; audio and joysticks stay off
+    started = time.perf_counter()
+    pygame.display.init()
+    pygame.font.init()
+
+    # Screen setup: the game always draws at 700x700 and is scaled to the window
+    screen_width, screen_height = SCREEN_SIZE
+    board = args.board or SCREEN_SIZE
+    display = Display((screen_width, screen_height), args.window, scaled=args.gpu_scale, caption="Qix Game")
+    screen = display.surface
+    running = True
+    clock = pygame.time.Clock()
+    timestep = FixedTimestep(unthrottled=args.fast)
+
+    current_state = GAME_STATES['INSTRUCTIONS']
+
+    # Menu selection
+    menu_selection = 0
+    pause_menu_selection = 0
+
+    # Fonts load the first time each one is drawn with
+    fonts = load_fonts()
+
+    # PLAY screen renderer, keeps the territory layer between frames
+    play_renderer = PlayRenderer(screen, fonts)
+
+    # Events, held keys and input latency
+    controls = InputPipeline()
+
+    # Per-frame timing spans, shown over the game while enabled
+    profiler = FrameProfiler(enabled=args.profile)
+    profiler_overlay = ProfilerOverlay(profiler, fonts, latency=controls.latency_summary)
+
+    # Current round, created by reset_game()
+    sim = None
+    final_percentage = 0.0
+
+    # What the menu or end screen on the display shows, None when it must be redrawn
+    shown_view = None
+
+    # Replay recording and playback
+    recorder = ReplayWriter(args.record) if args.record else None
+    replay_rounds = iter(ReplayReader(args.replay)) if args.replay else None
+    replay_inputs = None
+
+    # Gameplay analytics, written by a background thread
+    telemetry = Telemetry(TelemetryWriter(args.telemetry)) if args.telemetry else None
+
+    def play_tick(sim):
+        """Run one simulation tick, returning its events, or None when a replay has run out"""
+        if replay_inputs is not None:
+            inputs = next(replay_inputs, None)
+            if inputs is None:
+                return None
+        else:
+            inputs = controls.held._replace(space=controls.take_push())
+        if recorder is not None:
+            recorder.record(inputs)
+        if sim.lap is not None:
+            sim.lap('input')
+        events = sim.step(inputs)
+        if telemetry is not None:
+            telemetry.record_events(sim, events)
+        return events
+
+    # With --sim-thread, ticks run on a thread of their own and the frame
+    # loop draws the latest one
+    sim_thread = SimulationThread(play_tick, unthrottled=args.fast) if args.sim_thread else None
+
+    def reset_game():
+        """Start a new round, or the next recorded one when playing back a replay"""
+        nonlocal sim, current_state, replay_inputs
+        if sim_thread is not None:
+            sim_thread.pause()
+        if replay_rounds is not None:
+            header, replay_inputs = next(replay_rounds, (None, None))
+            if header is None:
+                # Out of recorded rounds
+                current_state = GAME_STATES['INSTRUCTIONS']
+                return
+            sim = QixSimulation(header.board_width, header.board_height, seed=header.seed,
+                                sparx_count=header.sparx_count, qix_count=header.qix_count)
+        else:
+            sim = QixSimulation(*board, seed=args.seed)
+        # Phases of a tick are profiled when it runs in the frame loop
+        sim.lap = profiler.lap if sim_thread is None else None
+        if recorder is not None:
+            recorder.start_round(sim)
+        if telemetry is not None:
+            telemetry.start_round(sim)
+        controls.clear_pushes()
+        timestep.reset()
+        if sim_thread is not None:
+            sim_thread.start_round(sim)
+        current_state = GAME_STATES['PLAY']
+
+    initialized = time.perf_counter()
+    first_frame = None
+
+    # Main game loop
+    while running:
+        profiler.begin_frame()
+        for action in controls.poll():
+            kind = action.kind
+            if kind == QUIT:
+                running = False
+                continue
+            elif kind == RESIZE:
+                display.resize(action.size)
+                continue
+            elif kind == EXPOSE:
+                display.resize()
+                continue
+            elif kind == PROFILER:
+                profiler.toggle()
+                play_renderer.invalidate()
+                shown_view = None
+                controls.consumed(action)
+                continue
+
+            # Everything else goes to the state that is active when it comes up
+            state = current_state
+            if state == GAME_STATES['INSTRUCTIONS']:
+                if kind == MENU_UP:
                     menu_selection = (menu_selection - 1) % 3
-                elif event.key == pygame.K_DOWN:
+                elif kind == MENU_DOWN:
                     menu_selection = (menu_selection + 1) % 3
-                elif event.key == pygame.K_RETURN:
+                elif kind == CONFIRM:
                     if menu_selection == 0:  # Start
                         reset_game()
                     elif menu_selection == 1:  # Instructions
                         current_state = GAME_STATES['INSTRUCTIONS_DETAIL']
                     elif menu_selection == 2:  # Exit
                         running = False
-        
-        elif current_state == GAME_STATES['INSTRUCTIONS_DETAIL']:
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
+
+            elif state == GAME_STATES['INSTRUCTIONS_DETAIL']:
+                if kind == BACK:
                     current_state = GAME_STATES['INSTRUCTIONS']
-        
-        elif current_state == GAME_STATES['PAUSE']:
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
+
+            elif state == GAME_STATES['PAUSE']:
+                if kind == MENU_UP:
                     pause_menu_selection = (pause_menu_selection - 1) % 3
-                elif event.key == pygame.K_DOWN:
+                elif kind == MENU_DOWN:
                     pause_menu_selection = (pause_menu_selection + 1) % 3
-                elif event.key == pygame.K_RETURN:
+                elif kind == CONFIRM:
                     if pause_menu_selection == 0:  # Resume
                         current_state = GAME_STATES['PLAY']
+                        timestep.reset()
+                        if sim_thread is not None:
+                            sim_thread.resume()
+                        if telemetry is not None:
+                            telemetry.resume()
                     elif pause_menu_selection == 1:  # Main Menu
                         current_state = GAME_STATES['INSTRUCTIONS']
+                        # Close the abandoned round so its replay can still be checked
+                        if recorder is not None:
+                            recorder.end_round(sim)
+                        if telemetry is not None:
+                            telemetry.end_round(sim, 'quit')
                     elif pause_menu_selection == 2:  # Exit Game
                         running = False
-                elif event.key == pygame.K_ESCAPE:
+                elif kind == BACK:
                     current_state = GAME_STATES['PLAY']
-
-        elif current_state == GAME_STATES['WIN_GAME']:
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:  # Restart the game
+                    timestep.reset()
+                    if sim_thread is not None:
+                        sim_thread.resume()
+                    if telemetry is not None:
+                        telemetry.resume()
+
+            elif state == GAME_STATES['WIN_GAME'] or state == GAME_STATES['END_GAME']:
+                if kind == CONFIRM:  # Restart the game
                     reset_game()
-                elif event.key == pygame.K_ESCAPE:  # Return to the main menu
+                elif kind == BACK:  # Return to the main menu
                     current_state = GAME_STATES['INSTRUCTIONS']
                     menu_selection = 0  # Reset menu selection to the first item
-        
-        elif current_state == GAME_STATES['PLAY']:
-                # Check if lives are 0
-            if lives == 0:
-                current_state = GAME_STATES['END_GAME']
-                continue  # Skip the rest of the PLAY logic
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
+
+            elif state == GAME_STATES['PLAY']:
+                if kind == BACK:
                     # Pause the game when ESC is pressed
                     current_state = GAME_STATES['PAUSE']
                     pause_menu_selection = 0
-                
-                if event.key == pygame.K_SPACE:
-                    if push_enabled and len(player_path) >= 3:
-                        # Find the nearest point on the perimeter to the last point in the player_path
-                        last_point = player_path[-1]
-                        nearest_point = min(perimeter_path, key=lambda p: math.dist(p, last_point))
-                        
-                        # Close the polygon by connecting the last point to the nearest perimeter point
-                        closed_path = player_path + [nearest_point]
-                        
-                        # Add the closed polygon to the filled areas
-                        filled_areas.append(closed_path)
-                    
-                    # Toggle push_enabled
-                    push_enabled = not push_enabled
-                    
-                    # Reset the player_path if push is disabled
-                    if push_enabled:
-                        if (xpos == 50 or xpos == screen_width - width - 50 or
-                            ypos == 20 or ypos == screen_height - height - 50):
-                            player_path = [(xpos + width // 2, ypos + height // 2)]
-                    else:
-                        player_path = []
-                    
+                    if sim_thread is not None:
+                        sim_thread.pause()
+                    if telemetry is not None:
+                        telemetry.pause()
+                elif kind == PUSH and replay_inputs is None:
+                    # Applied by the next simulation tick, one press per tick
+                    controls.queue_push(action)
+                    continue
+            controls.consumed(action)
+
+        profiler.lap('events')
+
+        # State-based rendering
+        idle = False
+        if current_state == GAME_STATES['PLAY']:
+            shown_view = None
+            if sim_thread is None:
+                # Movement and game logic for player and enemies, run at the fixed tick rate
+                for _ in timestep.ticks():
+                    profiler.lap('input')
+                    play_renderer.capture(sim)
+                    events = play_tick(sim)
+                    if events is None:
+                        # Recording stopped mid-round
+                        current_state = GAME_STATES['INSTRUCTIONS']
+                        break
+                    play_renderer.tick_effects(sim, events)
+                    profiler.lap('effects')
+                    current_state = state_after(events, current_state)
+                    if current_state != GAME_STATES['PLAY']:
+                        break
+                profiler.lap('input')
+                drawn, alpha = sim, timestep.alpha
+            else:
+                # Catch up on the ticks the simulation thread ran since the last frame
+                for record in sim_thread.take_ticks():
+                    if record.events is None:
+                        current_state = GAME_STATES['INSTRUCTIONS']
+                        break
+                    play_renderer.effects.tick(record.tick, record.events, record.player_center, record.sparx)
+                    current_state = state_after(record.events, current_state)
+                    if current_state != GAME_STATES['PLAY']:
+                        break
+                profiler.lap('effects')
+                drawn, alpha = sim_thread.view()
+                play_renderer.previous = drawn.previous
+
+            if current_state == GAME_STATES['WIN_GAME'] or current_state == GAME_STATES['END_GAME']:
+                if sim_thread is not None:
+                    sim_thread.pause()
+                if recorder is not None:
+                    recorder.end_round(sim)
+                final_percentage = sim.territory_percentage()
+
+            if current_state == GAME_STATES['PLAY']:
+                dirty = play_renderer.draw(drawn, alpha, profiler_overlay if profiler.enabled else None)
+                profiler.lap('draw')
+                display.present(dirty)
+                controls.presented()
+                profiler.lap('present')
+
+        if current_state != GAME_STATES['PLAY']:
+            # Menus and end screens only change on input, so each is drawn
+            # once and left on the screen surface until what it shows changes
+            if current_state == GAME_STATES['INSTRUCTIONS']:
+                view = (current_state, menu_selection)
+            elif current_state == GAME_STATES['PAUSE']:
+                view = (current_state, pause_menu_selection)
+            else:
+                view = (current_state,)
+
+            if view != shown_view or profiler.enabled:
+                if current_state == GAME_STATES['INSTRUCTIONS']:
+                    draw_main_menu(screen, fonts, menu_selection)
+                elif current_state == GAME_STATES['INSTRUCTIONS_DETAIL']:
+                    draw_instructions(screen, fonts)
+                elif current_state == GAME_STATES['PAUSE']:
+                    draw_pause_menu(screen, fonts, pause_menu_selection)
+                elif current_state == GAME_STATES['WIN_GAME']:
+                    draw_end_screen(screen, fonts, "CONGRATULATIONS!", (0, 255, 0), final_percentage)
                 elif current_state == GAME_STATES['END_GAME']:
-                    if event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_RETURN:  # Restart the game
-                            reset_game()
-                        elif event.key == pygame.K_ESCAPE:  # Return to the main menu
-                            current_state = GAME_STATES['INSTRUCTIONS']
-                            menu_selection = 0  # Reset menu selection to the first item
-
-    # State-based rendering
-    if current_state == GAME_STATES['INSTRUCTIONS'] or current_state == GAME_STATES['INSTRUCTIONS_DETAIL']:
-        draw_instructions()
-    
-    elif current_state == GAME_STATES['PAUSE']:
-        draw_pause_menu()
-    
-    elif current_state == GAME_STATES['PLAY']:
-        # Check if lives are 0
-        if lives <= 0:
-            current_state = GAME_STATES['END_GAME']
-            continue  # Skip the rest of the PLAY logic
-
-        # Handle events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+                    draw_end_screen(screen, fonts, "GAME OVER", (255, 0, 0), final_percentage)
+                # The overlay's figures change by themselves, so it redraws every frame
+                if profiler.enabled:
+                    profiler_overlay.draw(screen)
+                shown_view = view
+                profiler.lap('draw')
+                play_renderer.invalidate()
+                display.present()
+                controls.presented()
+                profiler.lap('present')
+            else:
+                if display.full_present:
+                    # Resized or uncovered: show the kept frame again
+                    display.present()
+                # Input that changed nothing is shown by the frame already up
+                controls.presented()
+                idle = not display.full_present
+        if first_frame is None:
+            first_frame = time.perf_counter()
+            if args.measure_startup:
+                print(json.dumps(startup_report(LAUNCHED, started, initialized, first_frame)))
                 running = False
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    # Pause the game when ESC is pressed
-                    current_state = GAME_STATES['PAUSE']
-                    pause_menu_selection = 0
-
-                if event.key == pygame.K_SPACE:
-                    if push_enabled and len(player_path) >= 3:
-                        filled_areas.append(player_path[:])  # Save the path as a polygon
-                    push_enabled = not push_enabled
-                    if push_enabled:
-                        # Only start the path if the player is on the perimeter
-                        if (xpos == 50 or xpos == screen_width - width - 50 or
-                            ypos == 20 or ypos == screen_height - height - 50):
-                            player_path = [(xpos + width // 2, ypos + height // 2)]
-                    else:
-                        player_path = []  # Reset the path if not on perimeter
-            
-
-        screen.fill("white")
-        
-        # Draw claimed territories
-        for area in filled_areas:
-            pygame.draw.polygon(screen, (173, 216, 230), area)  # Light blue
-        
-        # Draw border
-        pygame.draw.rect(screen, "black", (50, 20, screen_width - 100, screen_height - 70), 10)
-        
-        # Draw current path
-        if push_enabled and len(player_path) > 1:
-            pygame.draw.lines(screen, "green", False, player_path, 3)
-        
-        # Draw player
-        player_color = "red"
-        if invulnerable:
-            # Blinking effect during invulnerability
-            if int(time.time() * 10) % 2 == 0:
-                player_color = "gray"
-        pygame.draw.rect(screen, player_color, (xpos, ypos, width, height))
-        
-        # Draw UI Panel
-        panel_width = 200
-        panel_height = 150  # Increased height to accommodate territory percentage
-        panel_x = screen_width - panel_width - 20
-        panel_y = 20
-        
-        # Create a semi-transparent background for the panel
-        panel_surface = pygame.Surface((panel_width, panel_height), pygame.SRCALPHA)
-        pygame.draw.rect(panel_surface, (200, 200, 200, 180), panel_surface.get_rect(), border_radius=10)
-        screen.blit(panel_surface, (panel_x, panel_y))
-        
-        # Draw lives
-        lives_text = font.render(f"Lives:", True, (0, 0, 0))
-        lives_value = title_font.render(str(lives), True, (255, 0, 0))
-        screen.blit(lives_text, (panel_x + 20, panel_y + 20))
-        screen.blit(lives_value, (panel_x + 120, panel_y + 20))
-        
-        # Draw territory percentage
-        percentage = calculate_territory_percentage()
-        territory_text = font.render("Territory:", True, (0, 0, 0))
-        territory_value = font.render(f"{percentage:.2f}%", True, (0, 128, 0))
-        screen.blit(territory_text, (panel_x + 20, panel_y + 70))
-        screen.blit(territory_value, (panel_x + 120, panel_y + 70))
-        
-        # Draw invulnerability timer if active
-        if invulnerable:
-            remaining_time = max(0, 2 - (time.time() - invulnerability_start_time))
-            vulnerable_text = font.render("Vulnerable in:", True, (0, 0, 0))
-            vulnerable_time = font.render(f"{remaining_time:.1f}s", True, (255, 0, 0))
-            screen.blit(vulnerable_text, (panel_x + 20, panel_y + 110))
-            screen.blit(vulnerable_time, (panel_x + 120, panel_y + 110))
-        
-        # Display Level Passed message
-        if level_passed and time.time() - level_pass_time < LEVEL_PASS_DURATION:
-            level_pass_text = title_font.render("Congrats! Level Passed!", True, (0, 255, 0))
-            text_width = level_pass_text.get_width()
-            screen.blit(level_pass_text, (screen_width // 2 - text_width // 2, screen_height // 2 - 50))
-        
-        # Movement and game logic for player and enemies
-        keys = pygame.key.get_pressed()
-        if push_enabled:
-            # Prevent diagonal movement by prioritizing one direction
-            if keys[pygame.K_LEFT] and not keys[pygame.K_UP] and not keys[pygame.K_DOWN]:
-                xpos -= speed
-                if xpos < 50:
-                    xpos = 50
-                player_path.append((xpos + width // 2, ypos + height // 2))  # Track path
-
-            elif keys[pygame.K_RIGHT] and not keys[pygame.K_UP] and not keys[pygame.K_DOWN]:
-                xpos += speed
-                if xpos > screen_width - width - 50:
-                    xpos = screen_width - width - 50
-                player_path.append((xpos + width // 2, ypos + height // 2))  # Track path
-
-            elif keys[pygame.K_UP] and not keys[pygame.K_LEFT] and not keys[pygame.K_RIGHT]:
-                ypos -= speed
-                if ypos < 20:
-                    ypos = 20
-                player_path.append((xpos + width // 2, ypos + height // 2))  # Track path
-
-            elif keys[pygame.K_DOWN] and not keys[pygame.K_LEFT] and not keys[pygame.K_RIGHT]:
-                ypos += speed
-                if ypos > screen_height - height - 50:
-                    ypos = screen_height - height - 50
-                player_path.append((xpos + width // 2, ypos + height // 2))  # Track path
+        if idle:
+            # Nothing on screen can change until an event arrives
+            controls.wait(IDLE_TIMEOUT_MS)
+            # Restart the clock so the wait is not counted as a frame
+            clock.tick()
         else:
-            if keys[pygame.K_LEFT] and ypos in [20, screen_height - height - 50]:
-                xpos = max(50, xpos - speed)
-            elif keys[pygame.K_RIGHT] and ypos in [20, screen_height - height - 50]:
-                xpos = min(screen_width - width - 50, xpos + speed)
-            elif keys[pygame.K_UP] and xpos in [50, screen_width - width - 50]:
-                ypos = max(20, ypos - speed)
-            elif keys[pygame.K_DOWN] and xpos in [50, screen_width - width - 50]:
-                ypos = min(screen_height - height - 50, ypos + speed)
-        
-        # Update Sparx
-        for s in sparx:
-            target_x, target_y = perimeter_path[s['path_index']]
-            if (s['x'], s['y']) == (target_x, target_y):
-                s['path_index'] = (s['path_index'] + 1) % len(perimeter_path)
-            
-            if s['x'] < target_x: s['x'] += 5
-            elif s['x'] > target_x: s['x'] -= 5
-            if s['y'] < target_y: s['y'] += 5
-            elif s['y'] > target_y: s['y'] -= 5
-            
-            pygame.draw.circle(screen, "orange", (s['x'], s['y']), 10)
-        
-        # Check Sparx collision
-        check_sparx_collision()
-        
-        # Check Qix collision
-        check_qix_collision()
-        
-        # Update Qix movement
-        qix['x'] += qix['dx']
-        qix['y'] += qix['dy']
-        if qix['x'] <= 50 or qix['x'] >= screen_width - 50:
-            qix['dx'] = -qix['dx']
-        if qix['y'] <= 20 or qix['y'] >= screen_height - 50:
-            qix['dy'] = -qix['dy']
-        pygame.draw.circle(screen, "purple", (int(qix['x']), int(qix['y'])), 14)
-
-    elif current_state == GAME_STATES['WIN_GAME']:
-        draw_congrats_screen()
-    
-    elif current_state == GAME_STATES['END_GAME']:
-        draw_game_over()
-    
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
+            frame_ms = clock.tick(args.fps)
+            if telemetry is not None:
+                telemetry.frame(frame_ms)
+        profiler.lap('wait')
+        profiler.end_frame()
+
+    if sim_thread is not None:
+        sim_thread.close()
+    if recorder is not None:
+        recorder.close()
+    if telemetry is not None:
+        telemetry.close()
+    if args.profile_out and profiler.frames:
+        profiler.dump(args.profile_out)
+        print(f"Profile of {len(profiler.frames)} frames written to {args.profile_out}")
+    if not args.measure_startup:
+        print(f"Text cache: {text_cache.stats()}")
+        latency = controls.latency_summary()
+        if latency is not None:
+            print("Input to present: p50 {:.1f}-{:.1f} ms, p99 {:.1f}-{:.1f} ms over {} inputs".format(
+                *latency['p50'], *latency['p99'], latency['samples']))
+    pygame.quit()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""Head-to-head Qix between two machines, with input delay and rollback.
+
+    python netplay.py --player 0 --local 0.0.0.0:7000 --remote 10.0.0.2:7001 --seed 42
+    python netplay.py --player 1 --local 0.0.0.0:7001 --remote 10.0.0.1:7000 --seed 42
+
+Both sides run the whole VersusSimulation and only send their own inputs.
+A local input applies `--delay` ticks after it is pressed, which hides
+that much of the round trip. The remote player's input for ticks it has
+not arrived for yet is predicted, and when it arrives and disagrees the
+game is restored to that tick and simulated again up to now. --loss,
+--latency and --jitter put a simulated bad network in front of the real
+socket; benchmarks/netplay_loopback.py runs two peers over loopback.
+"""
+import argparse
+import heapq
+import random
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pygame
+
+from controls import InputPipeline, QUIT, RESIZE, EXPOSE, BACK, PUSH
+from display import Display
+from main import SCREEN_SIZE, seed_value, window_size
+from render import VersusRenderer, load_fonts, draw_end_screen
+from replay import encode_inputs, DECODED
+from simulation import STATE_PLAYING
+from timestep import FixedTimestep
+from versus import VersusSimulation
+
+# Packet layout: PACKET, then `count` input bytes (see replay.encode_inputs)
+# for consecutive ticks starting at `first`. Every packet repeats all the
+# inputs the peer has not acknowledged yet, so a lost packet needs no resend.
+PACKET = struct.Struct('<4sIIIbIIB')  # magic, sender's tick, ticks of the receiver's inputs
+                                      # it holds, first, advantage, digest tick, digest, count
+MAGIC = b'QXN1'
+MAX_INPUTS_PER_PACKET = 255
+
+# Only the arrow keys are predicted to stay held; a SPACE press never is
+HELD_KEYS = 0x0F
+
+DIGEST_INTERVAL = 30  # Ticks between state digests compared with the peer
+SYNC_INTERVAL = 30    # Ticks between checks of whether this side runs ahead
+MAX_SYNC_WAIT = 4     # Most ticks waited at once to let the peer catch up
+
+
+def parse_address(text):
+    """Parse --local or --remote HOST:PORT into an IPv4 (host, port), the host defaulting to 127.0.0.1"""
+    host, _, port = text.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, e.g. 10.0.0.2:7001, not {text!r}")
+    if not 0 <= port <= 0xFFFF:
+        raise argparse.ArgumentTypeError(f"port {port} is outside 0 to 65535")
+    try:
+        # Look the host up once here rather than on every packet sent
+        return socket.getaddrinfo(host or '127.0.0.1', port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+    except socket.gaierror as error:
+        raise argparse.ArgumentTypeError(f"cannot resolve {host!r}: {error.strerror}")
+
+
+class UdpTransport:
+    """Non-blocking UDP socket talking to one peer"""
+
+    def __init__(self, local, remote=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(local)
+        self.socket.setblocking(False)
+        self.remote = remote
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.remote)
+        except OSError:
+            # Nobody listening yet, or the network is down; the next packet repeats this one
+            pass
+
+    def receive(self):
+        packets = []
+        while True:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return packets
+            except ConnectionError:
+                # An ICMP error from an earlier send to a peer that was not up
+                continue
+            if address == self.remote:
+                packets.append(data)
+
+    def close(self):
+        self.socket.close()
+
+
+class LossyTransport:
+    """Wraps a transport and drops, delays and reorders what is sent through it.
+
+    Every packet is lost with probability `loss`; the rest are held for
+    `latency` plus up to `jitter` seconds, so with jitter they can overtake
+    each other, as on a real network.
+    """
+
+    def __init__(self, transport, loss=0.0, latency=0.0, jitter=0.0, seed=None, clock=time.perf_counter):
+        self.transport = transport
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.queue = []
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def address(self):
+        return self.transport.address
+
+    def send(self, data):
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+        else:
+            due = self.clock() + self.latency + self.rng.uniform(0, self.jitter)
+            heapq.heappush(self.queue, (due, self.sent, data))
+        self.flush()
+
+    def flush(self):
+        now = self.clock()
+        while self.queue and self.queue[0][0] <= now:
+            self.transport.send(heapq.heappop(self.queue)[2])
+
+    def receive(self):
+        self.flush()
+        return self.transport.receive()
+
+    def close(self):
+        self.transport.close()
+
+
+class RollbackSession:
+    """Keeps a VersusSimulation in step with a remote peer.
+
+    Call poll() once per frame to take in the peer's packets, then for each
+    tick due ask ready() and, if it says so, advance() with the local
+    player's inputs. The simulation is always at the latest tick, run on
+    the remote inputs received so far and predictions for the rest.
+
+    A snapshot is kept for each of the last `max_rollback` ticks. A remote
+    input that contradicts its prediction restores the snapshot of that
+    tick and simulates forward again, all within the poll() that received
+    it. ready() holds the game back rather than predict further ahead than
+    the snapshots reach, and now and then waits a tick when this side runs
+    ahead of the peer, so neither side keeps rolling back.
+    """
+
+    def __init__(self, sim, local_player, transport, input_delay=2, max_rollback=8, history=600):
+        self.sim = sim
+        self.local_player = local_player
+        self.transport = transport
+        self.max_rollback = max_rollback
+
+        self.frame = 0                 # Ticks simulated so far
+        # One encoded input per tick; local inputs start `input_delay` ticks ahead
+        self.local_inputs = bytearray(input_delay)
+        self.remote_inputs = bytearray()
+        self.predicted = bytearray()   # Remote input each tick was simulated with
+        self.snapshots = [None] * (max_rollback + 1)
+        self.rollback_to = None
+
+        self.peer_frame = 0
+        self.peer_received = 0
+        self.peer_advantage = 0
+        self.sync_wait = 0
+
+        # Digests every DIGEST_INTERVAL ticks: those taken on predicted
+        # inputs, then those of fully confirmed ticks, ours and the peer's
+        self.tentative = {}
+        self.digests = {}
+        self.peer_digests = {}
+        self.last_digest = (0, 0)
+        self.desyncs = []
+
+        self.rollbacks = 0
+        self.stalls = 0
+        self.rollback_depths = deque(maxlen=history)
+        self.rollback_times = deque(maxlen=history)
+
+    @property
+    def confirmed(self):
+        """Ticks for which both players' inputs are known"""
+        return min(len(self.remote_inputs), self.frame)
+
+    @property
+    def finished(self):
+        """Whether the round is over on every tick both sides agree on"""
+        return self.sim.state != STATE_PLAYING and len(self.remote_inputs) >= self.frame
+
+    def ready(self):
+        """Whether the next tick may be simulated now"""
+        if self.sync_wait:
+            self.sync_wait -= 1
+        elif self.frame - len(self.remote_inputs) >= self.max_rollback:
+            # A misprediction further back would have no snapshot to go back to
+            pass
+        else:
+            return True
+        self.stalls += 1
+        self.send()
+        return False
+
+    def advance(self, inputs):
+        """Simulate the next tick, with `inputs` applied `input_delay` ticks from now"""
+        self.local_inputs.append(encode_inputs(inputs))
+        self.simulate(self.frame)
+        self.frame += 1
+        self.send()
+        if self.frame % SYNC_INTERVAL == 0:
+            # Both advantages are inflated by the same one-way trip, which cancels out
+            ahead = ((self.frame - self.peer_frame) - self.peer_advantage) // 2
+            self.sync_wait = max(0, min(ahead, MAX_SYNC_WAIT))
+
+    def simulate(self, frame):
+        sim = self.sim
+        self.snapshots[frame % len(self.snapshots)] = (frame, sim.snapshot())
+        if frame < len(self.remote_inputs):
+            remote = self.remote_inputs[frame]
+        else:
+            remote = self.remote_inputs[-1] & HELD_KEYS if self.remote_inputs else 0
+        if frame < len(self.predicted):
+            self.predicted[frame] = remote
+        else:
+            self.predicted.append(remote)
+
+        local = DECODED[self.local_inputs[frame]]
+        sim.step((local, DECODED[remote]) if self.local_player == 0 else (DECODED[remote], local))
+
+        done = frame + 1
+        if done % DIGEST_INTERVAL == 0:
+            self.tentative[done] = sim.digest()
+            self.confirm_digests()
+
+    def confirm_digests(self):
+        """Keep the digests of ticks that no longer depend on a prediction"""
+        for frame in sorted(self.tentative):
+            if frame > len(self.remote_inputs) or self.rollback_to is not None:
+                break
+            self.digests[frame] = self.tentative.pop(frame)
+            self.last_digest = (frame, self.digests[frame])
+            self.compare_digest(frame)
+
+    def compare_digest(self, frame):
+        if frame in self.digests and frame in self.peer_digests:
+            if self.digests.pop(frame) != self.peer_digests.pop(frame):
+                self.desyncs.append(frame)
+
+    def send(self):
+        last = len(self.local_inputs)
+        first = max(self.peer_received, last - MAX_INPUTS_PER_PACKET)
+        advantage = max(-128, min(127, self.frame - self.peer_frame))
+        digest_frame, digest = self.last_digest
+        self.transport.send(PACKET.pack(MAGIC, self.frame, len(self.remote_inputs), first, advantage,
+                                        digest_frame, digest, last - first) + self.local_inputs[first:last])
+
+    def poll(self):
+        """Take in the peer's packets and roll back over any input that was mispredicted"""
+        for data in self.transport.receive():
+            self.receive(data)
+        if self.rollback_to is not None:
+            self.roll_back()
+        self.confirm_digests()
+
+    def receive(self, data):
+        if len(data) < PACKET.size:
+            return
+        magic, frame, received, first, advantage, digest_frame, digest, count = PACKET.unpack_from(data)
+        if magic != MAGIC or len(data) != PACKET.size + count:
+            return
+        if frame >= self.peer_frame:
+            self.peer_frame, self.peer_advantage = frame, advantage
+        self.peer_received = max(self.peer_received, received)
+        if digest_frame:
+            self.peer_digests[digest_frame] = digest
+            self.compare_digest(digest_frame)
+
+        remote = self.remote_inputs
+        start = len(remote) - first
+        if start < 0:
+            # Inputs after a gap; a later packet repeats the missing ones
+            return
+        for tick, bits in enumerate(data[PACKET.size + start:], len(remote)):
+            remote.append(bits)
+            if tick < self.frame and self.predicted[tick] != bits and \
+                    (self.rollback_to is None or tick < self.rollback_to):
+                self.rollback_to = tick
+
+    def roll_back(self):
+        """Restore the first mispredicted tick and simulate forward to the present"""
+        started = time.perf_counter()
+        start, self.rollback_to = self.rollback_to, None
+        frame, snapshot = self.snapshots[start % len(self.snapshots)]
+        assert frame == start, "rolled back beyond the snapshots kept"
+        self.sim.restore(snapshot)
+        for tick in range(start, self.frame):
+            self.simulate(tick)
+        self.rollbacks += 1
+        self.rollback_depths.append(self.frame - start)
+        self.rollback_times.append(time.perf_counter() - started)
+
+    def stats(self):
+        """Rollback counts and re-simulation times in milliseconds"""
+        times = np.array(self.rollback_times or [0.0]) * 1000
+        return {
+            'ticks': self.frame,
+            'rollbacks': self.rollbacks,
+            'stalls': self.stalls,
+            'mean_depth': float(np.mean(self.rollback_depths)) if self.rollback_depths else 0.0,
+            'max_depth': max(self.rollback_depths, default=0),
+            'p99_resim_ms': float(np.percentile(times, 99)),
+            'max_resim_ms': float(times.max()),
+            'desyncs': len(self.desyncs),
+        }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--player', type=int, choices=[0, 1], required=True,
+                        help="0 starts at the bottom of the board, 1 at the top")
+    parser.add_argument('--local', metavar='HOST:PORT', type=parse_address, required=True,
+                        help="address to receive on")
+    parser.add_argument('--remote', metavar='HOST:PORT', type=parse_address, required=True,
+                        help="the other player's address")
+    parser.add_argument('--seed', type=seed_value, required=True, help="round seed, the same on both sides")
+    parser.add_argument('--delay', type=int, default=2, help="ticks of input delay")
+    parser.add_argument('--max-rollback', type=int, default=8, help="most ticks predicted ahead of the peer")
+    parser.add_argument('--loss', type=float, default=0.0, help="simulated fraction of packets lost")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated one-way latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="simulated extra random latency in seconds")
+    parser.add_argument('--window', metavar='WxH', type=window_size,
+                        help="initial window size (the game is scaled to fit)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    transport = UdpTransport(args.local, args.remote)
+    if args.loss or args.latency or args.jitter:
+        transport = LossyTransport(transport, args.loss, args.latency, args.jitter)
+    sim = VersusSimulation(*SCREEN_SIZE, seed=args.seed)
+    session = RollbackSession(sim, args.player, transport, args.delay, args.max_rollback)
+
+    pygame.display.init()
+    pygame.font.init()
+    display = Display(SCREEN_SIZE, args.window, caption=f"Qix Versus - Player {args.player + 1}")
+    fonts = load_fonts()
+    renderer = VersusRenderer(display.surface, fonts, args.player)
+    controls = InputPipeline()
+    timestep = FixedTimestep()
+    clock = pygame.time.Clock()
+
+    running = True
+    while running:
+        for action in controls.poll():
+            if action.kind in (QUIT, BACK):
+                running = False
+            elif action.kind == RESIZE:
+                display.resize(action.size)
+            elif action.kind == EXPOSE:
+                display.full_present = True
+            elif action.kind == PUSH and not session.finished:
+                controls.queue_push(action)
+            else:
+                controls.consumed(action)
+
+        session.poll()
+        for _ in timestep.ticks():
+            if not session.ready():
+                break
+            session.advance(controls.held._replace(space=controls.take_push()))
+
+        if session.finished:
+            if sim.winner is None:
+                title, color = "Draw", (255, 255, 255)
+            elif sim.winner == args.player:
+                title, color = "You Win!", (0, 255, 0)
+            else:
+                title, color = "You Lose", (255, 0, 0)
+            draw_end_screen(display.surface, fonts, title, color, sim.player_percentage(args.player),
+                            ["Press ESC to Quit"])
+            renderer.invalidate()
+            display.present()
+        else:
+            display.present(renderer.draw(sim))
+        controls.presented()
+        clock.tick(60)
+
+    transport.close()
+    pygame.quit()
+    print(session.stats(), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
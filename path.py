@@ -0,0 +1,79 @@
+from array import array
+
+
+class PointArray:
+    """Read-only sequence of (x, y) points packed into an int16 array.
+
+    pygame's draw functions and the territory fill accept it anywhere a
+    list of point tuples was used before.
+    """
+
+    __slots__ = ('coords',)
+
+    def __init__(self, coords=None):
+        self.coords = coords if coords is not None else array('h')
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.coords) // 2
+        return (self.coords[2 * i], self.coords[2 * i + 1])
+
+    def __iter__(self):
+        coords = self.coords
+        return zip(coords[0::2], coords[1::2])
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)})"
+
+
+class PlayerPath(PointArray):
+    """Push line that merges straight runs into a single segment.
+
+    Appending a point that continues the last segment in the same direction
+    moves the segment's end point instead of adding a vertex, and repeated
+    points are dropped. A straight push of any length stays two vertices.
+    `raw_length` still counts every point appended, as the capture rule
+    is based on how far the player pushed.
+    """
+
+    __slots__ = ('raw_length',)
+
+    def __init__(self, points=()):
+        super().__init__()
+        self.raw_length = 0
+        for x, y in points:
+            self.append(x, y)
+
+    def append(self, x, y):
+        """Add a point, returning False when it extended the last segment instead"""
+        coords = self.coords
+        x, y = int(x), int(y)
+        self.raw_length += 1
+        n = len(coords)
+        if n >= 2:
+            bx, by = coords[n - 2], coords[n - 1]
+            if x == bx and y == by:
+                return False
+            if n >= 4:
+                ax, ay = coords[n - 4], coords[n - 3]
+                dx0, dy0 = bx - ax, by - ay
+                dx1, dy1 = x - bx, y - by
+                if dx0 * dy1 == dy0 * dx1 and dx0 * dx1 + dy0 * dy1 > 0:
+                    coords[n - 2] = x
+                    coords[n - 1] = y
+                    return False
+        coords.append(x)
+        coords.append(y)
+        return True
+
+    def freeze(self, *closing_points):
+        """Copy the path into an immutable PointArray, optionally adding final points"""
+        if not closing_points:
+            return PointArray(array('h', self.coords))
+        closed = PlayerPath(self)
+        for point in closing_points:
+            closed.append(*point)
+        return PointArray(closed.coords)
@@ -0,0 +1,108 @@
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+# Frame time histogram buckets, in milliseconds; the last one catches everything slower
+HISTOGRAM_EDGES = list(range(0, 34, 2)) + [float('inf')]
+
+
+class FrameProfiler:
+    """Named timing spans for each frame of the main loop.
+
+    Call begin_frame() at the top of the loop, lap(name) after each phase
+    to charge the time since the previous lap to `name`, and end_frame()
+    at the bottom. While disabled, lap() returns after a single attribute
+    test, so the calls can stay in place permanently.
+
+    The last `history` frames are kept for the on-screen overlay and for
+    dump() to write out as CSV or JSON.
+    """
+
+    def __init__(self, enabled=False, history=3600, clock=time.perf_counter):
+        self.enabled = enabled
+        self.clock = clock
+        self.frames = deque(maxlen=history)
+        self.span_names = []
+        self.current = None
+        self.frame_start = 0.0
+        self.mark = 0.0
+        self.frame_number = 0
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = None
+
+    def begin_frame(self):
+        self.frame_number += 1
+        if not self.enabled:
+            return
+        self.frame_start = self.mark = self.clock()
+        self.current = {}
+
+    def lap(self, name):
+        """Charge the time since the last lap (or the frame start) to span `name`"""
+        current = self.current
+        if current is None:
+            return
+        now = self.clock()
+        current[name] = current.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    def end_frame(self):
+        current = self.current
+        if current is None:
+            return
+        for name in current:
+            if name not in self.span_names:
+                self.span_names.append(name)
+        self.frames.append((self.frame_number, self.clock() - self.frame_start, current))
+        self.current = None
+
+    def frame_times_ms(self):
+        return np.array([total for _, total, _ in self.frames]) * 1000
+
+    def histogram(self):
+        """Counts of recent frame times falling in each HISTOGRAM_EDGES bucket"""
+        counts, _ = np.histogram(self.frame_times_ms(), bins=HISTOGRAM_EDGES)
+        return counts
+
+    def summary(self):
+        """p50/p99 frame time and mean time per span over the kept frames, in milliseconds"""
+        if not self.frames:
+            return None
+        times = self.frame_times_ms()
+        spans = {}
+        for name in self.span_names:
+            total = sum(frame_spans.get(name, 0.0) for _, _, frame_spans in self.frames)
+            spans[name] = 1000 * total / len(self.frames)
+        return {
+            'frames': len(times),
+            'p50': float(np.percentile(times, 50)),
+            'p99': float(np.percentile(times, 99)),
+            'spans': spans,
+        }
+
+    def dump(self, path):
+        """Write the kept frames to `path`, as JSON if it ends in .json and CSV otherwise"""
+        names = self.span_names
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({
+                    'summary': self.summary(),
+                    'spans': names,
+                    'frames': [
+                        {'frame': number, 'total_ms': total * 1000,
+                         'spans_ms': {name: spans[name] * 1000 for name in spans}}
+                        for number, total, spans in self.frames
+                    ],
+                }, f, indent=1)
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'total_ms'] + [f'{name}_ms' for name in names])
+            for number, total, spans in self.frames:
+                writer.writerow([number, f'{total * 1000:.4f}'] +
+                                [f'{spans.get(name, 0.0) * 1000:.4f}' for name in names])
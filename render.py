@@ -0,0 +1,667 @@
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+from effects import ParticleEffects
+from profiler import HISTOGRAM_EDGES
+from simulation import LEVEL_PASS_TICKS, BORDER_LEFT, BORDER_TOP, BORDER_RIGHT, BORDER_BOTTOM
+
+TERRITORY_COLOR = (173, 216, 230)  # Light blue
+OUTSIDE_BOARD_COLOR = (0, 0, 0)
+QIX_TRAIL_COLOR = (190, 120, 220)
+PANEL_COLOR = (200, 200, 200, 180)
+OVERLAY_COLOR = (0, 0, 0, 200)
+
+FONT_SIZES = {'title': 64, 'regular': 36, 'small': 28}
+
+# Side of the squares the territory layer is cut into, in board pixels
+TILE_SIZE = 256
+BORDER_WIDTH = 10
+
+MAIN_MENU_OPTIONS = ["Start", "Instructions", "Exit"]
+PAUSE_MENU_OPTIONS = ["Resume", "Main Menu", "Exit Game"]
+
+INSTRUCTIONS = [
+    "Objective: Cover at least 20% of the screen",
+    "1) Controls:",
+    "- Arrow Keys: Move around the border or when not pushing",
+    "- Spacebar: Start/Stop pushing to draw lines",
+    "- ESC: Pause Game",
+    "2) Gameplay:",
+    "- Move along the border to start pushing",
+    "- Create territories by drawing closed paths",
+    "- Avoid Sparx (orange circles) and the Qix (purple lines)",
+    "- Don't get caught while pushing!",
+    "3) Enemies:",
+    "- Sparx: Patrol the border",
+    "- Qix: Wanders the open area and kills your line on touch",
+    "4) Tips:",
+    "- Be strategic in your territory claims",
+    "- Watch out for enemy movements",
+    "Press ESC to Return to Menu"
+]
+
+
+class TextCache:
+    """Rendered text surfaces keyed by (font, string, color), least recently used evicted first"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return (f"{self.hits} hits, {self.misses} misses ({self.hit_rate():.1%} hit rate), "
+                f"{len(self.surfaces)}/{self.max_entries} cached")
+
+
+# Shared by the PLAY renderer and the menu screens
+text_cache = TextCache()
+
+
+class Fonts:
+    """The game's fonts by role (title, regular, small), each loaded on first use"""
+
+    def __getattr__(self, name):
+        if name not in FONT_SIZES:
+            raise AttributeError(name)
+        font = pygame.font.Font(None, FONT_SIZES[name])
+        setattr(self, name, font)
+        return font
+
+
+def load_fonts():
+    return Fonts()
+
+
+def draw_menu(screen, fonts, title, options, selection):
+    """Title with a vertical list of options, the selected one in yellow"""
+    screen_width = screen.get_width()
+    screen.fill("black")
+
+    title = text_cache.render(fonts.title, title, (255, 255, 255))
+    screen.blit(title, (screen_width // 2 - title.get_width() // 2, 200))
+
+    for i, option in enumerate(options):
+        color = (255, 255, 0) if i == selection else (255, 255, 255)
+        text = text_cache.render(fonts.regular, option, color)
+        screen.blit(text, text.get_rect(center=(screen_width // 2, 300 + i * 50)))
+
+
+def draw_main_menu(screen, fonts, selection):
+    draw_menu(screen, fonts, "MQIX", MAIN_MENU_OPTIONS, selection)
+
+
+def draw_pause_menu(screen, fonts, selection):
+    draw_menu(screen, fonts, "PAUSED", PAUSE_MENU_OPTIONS, selection)
+
+
+def draw_instructions(screen, fonts):
+    """Draw the how to play screen"""
+    screen.fill("black")
+    title = text_cache.render(fonts.title, "How to Play", (255, 255, 255))
+    screen.blit(title, (screen.get_width() // 2 - title.get_width() // 2, 50))
+
+    for i, line in enumerate(INSTRUCTIONS):
+        # Highlight section headers
+        color = (255, 255, 0) if line.endswith(":") else (255, 255, 255)
+        text = text_cache.render(fonts.small, line, color)
+        screen.blit(text, (50, 150 + i * 30))
+
+
+END_SCREEN_HINTS = ["Press ENTER to Restart", "Press ESC to Return to Main Menu"]
+
+
+def draw_end_screen(screen, fonts, title, title_color, percentage, hints=END_SCREEN_HINTS):
+    """Draw the win or game over screen with the territory covered"""
+    screen_width = screen.get_width()
+    screen.fill("white")
+
+    lines = [
+        (fonts.title, title, title_color),
+        (fonts.regular, f"Territory Covered: {percentage:.2f}%", (0, 0, 0)),
+    ] + [(fonts.regular, hint, (0, 0, 0)) for hint in hints]
+    for i, (font, line, color) in enumerate(lines):
+        text = text_cache.render(font, line, color)
+        screen.blit(text, (screen_width // 2 - text.get_width() // 2, 200 + i * 50))
+
+
+class ProfilerOverlay:
+    """Frame time histogram and per-span averages from a FrameProfiler.
+
+    The figures are only recomputed every `refresh` frames, which keeps
+    them readable and stops the changing numbers from churning the text
+    cache. `latency` is an optional callable returning an input latency
+    summary, as from InputPipeline.latency_summary().
+    """
+
+    def __init__(self, profiler, fonts, refresh=30, latency=None):
+        self.profiler = profiler
+        self.fonts = fonts
+        self.latency = latency
+        self.refresh = refresh
+        self.surface = None
+        self.built_at = None
+
+    def build(self):
+        profiler = self.profiler
+        summary = profiler.summary()
+        lines = ["Profiler (F3)"]
+        if summary is not None:
+            lines.append(f"frame p50 {summary['p50']:.2f} ms  p99 {summary['p99']:.2f} ms")
+            lines += [f"{name} {ms:.3f} ms" for name, ms in summary['spans'].items()]
+        latency = self.latency() if self.latency is not None else None
+        if latency is not None:
+            lines.append("input to present p50 {:.1f}-{:.1f} ms  p99 {:.1f}-{:.1f} ms".format(
+                *latency['p50'], *latency['p99']))
+        texts = [self.fonts.small.render(line, True, (255, 255, 255)) for line in lines]
+
+        bar_width, graph_height = 12, 60
+        counts = profiler.histogram()
+        width = max([bar_width * len(counts)] + [text.get_width() for text in texts]) + 20
+        height = sum(text.get_height() for text in texts) + graph_height + 40
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        surface.fill(OVERLAY_COLOR)
+
+        y = 10
+        for text in texts:
+            surface.blit(text, (10, y))
+            y += text.get_height()
+
+        # One bar per 2 ms bucket, the last (red) one for anything slower
+        y += graph_height + 10
+        peak = max(int(counts.max()), 1) if len(counts) else 1
+        for i, count in enumerate(counts):
+            bar_height = graph_height * int(count) // peak
+            color = "red" if HISTOGRAM_EDGES[i + 1] == float('inf') else "green"
+            pygame.draw.rect(surface, color, (10 + i * bar_width, y - bar_height, bar_width - 2, bar_height))
+        # 60 Hz frame budget
+        budget_x = 10 + bar_width * (1000 / 60) / (HISTOGRAM_EDGES[1] - HISTOGRAM_EDGES[0])
+        pygame.draw.line(surface, "yellow", (budget_x, y - graph_height), (budget_x, y))
+
+        self.surface = surface
+        self.built_at = profiler.frame_number
+
+    def draw(self, screen):
+        """Blit the overlay in the bottom left corner and return its rect"""
+        if self.built_at is None or self.profiler.frame_number - self.built_at >= self.refresh:
+            self.build()
+        return screen.blit(self.surface, (10, screen.get_height() - self.surface.get_height() - 10))
+
+
+def lerp_columns(previous, current, alpha, limit):
+    """Blend two (2, n) position arrays, keeping columns that jumped further than `limit`"""
+    if previous.shape != current.shape:
+        return current
+    delta = current - previous
+    blended = previous + delta * alpha
+    jumped = (np.abs(delta) > limit).any(axis=0)
+    if jumped.any():
+        blended[:, jumped] = current[:, jumped]
+    return blended
+
+
+def offset_points(points, dx, dy):
+    """A PointArray's points moved by (dx, dy), as a list pygame can draw"""
+    shifted = np.array(points.coords, dtype=np.int32).reshape(-1, 2)
+    shifted += (dx, dy)
+    return shifted.tolist()
+
+
+def follow_axis(camera, target, view, board, margin):
+    """Camera offset along one axis that keeps `target` at least `margin` inside the view"""
+    if board <= view:
+        # Small boards sit in the middle of the screen
+        return (board - view) // 2
+    if target < camera + margin:
+        camera = target - margin
+    elif target > camera + view - margin:
+        camera = target - view + margin
+    return int(min(max(camera, 0), board - view))
+
+
+class TiledLayer:
+    """Claimed territory and the border of a board, cut into square tiles.
+
+    Every capture is filed under the tiles its bounding box touches. A tile
+    is rasterised from the captures filed under it the first time it is
+    shown, and kept in a least recently used cache of `max_tiles`
+    surfaces. Later captures are drawn straight onto the cached tiles they
+    touch. Memory and drawing cost therefore follow the size of the
+    viewport, not the size of the board.
+    """
+
+    def __init__(self, board_size, draw_border, tile_size=TILE_SIZE, max_tiles=64):
+        self.board_size = board_size
+        self.draw_border = draw_border
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.cols = -(-board_size[0] // tile_size)
+        self.rows = -(-board_size[1] // tile_size)
+        self.areas = []  # (polygon, color) of every capture
+        self.filed = {}  # (col, row) -> indices into areas
+        self.tiles = OrderedDict()
+        self.rasterised = 0
+
+    def add(self, polygon, color):
+        """Add a capture and return its bounding rect on the board"""
+        index = len(self.areas)
+        self.areas.append((polygon, color))
+        if len(polygon) < 3:
+            # Nothing to draw
+            return pygame.Rect(0, 0, 0, 0)
+        coords = np.frombuffer(polygon.coords, dtype=np.int16).reshape(-1, 2)
+        left, top = coords.min(axis=0).tolist()
+        right, bottom = coords.max(axis=0).tolist()
+        bounds = pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+
+        size = self.tile_size
+        for row in range(max(0, top // size), min(self.rows, bottom // size + 1)):
+            for col in range(max(0, left // size), min(self.cols, right // size + 1)):
+                self.filed.setdefault((col, row), []).append(index)
+                tile = self.tiles.get((col, row))
+                if tile is not None:
+                    self.draw_area(tile, col * size, row * size, polygon, color)
+        return bounds
+
+    def draw_area(self, tile, x, y, polygon, color):
+        rect = pygame.draw.polygon(tile, color, offset_points(polygon, -x, -y))
+        # Captures can reach over the border, so put it back on top
+        tile.set_clip(rect)
+        self.draw_border(tile, (x, y))
+        tile.set_clip(None)
+
+    def tile(self, col, row):
+        """Surface of one tile, rasterised if it is not cached"""
+        key = (col, row)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+
+        size = self.tile_size
+        x, y = col * size, row * size
+        tile = pygame.Surface((size, size))
+        tile.fill("white")
+        for index in self.filed.get(key, ()):
+            polygon, color = self.areas[index]
+            pygame.draw.polygon(tile, color, offset_points(polygon, -x, -y))
+        self.draw_border(tile, (x, y))
+        self.rasterised += 1
+
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def blit(self, screen, rect, camera):
+        """Copy the part of the board under screen `rect` to the screen, for a camera at `camera`"""
+        camera_x, camera_y = camera
+        width, height = self.board_size
+        board = pygame.Rect(-camera_x, -camera_y, width, height)
+        if not board.contains(rect):
+            screen.fill(OUTSIDE_BOARD_COLOR, rect)
+        rect = rect.clip(board)
+        if not rect:
+            return
+
+        size = self.tile_size
+        left, top = rect.left + camera_x, rect.top + camera_y
+        right, bottom = rect.right + camera_x - 1, rect.bottom + camera_y - 1
+        for row in range(top // size, bottom // size + 1):
+            for col in range(left // size, right // size + 1):
+                tile_x, tile_y = col * size - camera_x, row * size - camera_y
+                area = rect.clip((tile_x, tile_y, size, size))
+                screen.blit(self.tile(col, row), area, area.move(-tile_x, -tile_y))
+
+
+class PlayRenderer:
+    """Draws the PLAY screen through a camera, with a tiled territory layer and dirty rects.
+
+    Claimed territory and the border live in a TiledLayer and are only
+    touched again when a capture happens. The board can be any size; the
+    camera follows the player once they get within a third of the screen
+    of its edge, and stays put otherwise. The tiles it sees are copied
+    into a screen-sized view whenever it moves. While it stays put, each
+    frame restores the view under whatever was drawn last frame, draws the
+    moving parts on top and reports just those areas as changed.
+
+    Call capture() before each simulation tick and pass the timestep's
+    alpha to draw(): moving entities are then drawn between their previous
+    and current tick positions, so motion stays smooth at any refresh rate.
+    Call tick_effects() after each tick with the events it raised to run
+    the particle effects.
+    """
+
+    def __init__(self, screen, fonts):
+        self.screen = screen
+        self.fonts = fonts
+        self.sim = None
+        self.areas = None
+        self.layer = None
+        self.camera = None
+        self.view = None
+        self.view_camera = None
+        self.drawn_areas = 0
+        self.previous_rects = []
+        self.full_redraw = True
+        self.previous = None
+        # Semi-transparent HUD panel background, built on the first draw
+        self.panel = None
+        self.effects = ParticleEffects()
+
+    def capture(self, sim):
+        """Remember entity positions before a tick, to interpolate from"""
+        self.previous = (sim.xpos, sim.ypos, sim.sparx.pos.copy(), sim.qix.ends.copy())
+
+    def positions(self, sim, alpha):
+        """Player and Sparx positions and Qix lines to draw for this frame"""
+        player, sparx, qix = (sim.xpos, sim.ypos), sim.sparx.pos, sim.qix.ends
+        if alpha >= 1 or self.previous is None:
+            return player, sparx, qix
+
+        # Anything that moved further than a tick allows was respawned, so
+        # it is drawn where it is instead of sliding across the board
+        limit = 2 * max(sim.speed, sim.sparx.speed)
+        prev_x, prev_y, prev_sparx, prev_qix = self.previous
+        if abs(sim.xpos - prev_x) <= limit and abs(sim.ypos - prev_y) <= limit:
+            player = (prev_x + (sim.xpos - prev_x) * alpha, prev_y + (sim.ypos - prev_y) * alpha)
+        return player, lerp_columns(prev_sparx, sparx, alpha, limit), lerp_columns(prev_qix, qix, alpha, limit)
+
+    def tick_effects(self, sim, events):
+        """Start particle effects for a tick's events and advance the live ones"""
+        x, y = self.previous[:2] if self.previous is not None else (sim.xpos, sim.ypos)
+        self.effects.tick(sim.tick, events, (x + sim.width / 2, y + sim.height / 2), sim.sparx.pos)
+
+    def invalidate(self):
+        """Force the next frame to repaint and present the whole window"""
+        self.full_redraw = True
+
+    def rebuild_layer(self, sim):
+        """Start an empty territory layer for the board and center the camera on the next draw"""
+        self.sim = sim
+        self.areas = sim.filled_areas
+        width, height = self.screen.get_size()
+        # Enough tiles to cover the screen twice over
+        visible = (width // TILE_SIZE + 2) * (height // TILE_SIZE + 2)
+        self.layer = TiledLayer((sim.board_width, sim.board_height), self.draw_border, max_tiles=2 * visible)
+        self.drawn_areas = 0
+        self.camera = self.view_camera = None
+        self.effects.clear()
+        self.full_redraw = True
+
+    def draw_border(self, surface, offset=(0, 0)):
+        """Draw the border onto a surface whose top left is at `offset` on the board"""
+        left, top = BORDER_LEFT - offset[0], BORDER_TOP - offset[1]
+        width = self.sim.board_width - BORDER_LEFT - BORDER_RIGHT
+        height = self.sim.board_height - BORDER_TOP - BORDER_BOTTOM
+        # Four filled bands rather than pygame.draw.rect's outline, which
+        # fills the whole clip area when a clip cuts through it
+        for band in ((left, top, width, BORDER_WIDTH), (left, top + height - BORDER_WIDTH, width, BORDER_WIDTH),
+                     (left, top, BORDER_WIDTH, height), (left + width - BORDER_WIDTH, top, BORDER_WIDTH, height)):
+            pygame.draw.rect(surface, "black", band)
+
+    def update_layer(self):
+        """Add captures made since the last frame to the layer and return the screen rects they cover"""
+        areas = self.sim.filled_areas
+        camera_x, camera_y = self.camera
+        screen_rect = self.screen.get_rect()
+        rects = []
+        for index in range(self.drawn_areas, len(areas)):
+            rect = self.layer.add(areas[index], self.area_color(index)).move(-camera_x, -camera_y).clip(screen_rect)
+            if rect:
+                rects.append(rect)
+        self.drawn_areas = len(areas)
+        return rects
+
+    def area_color(self, index):
+        return TERRITORY_COLOR
+
+    def focus(self, sim, positions):
+        """Board point the camera keeps in view: the player's center"""
+        x, y = positions[0]
+        return x + sim.width / 2, y + sim.height / 2
+
+    def follow(self, sim, positions):
+        """Move the camera to keep the focus away from the screen edges"""
+        x, y = self.focus(sim, positions)
+        width, height = self.screen.get_size()
+        if self.camera is None:
+            # Start centered on the focus
+            camera_x, camera_y = x - width / 2, y - height / 2
+        else:
+            camera_x, camera_y = self.camera
+        camera = (follow_axis(camera_x, x, width, sim.board_width, width // 3),
+                  follow_axis(camera_y, y, height, sim.board_height, height // 3))
+        if camera != self.camera:
+            self.camera = camera
+            self.full_redraw = True
+
+    def draw(self, sim, alpha=1.0, overlay=None):
+        """Draw one frame, with an optional overlay on top, and return the screen rects that changed"""
+        screen = self.screen
+        # A new round (or sim.reset()) starts a fresh list of captures
+        if sim.filled_areas is not self.areas:
+            self.rebuild_layer(sim)
+        positions = self.positions(sim, alpha)
+        self.follow(sim, positions)
+        dirty = self.update_layer()
+        view = self.view
+        if view is None or view.get_size() != screen.get_size() or self.view_camera != self.camera:
+            # The screen-sized part of the layer the camera sees, which
+            # frames are erased from until the camera moves again
+            if view is None or view.get_size() != screen.get_size():
+                view = self.view = pygame.Surface(screen.get_size())
+            self.layer.blit(view, view.get_rect(), self.camera)
+            self.view_camera = self.camera
+            self.full_redraw = True
+        else:
+            for rect in dirty:
+                self.layer.blit(view, rect, self.camera)
+
+        if self.full_redraw:
+            screen.blit(view, (0, 0))
+        else:
+            # Erase last frame's entities and HUD
+            for rect in self.previous_rects:
+                screen.blit(view, rect, rect)
+            for rect in dirty:
+                screen.blit(view, rect, rect)
+            dirty.extend(self.previous_rects)
+
+        rects = self.draw_entities(sim, positions) + self.draw_hud(sim)
+        if overlay is not None:
+            rects.append(overlay.draw(screen))
+        self.previous_rects = rects
+        dirty.extend(rects)
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [screen.get_rect()]
+        return dirty
+
+    def draw_path(self, path, color):
+        """Draw a push line, returning its rect"""
+        camera_x, camera_y = self.camera
+        if camera_x or camera_y:
+            path = offset_points(path, -camera_x, -camera_y)
+        return pygame.draw.lines(self.screen, color, False, path, 3)
+
+    def draw_entities(self, sim, positions):
+        screen = self.screen
+        camera_x, camera_y = self.camera
+        (player_x, player_y), sparx, qix = positions
+
+        # Particles go under everything else
+        rects = self.effects.draw(screen, self.camera)
+
+        # Draw current path
+        if sim.push_enabled and len(sim.player_path) > 1:
+            rects.append(self.draw_path(sim.player_path, "green"))
+
+        # Draw player
+        player_color = "red"
+        if sim.invulnerable:
+            # Blinking effect during invulnerability
+            if (sim.tick // 6) % 2 == 0:
+                player_color = "gray"
+        rects.append(pygame.draw.rect(screen, player_color, (player_x - camera_x, player_y - camera_y,
+                                                             sim.width, sim.height)))
+
+        # Draw enemies
+        rects += self.draw_sparx(sparx)
+        rects += self.draw_qix(sim.qix, qix)
+        return rects
+
+    def draw_sparx(self, sparx):
+        """Draw Sparx given as a (2, n) array of positions"""
+        screen = self.screen
+        camera_x, camera_y = self.camera
+        return [pygame.draw.circle(screen, "orange", (x - camera_x, y - camera_y), 10)
+                for x, y in zip(*sparx.tolist())]
+
+    def draw_qix(self, swarm, current):
+        """Draw each Qix's trail and then its current line, given as a (4, n) array"""
+        screen = self.screen
+        camera_x, camera_y = self.camera
+        rects = []
+        for i, (x0, y0, x1, y1) in enumerate(current.T.tolist()):
+            for tx0, ty0, tx1, ty1 in swarm.lines(i)[:-1]:
+                rects.append(pygame.draw.line(screen, QIX_TRAIL_COLOR, (tx0 - camera_x, ty0 - camera_y),
+                                              (tx1 - camera_x, ty1 - camera_y), 2))
+            rects.append(pygame.draw.line(screen, "purple", (x0 - camera_x, y0 - camera_y),
+                                          (x1 - camera_x, y1 - camera_y), 3))
+        return rects
+
+    def draw_hud(self, sim):
+        screen = self.screen
+        font, title_font = self.fonts.regular, self.fonts.title
+        screen_width, screen_height = screen.get_size()
+        rects = []
+
+        # Draw UI Panel
+        if self.panel is None:
+            self.panel = pygame.Surface((200, 150), pygame.SRCALPHA)
+            pygame.draw.rect(self.panel, PANEL_COLOR, self.panel.get_rect(), border_radius=10)
+        panel_width = self.panel.get_width()
+        panel_x = screen_width - panel_width - 20
+        panel_y = 20
+        rects.append(screen.blit(self.panel, (panel_x, panel_y)))
+
+        # Draw lives
+        lives_text = text_cache.render(font, "Lives:", (0, 0, 0))
+        lives_value = text_cache.render(title_font, str(sim.lives), (255, 0, 0))
+        screen.blit(lives_text, (panel_x + 20, panel_y + 20))
+        rects.append(screen.blit(lives_value, (panel_x + 120, panel_y + 20)))
+
+        # Draw territory percentage
+        percentage = sim.territory_percentage()
+        territory_text = text_cache.render(font, "Territory:", (0, 0, 0))
+        territory_value = text_cache.render(font, f"{percentage:.2f}%", (0, 128, 0))
+        screen.blit(territory_text, (panel_x + 20, panel_y + 70))
+        rects.append(screen.blit(territory_value, (panel_x + 120, panel_y + 70)))
+
+        # Draw invulnerability timer if active
+        if sim.invulnerable:
+            remaining_time = sim.invulnerability_remaining()
+            vulnerable_text = text_cache.render(font, "Vulnerable in:", (0, 0, 0))
+            vulnerable_time = text_cache.render(font, f"{remaining_time:.1f}s", (255, 0, 0))
+            rects.append(screen.blit(vulnerable_text, (panel_x + 20, panel_y + 110)))
+            rects.append(screen.blit(vulnerable_time, (panel_x + 120, panel_y + 110)))
+
+        # Display Level Passed message
+        if sim.level_passed and sim.tick - sim.level_pass_tick < LEVEL_PASS_TICKS:
+            level_pass_text = text_cache.render(title_font, "Congrats! Level Passed!", (0, 255, 0))
+            text_width = level_pass_text.get_width()
+            rects.append(screen.blit(level_pass_text, (screen_width // 2 - text_width // 2, screen_height // 2 - 50)))
+        return rects
+
+
+# Player, push line and territory colors for each player of a versus game
+VERSUS_COLORS = [("red", "green", TERRITORY_COLOR), ("blue", "cyan", (255, 204, 170))]
+
+
+class VersusRenderer(PlayRenderer):
+    """Draws a VersusSimulation, with each player's captures in their own color.
+
+    Rollback netplay restores the simulation to an earlier tick whenever a
+    prediction was wrong, which hands it a new filled_areas list. The
+    territory layer is only rebuilt if that undid a capture already drawn.
+    Entities are drawn where they are; interpolating across a rollback
+    would slide them through positions that never happened. The camera
+    follows the local player.
+    """
+
+    def __init__(self, screen, fonts, local_player=0):
+        super().__init__(screen, fonts)
+        self.local_player = local_player
+
+    def area_color(self, index):
+        return VERSUS_COLORS[self.sim.owners[index] % len(VERSUS_COLORS)][2]
+
+    def draw(self, sim, alpha=1.0, overlay=None):
+        areas = sim.filled_areas
+        if self.areas is not None and areas is not self.areas and len(areas) >= self.drawn_areas and \
+                all(a is b for a, b in zip(areas[:self.drawn_areas], self.areas)):
+            self.areas = areas
+        return super().draw(sim, 1.0, overlay)
+
+    def focus(self, sim, positions):
+        player = sim.player(self.local_player)
+        return player['xpos'] + sim.width / 2, player['ypos'] + sim.height / 2
+
+    def draw_entities(self, sim, positions):
+        screen = self.screen
+        camera_x, camera_y = self.camera
+        rects = []
+        for i in range(sim.player_count):
+            player = sim.player(i)
+            player_color, line_color, _ = VERSUS_COLORS[i % len(VERSUS_COLORS)]
+            if player['push_enabled'] and len(player['player_path']) > 1:
+                rects.append(self.draw_path(player['player_path'], line_color))
+            if player['invulnerable'] and (sim.tick // 6) % 2 == 0:
+                player_color = "gray"
+            rects.append(pygame.draw.rect(screen, player_color, (player['xpos'] - camera_x, player['ypos'] - camera_y,
+                                                                 sim.width, sim.height)))
+
+        rects += self.draw_sparx(sim.sparx.pos)
+        rects += self.draw_qix(sim.qix, sim.qix.ends)
+        return rects
+
+    def draw_hud(self, sim):
+        screen = self.screen
+        font = self.fonts.small
+        rects = []
+        if self.panel is None:
+            self.panel = pygame.Surface((220, 30 + 30 * sim.player_count), pygame.SRCALPHA)
+            pygame.draw.rect(self.panel, PANEL_COLOR, self.panel.get_rect(), border_radius=10)
+        panel_x, panel_y = screen.get_width() - self.panel.get_width() - 20, 20
+        rects.append(screen.blit(self.panel, (panel_x, panel_y)))
+
+        for i in range(sim.player_count):
+            name = "You" if i == self.local_player else f"P{i + 1}"
+            line = f"{name}: {sim.player(i)['lives']} lives {sim.player_percentage(i):.1f}%"
+            text = text_cache.render(font, line, VERSUS_COLORS[i % len(VERSUS_COLORS)][0])
+            rects.append(screen.blit(text, (panel_x + 15, panel_y + 15 + 30 * i)))
+        return rects
@@ -0,0 +1,237 @@
+import struct
+import zlib
+from collections import namedtuple
+
+from simulation import Inputs, QixSimulation
+
+# File layout: MAGIC, then a stream of bytes. A byte with a non-zero top 3
+# bits is a run: the low 5 bits are the input bits and the top bits the
+# number of ticks (1-7) they were held for. A byte with zero top bits is a
+# control code in its low bits, followed by that control's payload.
+MAGIC = b'QIXR\x03'
+
+CONTROL_LONG_RUN = 0   # input byte, varint tick count
+CONTROL_ROUND = 1      # RoundHeader
+CONTROL_ROUND_END = 2  # varint tick count, u32 state digest
+
+MAX_SHORT_RUN = 7
+
+ROUND_HEADER = struct.Struct('<QHHHH')
+DIGEST = struct.Struct('<I')
+
+RoundHeader = namedtuple('RoundHeader', ['seed', 'board_width', 'board_height', 'sparx_count', 'qix_count'])
+RoundEnd = namedtuple('RoundEnd', ['ticks', 'digest'])
+
+
+class ReplayError(Exception):
+    pass
+
+
+def encode_inputs(inputs):
+    """Pack held keys and SPACE into the low 5 bits of a byte"""
+    return (inputs.left | inputs.right << 1 | inputs.up << 2 |
+            inputs.down << 3 | inputs.space << 4)
+
+
+def decode_inputs(bits):
+    return Inputs(bool(bits & 1), bool(bits & 2), bool(bits & 4), bool(bits & 8), bool(bits & 16))
+
+
+# Every possible input byte decoded once
+DECODED = [decode_inputs(bits) for bits in range(32)]
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def state_digest(sim):
+    """CRC of the parts of a simulation a desynced replay would disagree on"""
+    crc = zlib.crc32(struct.pack('<qddii', sim.tick, sim.xpos, sim.ypos, sim.lives, sim.push_enabled))
+    crc = zlib.crc32(sim.sparx.pos.tobytes(), crc)
+    crc = zlib.crc32(sim.qix.ends.tobytes(), crc)
+    crc = zlib.crc32(sim.player_path.coords.tobytes(), crc)
+    return zlib.crc32(sim.territory.cells, crc)
+
+
+class ReplayWriter:
+    """Appends rounds of per-tick inputs to a replay file, run-length encoded.
+
+    Runs of up to 7 identical ticks take one byte, longer runs a few bytes,
+    so a session costs at most about a byte per tick on disk.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.buffer = bytearray()
+        self.run_bits = None
+        self.run_length = 0
+        self.ticks = 0
+
+    def start_round(self, sim):
+        """Begin a round; the simulation must be freshly created from its seed"""
+        self.flush_run()
+        self.buffer.append(CONTROL_ROUND)
+        self.buffer += ROUND_HEADER.pack(sim.seed, sim.board_width, sim.board_height,
+                                         sim.sparx_count, sim.qix_count)
+        self.ticks = 0
+
+    def record(self, inputs):
+        """Log the inputs passed to one QixSimulation.step() call"""
+        bits = encode_inputs(inputs)
+        if bits != self.run_bits:
+            self.flush_run()
+            self.run_bits = bits
+        self.run_length += 1
+        self.ticks += 1
+
+    def end_round(self, sim):
+        """Close the round with a digest of the final state for playback to check"""
+        self.flush_run()
+        self.buffer.append(CONTROL_ROUND_END)
+        write_varint(self.buffer, self.ticks)
+        self.buffer += DIGEST.pack(state_digest(sim))
+        self.flush()
+
+    def flush_run(self):
+        length, bits = self.run_length, self.run_bits
+        if length == 0:
+            return
+        if length <= MAX_SHORT_RUN:
+            self.buffer.append(length << 5 | bits)
+        else:
+            self.buffer.append(CONTROL_LONG_RUN)
+            self.buffer.append(bits)
+            write_varint(self.buffer, length)
+        self.run_length = 0
+        if len(self.buffer) >= 4096:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self):
+        self.flush_run()
+        self.flush()
+        self.file.close()
+
+
+class ReplayReader:
+    """Streams rounds back out of a replay file without loading it whole.
+
+    Iterating the reader yields (RoundHeader, inputs) pairs, where `inputs`
+    is a generator of one Inputs per tick. Once a round's inputs are used
+    up, `round_end` holds its RoundEnd, or None if the recording stopped
+    mid-round.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ReplayError(f"{path} is not a Qix replay")
+        self.pending_header = None
+        self.round_end = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def read_byte(self):
+        byte = self.file.read(1)
+        return byte[0] if byte else None
+
+    def read_exact(self, size):
+        data = self.file.read(size)
+        if len(data) != size:
+            raise ReplayError("replay ends in the middle of a record")
+        return data
+
+    def read_varint(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.read_byte()
+            if byte is None:
+                raise ReplayError("replay ends in the middle of a record")
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def __iter__(self):
+        while True:
+            if self.pending_header is None:
+                byte = self.read_byte()
+                if byte is None:
+                    return
+                if byte != CONTROL_ROUND:
+                    raise ReplayError(f"expected a round header, found byte {byte:#x}")
+                self.pending_header = RoundHeader(*ROUND_HEADER.unpack(self.read_exact(ROUND_HEADER.size)))
+            header, self.pending_header = self.pending_header, None
+            self.round_end = None
+            inputs = self.inputs()
+            yield header, inputs
+            # Skip whatever the caller did not play through
+            for _ in inputs:
+                pass
+
+    def inputs(self):
+        read = self.file.read
+        while True:
+            chunk = read(1)
+            if not chunk:
+                return
+            byte = chunk[0]
+            if byte >> 5:
+                inputs = DECODED[byte & 0x1F]
+                for _ in range(byte >> 5):
+                    yield inputs
+            elif byte == CONTROL_LONG_RUN:
+                inputs = DECODED[self.read_exact(1)[0] & 0x1F]
+                for _ in range(self.read_varint()):
+                    yield inputs
+            elif byte == CONTROL_ROUND_END:
+                ticks = self.read_varint()
+                self.round_end = RoundEnd(ticks, DIGEST.unpack(self.read_exact(DIGEST.size))[0])
+                return
+            elif byte == CONTROL_ROUND:
+                self.pending_header = RoundHeader(*ROUND_HEADER.unpack(self.read_exact(ROUND_HEADER.size)))
+                return
+            else:
+                raise ReplayError(f"unknown control byte {byte:#x}")
+
+
+def play_round(header, inputs):
+    """Re-run a recorded round headlessly, returning the finished simulation"""
+    sim = QixSimulation(header.board_width, header.board_height, seed=header.seed,
+                        sparx_count=header.sparx_count, qix_count=header.qix_count)
+    step = sim.step
+    for tick_inputs in inputs:
+        step(tick_inputs)
+    return sim
+
+
+def run_headless(path):
+    """Play every round of a replay without a window and check each final state"""
+    desynced = 0
+    with ReplayReader(path) as reader:
+        for number, (header, inputs) in enumerate(reader, 1):
+            sim = play_round(header, inputs)
+            end = reader.round_end
+            if end is None:
+                check = "recording stopped mid-round"
+            elif end.ticks == sim.tick and end.digest == state_digest(sim):
+                check = "matches recording"
+            else:
+                check = "DESYNC"
+                desynced += 1
+            print(f"Round {number}: {sim.tick} ticks, {sim.state}, "
+                  f"{sim.territory_percentage():.2f}% territory, {sim.lives} lives - {check}")
+    return 1 if desynced else 0
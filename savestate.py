@@ -0,0 +1,168 @@
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import numpy as np
+
+from enemies import SparxSwarm, QixSwarm
+from path import PointArray
+from simulation import QixSimulation, Snapshot, STATE_PLAYING, STATE_WON, STATE_LOST, path_grid_for
+
+# File layout: MAGIC, HEADER, STATE, the random generator, the push line,
+# every claimed polygon, the Sparx and the Qix, then a CRC32 of all of it.
+# The territory grid and border are not stored: loading claims the
+# polygons again in order, which rebuilds both exactly.
+MAGIC = b'QIXS\x02'
+
+HEADER = struct.Struct('<QHHHH')        # seed, board width and height, Sparx and Qix count
+STATE = struct.Struct('<IB?ddIi?I?II')  # tick, state, push, x, y, path length, lives,
+                                        # invulnerable, since, level passed, at, areas
+RNG = struct.Struct('<B625I?d')
+COUNT = struct.Struct('<I')
+TICKS = struct.Struct('<qq')
+QIX_TICKS = struct.Struct('<qqq')       # trail head, ticks, next steer
+CRC = struct.Struct('<I')
+
+STATES = [STATE_PLAYING, STATE_WON, STATE_LOST]
+
+
+class SaveStateError(Exception):
+    pass
+
+
+def pack_points(out, coords):
+    coords = array('h', coords)
+    if sys.byteorder == 'big':
+        coords.byteswap()
+    out += COUNT.pack(len(coords) // 2)
+    out += coords.tobytes()
+
+
+def pack_arrays(out, arrays, dtype):
+    for values in arrays:
+        out += np.ascontiguousarray(values, dtype=dtype).tobytes()
+
+
+def dumps(snapshot):
+    """Serialise a QixSimulation snapshot into bytes"""
+    out = bytearray(MAGIC)
+    out += HEADER.pack(snapshot.seed, snapshot.board_width, snapshot.board_height,
+                       snapshot.sparx_count, snapshot.qix_count)
+    out += STATE.pack(snapshot.tick, STATES.index(snapshot.state), snapshot.push_enabled,
+                      snapshot.xpos, snapshot.ypos, snapshot.path_length, snapshot.lives,
+                      snapshot.invulnerable, snapshot.invulnerability_start_tick,
+                      snapshot.level_passed, snapshot.level_pass_tick, snapshot.area_count)
+    version, internal, gauss = snapshot.rng_state
+    out += RNG.pack(version, *internal, gauss is not None, gauss or 0.0)
+
+    pack_points(out, snapshot.path_coords)
+    for polygon in snapshot.filled_areas[:snapshot.area_count]:
+        pack_points(out, polygon.coords)
+
+    pos, vel, origin, target, steer_tick, ticks, next_steer = snapshot.sparx
+    pos, vel, origin, target, steer_tick = SparxSwarm.state_arrays(pos, vel, origin, target, steer_tick)
+    out += COUNT.pack(pos.shape[1])
+    pack_arrays(out, (pos, vel, origin, target), '<i4')
+    pack_arrays(out, (steer_tick,), '<i8')
+    out += TICKS.pack(ticks, next_steer)
+
+    ends, vel, prev, trail, head, steer_tick, ticks, next_steer = snapshot.qix
+    ends, vel, prev, trail = QixSwarm.state_arrays(ends, vel, prev, trail)
+    out += COUNT.pack(ends.shape[1])
+    out += COUNT.pack(trail.shape[0])
+    pack_arrays(out, (ends, vel, prev, trail), '<f8')
+    pack_arrays(out, (steer_tick,), '<i8')
+    out += QIX_TICKS.pack(head, ticks, next_steer)
+
+    out += CRC.pack(zlib.crc32(out))
+    return bytes(out)
+
+
+class Unpacker:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def take(self, size):
+        start = self.offset
+        if start + size > len(self.data):
+            raise SaveStateError("save state is truncated")
+        self.offset += size
+        return self.data[start:self.offset]
+
+    def unpack(self, layout):
+        return layout.unpack(self.take(layout.size))
+
+    def points(self):
+        count, = self.unpack(COUNT)
+        coords = array('h')
+        coords.frombytes(self.take(4 * count))
+        if sys.byteorder == 'big':
+            coords.byteswap()
+        return coords
+
+    def arrays(self, count, shape, dtype):
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        return [np.frombuffer(self.take(size), dtype=dtype).reshape(shape).astype(dtype[1:])
+                for _ in range(count)]
+
+
+def loads(data):
+    """Turn bytes from dumps() back into a snapshot, ready for QixSimulation.restore()"""
+    data = memoryview(data)
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise SaveStateError("not a Qix save state")
+    if len(data) < len(MAGIC) + CRC.size or \
+            CRC.unpack(data[-CRC.size:])[0] != zlib.crc32(data[:-CRC.size]):
+        raise SaveStateError("save state is corrupt")
+
+    reader = Unpacker(data[:-CRC.size])
+    reader.take(len(MAGIC))
+    seed, board_width, board_height, sparx_count, qix_count = reader.unpack(HEADER)
+    (tick, state, push_enabled, xpos, ypos, path_length, lives, invulnerable, invulnerable_since,
+     level_passed, level_pass_tick, area_count) = reader.unpack(STATE)
+    rng = reader.unpack(RNG)
+    rng_state = (rng[0], rng[1:626], rng[627] if rng[626] else None)
+
+    path_coords = reader.points()
+    path_grid = path_grid_for(PointArray(path_coords))
+    # Claim the polygons again, in order, on a fresh board
+    sim = QixSimulation(board_width, board_height, seed=seed, sparx_count=0, qix_count=0)
+    filled_areas = []
+    for _ in range(area_count):
+        polygon = PointArray(reader.points())
+        filled_areas.append(polygon)
+        sim.territory.claim(polygon)
+        sim.border.claim(polygon)
+
+    count, = reader.unpack(COUNT)
+    sparx = (*reader.arrays(4, (2, count), '<i4'), *reader.arrays(1, (count,), '<i8'), *reader.unpack(TICKS))
+    count, = reader.unpack(COUNT)
+    slots, = reader.unpack(COUNT)
+    qix = (*reader.arrays(3, (4, count), '<f8'), *reader.arrays(1, (slots, 4, count), '<f8'))
+    steer_tick, = reader.arrays(1, (count,), '<i8')
+    head, ticks, next_steer = reader.unpack(QIX_TICKS)
+    qix = (*qix, head, steer_tick, ticks, next_steer)
+
+    return Snapshot(board_width, board_height, seed, sparx_count, qix_count, rng_state,
+                    tick, STATES[state], push_enabled, xpos, ypos, path_coords, path_length, path_grid,
+                    filled_areas, area_count, sim.territory, sim.border,
+                    level_passed, level_pass_tick, lives, invulnerable, invulnerable_since,
+                    sparx, qix)
+
+
+def save(path, snapshot):
+    """Write a snapshot to `path` so that a crash or power cut leaves the old file or the new one"""
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(dumps(snapshot))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
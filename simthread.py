@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from simulation import QixSimulation, STATE_PLAYING, TICK_RATE
+
+# What the renderer needs from one tick, published by the simulation
+# thread. Every field is immutable or a copy nothing else writes to, so
+# the frame loop can draw from a Frame while the next tick runs.
+# `previous` holds the positions before the tick, to interpolate from,
+# and shares the arrays of the Frame before it.
+Frame = namedtuple('Frame', [
+    'time', 'tick', 'previous', 'xpos', 'ypos', 'push_enabled', 'path', 'area_count', 'sparx',
+    'qix_ends', 'qix_lines', 'lives', 'invulnerable', 'invulnerability_start_tick', 'percentage',
+    'level_passed', 'level_pass_tick',
+])
+
+# One tick's events, with what the particle effects need from that tick.
+# `events` is None when there was nothing left to play.
+TickRecord = namedtuple('TickRecord', ['tick', 'events', 'player_center', 'sparx'])
+
+
+class SwarmView:
+    """The parts of a SparxSwarm or QixSwarm that PlayRenderer reads"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.pos = self.ends = None
+        self.trails = []
+
+    def lines(self, i):
+        return self.trails[i]
+
+
+class SimView:
+    """A stand-in for a QixSimulation that PlayRenderer draws, loaded from Frames.
+
+    It has the round's constants and the latest Frame's state under the
+    simulation's own attribute names. It also keeps its own list of the
+    captured polygons, extended as Frames count new ones, so the
+    renderer's territory layer carries over from frame to frame.
+    """
+
+    player_center = QixSimulation.player_center
+    invulnerability_remaining = QixSimulation.invulnerability_remaining
+
+    def __init__(self, sim):
+        self.board_width, self.board_height = sim.board_width, sim.board_height
+        self.width, self.height, self.speed = sim.width, sim.height, sim.speed
+        self.sparx = SwarmView(sim.sparx.speed)
+        self.qix = SwarmView(sim.qix.speed)
+        # Only ever appended to, so entries below a Frame's area_count are safe to read
+        self.source_areas = sim.filled_areas
+        self.filled_areas = []
+        self.frame = None
+
+    def load(self, frame):
+        if frame is self.frame:
+            return
+        self.frame = frame
+        self.tick, self.previous = frame.tick, frame.previous
+        self.xpos, self.ypos = frame.xpos, frame.ypos
+        self.push_enabled, self.player_path = frame.push_enabled, frame.path
+        self.sparx.pos = frame.sparx
+        self.qix.ends, self.qix.trails = frame.qix_ends, frame.qix_lines
+        self.lives, self.invulnerable = frame.lives, frame.invulnerable
+        self.invulnerability_start_tick = frame.invulnerability_start_tick
+        self.level_passed, self.level_pass_tick = frame.level_passed, frame.level_pass_tick
+        areas = self.filled_areas
+        for index in range(len(areas), frame.area_count):
+            areas.append(self.source_areas[index])
+
+    def territory_percentage(self):
+        return self.frame.percentage
+
+
+class SimulationThread:
+    """Runs a round's ticks at the fixed tick rate on a thread of its own.
+
+    Neither the simulation nor the frame loop waits for the other. `step`
+    is called on the thread once per tick with the simulation. It returns
+    the tick's events, or None when there is nothing left to play (a
+    replay that ran out). After each tick the thread publishes a new Frame
+    by swapping a single reference, then queues a TickRecord. The frame
+    loop draws the latest Frame through view() and takes the records with
+    take_ticks(), and never blocks. The thread stops stepping when the
+    round ends, on pause() and on close().
+
+    Ticks that fall more than `max_ticks_behind` behind are skipped rather
+    than caught up on, as FixedTimestep does. When `unthrottled`, ticks
+    run back to back.
+    """
+
+    def __init__(self, step, tick_rate=TICK_RATE, max_ticks_behind=5, unthrottled=False,
+                 clock=time.perf_counter):
+        self.step = step
+        self.tick_duration = 1 / tick_rate
+        self.max_ticks_behind = max_ticks_behind
+        self.unthrottled = unthrottled
+        self.clock = clock
+        self.sim = None
+        self.frame = None
+        self.sim_view = None
+        self.records = deque()
+        self.path_source = self.path_length = None
+        # Set by resume() for the thread to restart its tick schedule
+        self.restart = True
+        # Held while a tick runs, so pause() can wait for it to finish
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name='simulation', daemon=True)
+        self.thread.start()
+
+    def start_round(self, sim):
+        """Start stepping a new round"""
+        self.pause()
+        self.sim = sim
+        self.records.clear()
+        self.path_source = None
+        self.frame = self.capture(sim, None)
+        self.sim_view = SimView(sim)
+        self.resume()
+
+    def pause(self):
+        """Stop stepping, waiting for a tick in progress to finish"""
+        self.active.clear()
+        with self.lock:
+            pass
+
+    def resume(self):
+        """Carry on stepping from now, without catching up on the time paused"""
+        self.restart = True
+        self.active.set()
+
+    def close(self):
+        self.stopping = True
+        self.active.set()
+        self.thread.join()
+
+    def take_ticks(self):
+        """TickRecords of every tick run since the last call, oldest first"""
+        records = self.records
+        taken = []
+        while records:
+            taken.append(records.popleft())
+        return taken
+
+    def view(self):
+        """The round as of the latest tick and the alpha to draw it at, for PlayRenderer.draw().
+
+        Alpha is how far the frame loop is from that tick to the next one,
+        0 <= alpha <= 1. Both come from one read of the published Frame, as
+        the thread may publish another in between.
+        """
+        frame = self.frame
+        self.sim_view.load(frame)
+        if self.unthrottled:
+            return self.sim_view, 1.0
+        return self.sim_view, min(1.0, (self.clock() - frame.time) / self.tick_duration)
+
+    def run(self):
+        next_tick = 0.0
+        while not self.stopping:
+            if not self.active.wait(0.1):
+                continue
+            now = self.clock()
+            if self.restart:
+                self.restart = False
+                next_tick = now
+            elif now - next_tick > self.tick_duration * self.max_ticks_behind:
+                # Drop time we cannot catch up on instead of spiralling
+                next_tick = now
+            if not self.unthrottled and next_tick > now:
+                time.sleep(next_tick - now)
+                continue
+            with self.lock:
+                if self.active.is_set() and not self.stopping:
+                    self.run_tick()
+            next_tick += self.tick_duration
+
+    def run_tick(self):
+        sim, last = self.sim, self.frame
+        events = self.step(sim)
+        if events is None:
+            self.active.clear()
+            self.records.append(TickRecord(sim.tick, None, None, last.sparx))
+            return
+        frame = self.frame = self.capture(sim, last)
+        self.records.append(TickRecord(frame.tick, events, (last.xpos + sim.width / 2, last.ypos + sim.height / 2),
+                                       frame.sparx))
+        if sim.state != STATE_PLAYING:
+            self.active.clear()
+
+    def capture(self, sim, last):
+        """A Frame of the simulation as it is now, `last` being the one before"""
+        path = sim.player_path
+        if last is not None and path is self.path_source and path.raw_length == self.path_length:
+            frozen = last.path
+        else:
+            # The push line only changes by growing or being replaced
+            frozen = path.freeze()
+            self.path_source, self.path_length = path, path.raw_length
+        qix = sim.qix
+        previous = None if last is None else (last.xpos, last.ypos, last.sparx, last.qix_ends)
+        return Frame(
+            self.clock(), sim.tick, previous, sim.xpos, sim.ypos, sim.push_enabled, frozen, len(sim.filled_areas),
+            sim.sparx.pos.copy(), qix.ends.copy(), [qix.lines(i) for i in range(len(qix))], sim.lives,
+            sim.invulnerable, sim.invulnerability_start_tick, sim.territory_percentage(), sim.level_passed,
+            sim.level_pass_tick,
+        )
@@ -0,0 +1,559 @@
+import math
+import random
+from array import array
+from collections import namedtuple
+
+from border import BorderGraph
+from enemies import SparxSwarm, QixSwarm, SMALL_SWARM
+from path import PlayerPath
+from spatial import SegmentGrid, point_in_polygon
+from territory import TerritoryGrid
+
+# Simulation rate the rule constants below are tuned for
+TICK_RATE = 60
+
+# Player
+PLAYER_SIZE = 10
+PLAYER_SPEED = 5
+START_LIVES = 3
+INVULNERABILITY_TICKS = 2 * TICK_RATE
+
+# Enemies
+SPARX_SPEED = 5
+SPARX_RADIUS = 7
+QIX_SPEED = 3
+QIX_LENGTH = 28         # Usual length of a Qix line
+QIX_TRAIL_LENGTH = 8    # Earlier positions of the line drawn and hit-tested behind it
+QIX_TRAIL_SPACING = 3   # Ticks between those positions
+
+# Territory needed to pass the level
+WIN_PERCENTAGE = 20
+LEVEL_PASS_TICKS = 2 * TICK_RATE  # How long the level passed banner is shown
+
+# Border inset from the window edges
+BORDER_LEFT = 50
+BORDER_TOP = 20
+BORDER_RIGHT = 50
+BORDER_BOTTOM = 50
+
+# Push lines and captured polygons store their points as 16-bit integers
+MAX_BOARD_SIZE = 32767
+
+# Replays and save states store the seed as an unsigned 64-bit integer
+MAX_SEED = (1 << 64) - 1
+
+# Simulation states
+STATE_PLAYING = 'playing'
+STATE_WON = 'won'
+STATE_LOST = 'lost'
+
+# Event kinds returned from QixSimulation.step()
+EVENT_CAPTURE = 'capture'
+EVENT_DEATH = 'death'
+EVENT_LEVEL_PASSED = 'level_passed'
+EVENT_GAME_OVER = 'game_over'
+
+# Causes attached to EVENT_DEATH
+DEATH_SPARX = 'sparx'
+DEATH_SPARX_LINE = 'sparx_line'
+DEATH_QIX = 'qix'
+
+# Held arrow keys plus SPACE pressed this tick
+Inputs = namedtuple('Inputs', ['left', 'right', 'up', 'down', 'space'], defaults=[False] * 5)
+NO_INPUT = Inputs()
+
+# A whole game as taken by QixSimulation.snapshot(), see savestate.py for
+# turning one into bytes
+Snapshot = namedtuple('Snapshot', [
+    'board_width', 'board_height', 'seed', 'sparx_count', 'qix_count', 'rng_state',
+    'tick', 'state', 'push_enabled', 'xpos', 'ypos', 'path_coords', 'path_length', 'path_grid',
+    'filled_areas', 'area_count', 'territory', 'border',
+    'level_passed', 'level_pass_tick', 'lives', 'invulnerable', 'invulnerability_start_tick',
+    'sparx', 'qix',
+])
+
+
+def path_grid_for(path):
+    """Broadphase over the segments of a push line, for Sparx touch tests"""
+    grid = SegmentGrid(margin=SPARX_RADIUS + 1)
+    for i in range(len(path) - 1):
+        grid.add(i, path[i], path[i + 1])
+    return grid
+
+
+def line_intersects_circle(line_start, line_end, circle_center, circle_radius):
+    """
+    Check if a line segment intersects a circle
+    """
+    x1, y1 = line_start
+    x2, y2 = line_end
+    cx, cy = circle_center
+
+    # Check if the line segment has zero length
+    if x1 == x2 and y1 == y2:
+        # If the point is within the circle radius, it's a collision
+        dist = math.sqrt((cx - x1)**2 + (cy - y1)**2)
+        return dist <= circle_radius + 1  # Add 1 for slight tolerance
+
+    # Vector from line start to line end
+    line_vec_x = x2 - x1
+    line_vec_y = y2 - y1
+
+    # Vector from line start to circle center
+    circle_vec_x = cx - x1
+    circle_vec_y = cy - y1
+
+    # Calculate line length squared
+    line_length_sq = line_vec_x**2 + line_vec_y**2
+
+    # Project circle vector onto line vector
+    t = max(0, min(1, (circle_vec_x * line_vec_x + circle_vec_y * line_vec_y) / line_length_sq))
+
+    # Closest point on the line segment to the circle center
+    closest_x = x1 + t * line_vec_x
+    closest_y = y1 + t * line_vec_y
+
+    # Distance between closest point and circle center
+    dist_x = cx - closest_x
+    dist_y = cy - closest_y
+
+    # Check if distance is less than circle radius
+    return (dist_x**2 + dist_y**2) <= (circle_radius + 1)**2
+
+
+class QixSimulation:
+    """Game rules for one round of Qix, advanced one tick at a time.
+
+    Holds everything reset_game() used to set up as globals. There is no
+    display, font or wall clock involved: time only moves when step() is
+    called, so the simulation can run headless as fast as the CPU allows.
+    """
+
+    def __init__(self, board_width=700, board_height=700, seed=None, sparx_count=1, qix_count=1):
+        if not 0 < board_width <= MAX_BOARD_SIZE or not 0 < board_height <= MAX_BOARD_SIZE:
+            raise ValueError(f"board size {board_width}x{board_height} is outside 1x1 to "
+                             f"{MAX_BOARD_SIZE}x{MAX_BOARD_SIZE}")
+        if seed is not None and not 0 <= seed <= MAX_SEED:
+            raise ValueError(f"seed {seed} is outside 0 to {MAX_SEED}")
+        self.board_width = board_width
+        self.board_height = board_height
+        self.sparx_count = sparx_count
+        self.qix_count = qix_count
+        # Always known, so a round can be replayed from its seed and inputs
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        self.rng = random.Random(self.seed)
+
+        # Player bounds (top-left corner of the player square)
+        self.min_x = BORDER_LEFT
+        self.min_y = BORDER_TOP
+        self.max_x = board_width - PLAYER_SIZE - BORDER_RIGHT
+        self.max_y = board_height - PLAYER_SIZE - BORDER_BOTTOM
+
+        self.width, self.height = PLAYER_SIZE, PLAYER_SIZE
+        self.speed = PLAYER_SPEED
+        # Optional lap(span_name) callback timing each phase of step(), see profiler.py
+        self.lap = None
+        self.reset()
+
+    def reset(self):
+        """Reset all game variables to initial state"""
+        self.tick = 0
+        self.state = STATE_PLAYING
+
+        self.push_enabled = False
+        self.xpos, self.ypos = self.board_width / 2, self.max_y
+        # Where the player was before its last move, for swept Qix tests
+        self.last_position = (self.xpos, self.ypos)
+        self.player_path = PlayerPath()
+        self.filled_areas = []
+
+        # Broadphase over the push line for Sparx touch tests
+        self.path_grid = path_grid_for(self.player_path)
+
+        # Whether the territory and border, or the path grid, are also held by a snapshot
+        self.shared_territory = False
+        self.shared_path = False
+
+        # Area tracking
+        self.territory = TerritoryGrid(
+            BORDER_LEFT, BORDER_TOP,
+            self.board_width - BORDER_LEFT - BORDER_RIGHT,
+            self.board_height - BORDER_TOP - BORDER_BOTTOM,
+        )
+
+        # Level pass tracking
+        self.level_passed = False
+        self.level_pass_tick = 0
+
+        # Lives and Invulnerability
+        self.lives = START_LIVES
+        self.invulnerable = False
+        self.invulnerability_start_tick = 0
+
+        # Edges the player can walk and the Sparx patrol, starting as the
+        # rectangle traced by the player's center along the outer border
+        half_width, half_height = self.width // 2, self.height // 2
+        self.border = BorderGraph(self.min_x + half_width, self.min_y + half_height,
+                                  self.max_x + half_width, self.max_y + half_height,
+                                  self.territory, PLAYER_SPEED)
+
+        # Sparx
+        right = self.board_width - BORDER_RIGHT
+        bottom = self.board_height - BORDER_BOTTOM
+        self.sparx = SparxSwarm(self.border, SPARX_SPEED, SPARX_RADIUS)
+        self.sparx.spread(self.border.corners, self.sparx_count)
+
+        # Qix, the first one starts in the middle of the board
+        self.qix = QixSwarm((BORDER_LEFT, BORDER_TOP, right, bottom), self.rng, QIX_SPEED, QIX_LENGTH,
+                            QIX_TRAIL_LENGTH, QIX_TRAIL_SPACING)
+        for i in range(self.qix_count):
+            dx = self.rng.choice([-QIX_SPEED, QIX_SPEED])
+            dy = self.rng.choice([-QIX_SPEED, QIX_SPEED])
+            if i == 0:
+                x, y = self.board_width / 2, self.board_height / 2
+            else:
+                x = self.rng.randrange(BORDER_LEFT + QIX_LENGTH, right - QIX_LENGTH, QIX_SPEED)
+                y = self.rng.randrange(BORDER_TOP + QIX_LENGTH, bottom - QIX_LENGTH, QIX_SPEED)
+            self.qix.add(x, y, dx, dy)
+
+    def snapshot(self):
+        """Capture the whole game state, for restore() on this or another simulation.
+
+        The claimed territory and the border only change on a capture, and
+        the push line's grid when the line grows, so none of them are copied:
+        the snapshot shares them, and whichever simulation changes them next
+        takes its own copy first. filled_areas is only ever appended to, so
+        the snapshot keeps the list and its length.
+        """
+        self.shared_territory = self.shared_path = True
+        path = self.player_path
+        return Snapshot(
+            self.board_width, self.board_height, self.seed, self.sparx_count, self.qix_count,
+            self.rng.getstate(), self.tick, self.state, self.push_enabled, self.xpos, self.ypos,
+            array('h', path.coords), path.raw_length, self.path_grid,
+            self.filled_areas, len(self.filled_areas),
+            self.territory, self.border, self.level_passed, self.level_pass_tick, self.lives,
+            self.invulnerable, self.invulnerability_start_tick, self.sparx.snapshot(), self.qix.snapshot(),
+        )
+
+    def restore(self, snapshot):
+        """Put the game back into the state of a snapshot taken on the same board"""
+        if (snapshot.board_width, snapshot.board_height) != (self.board_width, self.board_height):
+            raise ValueError("snapshot is from a different board size")
+        self.seed, self.sparx_count, self.qix_count = snapshot.seed, snapshot.sparx_count, snapshot.qix_count
+        self.rng.setstate(snapshot.rng_state)
+        self.tick, self.state = snapshot.tick, snapshot.state
+        self.push_enabled, self.xpos, self.ypos = snapshot.push_enabled, snapshot.xpos, snapshot.ypos
+        self.last_position = (self.xpos, self.ypos)
+        self.filled_areas = snapshot.filled_areas[:snapshot.area_count]
+        self.territory, self.border = snapshot.territory, snapshot.border
+        self.shared_territory = True
+        self.level_passed, self.level_pass_tick = snapshot.level_passed, snapshot.level_pass_tick
+        self.lives, self.invulnerable = snapshot.lives, snapshot.invulnerable
+        self.invulnerability_start_tick = snapshot.invulnerability_start_tick
+        self.sparx.border = self.border
+        self.sparx.restore(snapshot.sparx)
+        self.qix.restore(snapshot.qix)
+
+        path = self.player_path = PlayerPath()
+        path.coords = array('h', snapshot.path_coords)
+        path.raw_length = snapshot.path_length
+        self.path_grid = snapshot.path_grid
+        self.shared_path = True
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        sim = cls(snapshot.board_width, snapshot.board_height, seed=snapshot.seed,
+                  sparx_count=snapshot.sparx_count, qix_count=snapshot.qix_count)
+        sim.restore(snapshot)
+        return sim
+
+    def unshare_territory(self):
+        """Take private copies of the territory and border before changing them"""
+        self.territory = self.territory.copy()
+        self.border = self.sparx.border = self.border.copy(self.territory)
+        self.shared_territory = False
+
+    def step(self, inputs=NO_INPUT):
+        """Advance the game by one tick and return the events it raised"""
+        events = []
+        if self.state != STATE_PLAYING:
+            return events
+
+        self.tick += 1
+        lap = self.lap
+        if inputs.space:
+            self.toggle_push(events)
+            if lap: lap('capture')
+        self.move_player(inputs)
+        if lap: lap('movement')
+        self.sparx.update()
+        if lap: lap('sparx_update')
+        self.check_sparx_collision(events)
+        if lap: lap('sparx_collision')
+        self.check_qix_collision(events)
+        if lap: lap('qix_collision')
+        self.qix.update(self.territory)
+        if lap: lap('qix_update')
+
+        if self.lives <= 0:
+            self.state = STATE_LOST
+            events.append((EVENT_GAME_OVER,))
+        return events
+
+    def on_border(self):
+        """Whether the player is standing on the border"""
+        return self.border.on_border(*self.player_center())
+
+    def return_to_border(self):
+        """Move the player onto the nearest point of the border if it is off it"""
+        x, y = self.player_center()
+        if self.border.on_border(x, y):
+            return
+        point = self.border.nearest_point(x, y)
+        if point is not None:
+            self.xpos = point[0] - self.width // 2
+            self.ypos = point[1] - self.height // 2
+
+    def player_center(self):
+        return (self.xpos + self.width // 2, self.ypos + self.height // 2)
+
+    def toggle_push(self, events):
+        """Start or finish pushing a line, capturing the enclosed area when finishing"""
+        if self.push_enabled and self.player_path.raw_length >= 3:
+            self.capture(self.close_path(), events)
+
+        self.push_enabled = not self.push_enabled
+        if self.push_enabled:
+            # Only start the path if the player is on the border
+            if self.on_border():
+                self.start_path([self.player_center()])
+        else:
+            self.start_path([])
+            self.return_to_border()
+
+    def close_path(self):
+        """Close the push line into a polygon.
+
+        The line is joined to the nearest point on the border, and from
+        there follows the border back to where the push started. It takes
+        the shortest way, or another way round if that one shuts in fewer
+        Qix, so the side with the Qix is left open.
+        """
+        path = self.player_path
+        end = path[-1]
+        snap = self.border.nearest_point(*end)
+        if snap is None:
+            return path.freeze()
+        closing = []
+        if snap[0] != end[0] and snap[1] != end[1]:
+            # Keep every edge axis-aligned
+            closing.append((snap[0], end[1]))
+        closing.append(snap)
+        route = self.border.route(snap, path[0])
+        polygon = path.freeze(*closing, *(route or []))
+        inside = self.qix_inside(polygon) if route is not None else 0
+        if inside:
+            # Find another way back by barring each step of this one in turn
+            corners = [snap] + route + [path[0]]
+            for step in zip(corners, corners[1:]):
+                other = self.border.route(snap, path[0], step)
+                if other is not None:
+                    other_polygon = path.freeze(*closing, *other)
+                    if self.qix_inside(other_polygon) < inside:
+                        return other_polygon
+        return polygon
+
+    def qix_inside(self, polygon):
+        """How many Qix have the middle of their line inside a polygon"""
+        points = list(polygon)
+        return sum(point_in_polygon(x, y, points) for x, y in zip(*self.qix.pos.tolist()))
+
+    def free_qix(self):
+        """Move any Qix left in claimed territory onto the first Qix still out in the open"""
+        contains = self.territory.contains
+        shut_in = [contains(x, y) for x, y in zip(*self.qix.pos.tolist())]
+        if not any(shut_in) or all(shut_in):
+            return
+        free = shut_in.index(False)
+        for i, inside in enumerate(shut_in):
+            if inside:
+                self.qix.move_onto(i, free)
+
+    def capture(self, polygon, events):
+        """Claim a closed polygon as territory"""
+        if self.shared_territory:
+            self.unshare_territory()
+        self.filled_areas.append(polygon)
+        self.territory.claim(polygon)
+        self.border.claim(polygon)
+        self.sparx.retarget()
+        self.free_qix()
+        events.append((EVENT_CAPTURE, polygon))
+
+        percentage = self.territory_percentage()
+        if percentage >= WIN_PERCENTAGE and not self.level_passed:
+            self.level_passed = True
+            self.level_pass_tick = self.tick
+            self.state = STATE_WON
+            events.append((EVENT_LEVEL_PASSED, percentage))
+
+    def territory_percentage(self):
+        """Percentage of the play field covered by claimed territory"""
+        return self.territory.percentage()
+
+    def move_player(self, inputs):
+        """Move the player, freely while pushing and along the border otherwise"""
+        speed = self.speed
+        x, y = self.xpos, self.ypos
+        self.last_position = (x, y)
+        if self.push_enabled:
+            # Prevent diagonal movement by prioritizing one direction
+            if inputs.left and not inputs.up and not inputs.down:
+                x = max(self.min_x, x - speed)
+            elif inputs.right and not inputs.up and not inputs.down:
+                x = min(self.max_x, x + speed)
+            elif inputs.up and not inputs.left and not inputs.right:
+                y = max(self.min_y, y - speed)
+            elif inputs.down and not inputs.left and not inputs.right:
+                y = min(self.max_y, y + speed)
+            else:
+                return
+            # Claimed territory cannot be pushed into
+            if self.territory.contains(x + self.width // 2, y + self.height // 2):
+                return
+            self.xpos, self.ypos = x, y
+            self.extend_path(self.player_center())  # Track path
+        else:
+            # Walk along any border edge
+            center = self.player_center()
+            for pressed, dx, dy in ((inputs.left, -speed, 0), (inputs.right, speed, 0),
+                                    (inputs.up, 0, -speed), (inputs.down, 0, speed)):
+                if pressed and self.border.along_border(center, (center[0] + dx, center[1] + dy)):
+                    self.xpos, self.ypos = x + dx, y + dy
+                    return
+
+    def start_path(self, points):
+        """Replace the push line"""
+        self.player_path = PlayerPath(points)
+        self.path_grid = path_grid_for(self.player_path)
+        self.shared_path = False
+
+    def extend_path(self, point):
+        """Append a point to the push line"""
+        path = self.player_path
+        path.append(*point)
+        # Either a new segment or the last one grown along its own direction
+        if len(path) > 1:
+            if self.shared_path:
+                self.path_grid = self.path_grid.copy()
+                self.shared_path = False
+            self.path_grid.add(len(path) - 2, path[-2], path[-1])
+
+    def sparx_touches_line(self, x, y):
+        """Check if a Sparx at (x, y) touches the green push line"""
+        path = self.player_path
+        center = (x, y)
+        for i in self.path_grid.query(x, y):
+            if line_intersects_circle(path[i], path[i + 1], center, SPARX_RADIUS):
+                return True
+        return False
+
+    def sparx_near_path(self):
+        """Indices of the Sparx close enough to the push line to touch it, in order"""
+        if len(self.sparx) <= SMALL_SWARM:
+            # Cheaper to ask the path grid about every Sparx than to narrow them down
+            return range(len(self.sparx))
+        coords = self.player_path.coords
+        reach = SPARX_RADIUS + 1
+        return self.sparx.within(min(coords[0::2]) - reach, min(coords[1::2]) - reach,
+                                 max(coords[0::2]) + reach, max(coords[1::2]) + reach)
+
+    def check_sparx_collision(self, events):
+        """Check if player collides with Sparx or if Sparx touches the green line."""
+        # Check if currently invulnerable
+        if self.invulnerable:
+            if self.tick - self.invulnerability_start_tick > INVULNERABILITY_TICKS:
+                self.invulnerable = False
+            return False
+
+        # Sparx are checked in order, the first one touching the player or line counts
+        first_hit = self.sparx.first_overlapping(self.xpos, self.ypos, self.width, self.height)
+        if first_hit < 0:
+            first_hit = len(self.sparx)
+
+        # Check if a Sparx before it touches the green line while pushing
+        if self.push_enabled and len(self.player_path) > 1:
+            positions = self.sparx.positions()
+            for i in self.sparx_near_path():
+                if i >= first_hit:
+                    break
+                if self.sparx_touches_line(*positions[i]):
+                    self.lose_life(DEATH_SPARX_LINE, events)
+                    return True
+
+        if first_hit < len(self.sparx):
+            self.lose_life(DEATH_SPARX, events)
+            return True
+        return False
+
+    def check_qix_collision(self, events):
+        """Check if a Qix touches the player or the push line while pushing.
+
+        Both sides are swept: the player's box covers where it moved from
+        this tick, and each Qix is tested over the area its line crossed in
+        its last move, so neither can pass through the other between ticks.
+        """
+        if self.invulnerable or not self.push_enabled:
+            return False
+
+        last_x, last_y = self.last_position
+        left, top = min(last_x, self.xpos), min(last_y, self.ypos)
+        right, bottom = max(last_x, self.xpos) + self.width, max(last_y, self.ypos) + self.height
+        if self.qix.first_touching(left, top, right, bottom) >= 0 or self.qix_touches_line() >= 0:
+            self.lose_life(DEATH_QIX, events)
+            return True
+        return False
+
+    def qix_touches_line(self):
+        """Index of the first Qix whose lines, trail or last move touch the push line, or -1.
+
+        Push line segments are axis-aligned, so each one is tested as a flat
+        box, and only those filed in the path grid near the Qix and its
+        trail are tested. Newer pieces of the line are covered by the
+        player's box above.
+        """
+        path = self.player_path
+        if len(path) < 2:
+            return -1
+        qix = self.qix
+        for i, (left, top, right, bottom) in enumerate(qix.extents()):
+            lines = None
+            for j in self.path_grid.query_box(left, top, right, bottom):
+                (x0, y0), (x1, y1) = path[j], path[j + 1]
+                lines = lines or qix.lines(i)
+                if qix.touches(i, min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1), lines):
+                    return i
+        return -1
+
+    def lose_life(self, cause, events):
+        self.lives -= 1
+        events.append((EVENT_DEATH, cause))
+        self.reset_player_position()
+
+    def reset_player_position(self):
+        """Reset player position to starting point"""
+        self.xpos = self.board_width / 2
+        self.ypos = self.max_y
+        self.push_enabled = False
+        self.start_path([])
+        self.return_to_border()
+        self.invulnerable = True
+        self.invulnerability_start_tick = self.tick
+
+    def invulnerability_remaining(self):
+        """Seconds left until the player can be hit again"""
+        if not self.invulnerable:
+            return 0
+        elapsed = self.tick - self.invulnerability_start_tick
+        return max(0, INVULNERABILITY_TICKS - elapsed) / TICK_RATE
@@ -0,0 +1,112 @@
+class SegmentGrid:
+    """Uniform grid broadphase over line segments, such as those of a growing polyline.
+
+    Each segment is filed under every cell its bounding box touches once
+    grown by `margin`. Any segment within `margin` of a point is then filed
+    under that point's own cell, so a proximity query is a single bucket
+    lookup no matter how long the polyline gets.
+    """
+
+    def __init__(self, margin, cell_size=32):
+        self.margin = margin
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def clear(self):
+        self.buckets.clear()
+
+    def copy(self):
+        grid = SegmentGrid(self.margin, self.cell_size)
+        grid.buckets = {cell: list(bucket) for cell, bucket in self.buckets.items()}
+        return grid
+
+    def add(self, index, start, end):
+        """File segment `index` running from `start` to `end`"""
+        cs, margin = self.cell_size, self.margin
+        x0, x1 = sorted((start[0], end[0]))
+        y0, y1 = sorted((start[1], end[1]))
+        buckets = self.buckets
+        for cx in range(int((x0 - margin) // cs), int((x1 + margin) // cs) + 1):
+            for cy in range(int((y0 - margin) // cs), int((y1 + margin) // cs) + 1):
+                bucket = buckets.get((cx, cy))
+                if bucket is None:
+                    buckets[(cx, cy)] = [index]
+                elif bucket[-1] != index:
+                    bucket.append(index)
+
+    def remove(self, index, start, end):
+        """Take back a segment filed with add()"""
+        cs, margin = self.cell_size, self.margin
+        x0, x1 = sorted((start[0], end[0]))
+        y0, y1 = sorted((start[1], end[1]))
+        buckets = self.buckets
+        for cx in range(int((x0 - margin) // cs), int((x1 + margin) // cs) + 1):
+            for cy in range(int((y0 - margin) // cs), int((y1 + margin) // cs) + 1):
+                bucket = buckets[(cx, cy)]
+                bucket.remove(index)
+                if not bucket:
+                    del buckets[(cx, cy)]
+
+    def query(self, x, y):
+        """Indices of the segments that may lie within `margin` of (x, y)"""
+        cs = self.cell_size
+        return self.buckets.get((int(x // cs), int(y // cs)), ())
+
+    def query_box(self, left, top, right, bottom):
+        """Indices of the segments that may cross the given box, in no particular order"""
+        cs, buckets = self.cell_size, self.buckets
+        found = set()
+        for cx in range(int(left // cs), int(right // cs) + 1):
+            for cy in range(int(top // cs), int(bottom // cs) + 1):
+                bucket = buckets.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+
+def segment_hits_rect(x0, y0, x1, y1, left, top, right, bottom):
+    """Whether a line segment touches an axis-aligned box (Liang-Barsky clipping).
+
+    The box may be flat, so an axis-aligned segment can be passed as a box.
+    """
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - left), (dx, right - x0), (-dy, y0 - top), (dy, bottom - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return False
+                if t > t0:
+                    t0 = t
+            else:
+                if t < t0:
+                    return False
+                if t < t1:
+                    t1 = t
+    return True
+
+
+def point_in_quad(x, y, quad):
+    """Whether a point lies inside a quadrilateral given as four corners in order"""
+    inside = False
+    for i in range(4):
+        ax, ay = quad[i - 1]
+        bx, by = quad[i]
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
+
+
+def point_in_polygon(x, y, points):
+    """Whether a point lies inside a polygon given as a list of (x, y) corners, by the even-odd rule"""
+    inside = False
+    for i in range(len(points)):
+        ax, ay = points[i - 1]
+        bx, by = points[i]
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
@@ -0,0 +1,410 @@
+"""Gameplay telemetry, written to disk off the frame thread.
+
+    python main.py --telemetry cabinet.qixt          # play and log
+    python telemetry.py cabinet.qixt                 # summarize it and its backups as JSON
+
+The game thread only appends small tuples to a bounded deque; a
+background thread packs them into records, appends them to the log and
+fsyncs in batches, so a slow disk never holds up a frame.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque, namedtuple
+
+from simulation import (EVENT_CAPTURE, EVENT_DEATH, EVENT_LEVEL_PASSED, EVENT_GAME_OVER,
+                        DEATH_SPARX, DEATH_SPARX_LINE, DEATH_QIX)
+
+# File layout: MAGIC, then records. Each record is a RECORD_HEADER (length
+# and CRC32 of the body) and a body: BODY_HEADER (kind, Unix time) followed
+# by the kind's payload. A record cut short by a crash fails its length or
+# CRC check, and reading stops there.
+MAGIC = b'QIXT\x01'
+RECORD_HEADER = struct.Struct('<II')
+BODY_HEADER = struct.Struct('<Bd')
+
+# Every record's body is far smaller than this, so a longer length can
+# only come from a damaged header and is not read
+MAX_BODY_SIZE = 4096
+
+SESSION_START, ROUND_START, CAPTURE, DEATH, PAUSE, RESUME, FRAMES, ROUND_END, SESSION_END = range(1, 10)
+
+# Name and payload of every record kind
+KINDS = {
+    SESSION_START: ('session_start', struct.Struct('<Q'), ['session']),
+    ROUND_START: ('round_start', struct.Struct('<QHHHH'),
+                  ['seed', 'board_width', 'board_height', 'sparx_count', 'qix_count']),
+    CAPTURE: ('capture', struct.Struct('<IIf'), ['area', 'vertices', 'percentage']),
+    DEATH: ('death', struct.Struct('<Bb'), ['cause', 'lives']),
+    PAUSE: ('pause', struct.Struct('<'), []),
+    RESUME: ('resume', struct.Struct('<'), []),
+    FRAMES: ('frames', struct.Struct('<Hfff'), ['count', 'p50_ms', 'p99_ms', 'max_ms']),
+    ROUND_END: ('round_end', struct.Struct('<BIf'), ['outcome', 'ticks', 'percentage']),
+    SESSION_END: ('session_end', struct.Struct('<I'), ['dropped']),
+}
+
+DEATH_CAUSES = [DEATH_SPARX, DEATH_SPARX_LINE, DEATH_QIX]
+OUTCOMES = ['won', 'lost', 'quit']
+
+Record = namedtuple('Record', ['kind', 'time', 'values'])
+
+# Frame time a per-second summary counts as a hitch, in milliseconds
+BUDGET_MS = 1000 / 60
+
+
+class TelemetryError(Exception):
+    pass
+
+
+def encode(kind, timestamp, values):
+    """One record's bytes"""
+    body = BODY_HEADER.pack(kind, timestamp) + KINDS[kind][1].pack(*values)
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def log_files(path):
+    """A rotated log's files, oldest first: path.N, ..., path.1, path"""
+    backups = []
+    for name in glob.glob(glob.escape(path) + '.*'):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), name))
+    files = [name for _, name in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+class TelemetryWriter:
+    """Appends records to a log from a background thread.
+
+    emit() is safe to call from the frame loop: it appends to a deque of at
+    most `queue_size` entries and returns. If the writer falls that far
+    behind, new records are dropped and counted in `dropped` rather than
+    waited for. Every `flush_interval` seconds the thread drains the
+    queue into one write, and it fsyncs at most every `fsync_interval`
+    seconds. A record whose values do not fit its kind's payload is left
+    out and counted in `failed`, and the first one is reported on stderr. Each writer starts a new file, and once that passes
+    `max_bytes` it is rotated like logging.handlers.RotatingFileHandler:
+    path becomes path.1, path.1 becomes path.2 and so on, keeping
+    `backups` old files.
+    """
+
+    def __init__(self, path, max_bytes=16 << 20, backups=10, queue_size=4096,
+                 flush_interval=0.25, fsync_interval=2.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.queue = deque()
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self.rotations = 0
+        self.file = None
+        self.size = 0
+        self.synced_at = time.monotonic()
+        self.open()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='telemetry-writer', daemon=True)
+        self.thread.start()
+
+    def emit(self, kind, *values):
+        """Queue a record; never blocks"""
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.append((kind, time.time(), values))
+
+    def open(self):
+        """Start a new log file, moving an existing one to the backups first.
+
+        A crash can only tear the last record of a file, and each session
+        starts a file of its own, so nothing is ever appended after a torn
+        record.
+        """
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self.shift_backups()
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC)
+        self.size = len(MAGIC)
+
+    def shift_backups(self):
+        if self.backups == 0:
+            os.remove(self.path)
+            return
+        oldest = f"{self.path}.{self.backups}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for number in range(self.backups - 1, 0, -1):
+            name = f"{self.path}.{number}"
+            if os.path.exists(name):
+                os.replace(name, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def rotate(self):
+        self.sync()
+        self.file.close()
+        self.rotations += 1
+        self.open()
+
+    def drain(self):
+        """Write everything queued so far"""
+        queue = self.queue
+        out = bytearray()
+        while True:
+            try:
+                kind, timestamp, values = queue.popleft()
+            except IndexError:
+                break
+            try:
+                out += encode(kind, timestamp, values)
+            except struct.error as error:
+                # Lose the one record rather than the writer thread
+                self.failed += 1
+                if self.failed == 1:
+                    print(f"telemetry: left out a {KINDS[kind][0]} record: {error}", file=sys.stderr)
+                continue
+            self.written += 1
+            if self.size + len(out) >= self.max_bytes:
+                self.file.write(out)
+                out.clear()
+                self.rotate()
+        if out:
+            self.file.write(out)
+            self.size += len(out)
+            self.file.flush()
+        if time.monotonic() - self.synced_at >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.synced_at = time.monotonic()
+
+    def run(self):
+        while not self.stopping.wait(self.flush_interval):
+            self.drain()
+
+    def close(self):
+        """Write out whatever is still queued, fsync and stop the thread"""
+        self.stopping.set()
+        self.thread.join()
+        self.drain()
+        self.sync()
+        self.file.close()
+
+
+class Telemetry:
+    """Turns what happens in a game session into telemetry records.
+
+    Call start_round() when a round begins, record_events() with the events
+    of every tick, pause() and resume() around the pause menu, frame() once
+    a frame with its duration and close() on exit. Frame times are kept
+    for a second and logged as a summary.
+    """
+
+    def __init__(self, writer, clock=time.monotonic):
+        self.writer = writer
+        self.clock = clock
+        self.sim = None
+        self.claimed = 0
+        self.frame_times = []
+        self.window_start = clock()
+        writer.emit(SESSION_START, random.getrandbits(64))
+
+    def start_round(self, sim):
+        if self.sim is not None:
+            self.end_round(self.sim, 'quit')
+        self.sim = sim
+        self.claimed = sim.territory.claimed
+        self.writer.emit(ROUND_START, sim.seed, sim.board_width, sim.board_height, sim.sparx_count, sim.qix_count)
+
+    def record_events(self, sim, events):
+        for event in events:
+            kind = event[0]
+            if kind == EVENT_CAPTURE:
+                claimed = sim.territory.claimed
+                self.writer.emit(CAPTURE, claimed - self.claimed, len(event[1]), sim.territory_percentage())
+                self.claimed = claimed
+            elif kind == EVENT_DEATH:
+                self.writer.emit(DEATH, DEATH_CAUSES.index(event[1]), sim.lives)
+            elif kind == EVENT_LEVEL_PASSED:
+                self.end_round(sim, 'won')
+            elif kind == EVENT_GAME_OVER:
+                self.end_round(sim, 'lost')
+
+    def end_round(self, sim, outcome):
+        """Log how a round finished; only the first call per round counts"""
+        if self.sim is not sim:
+            return
+        self.writer.emit(ROUND_END, OUTCOMES.index(outcome), sim.tick, sim.territory_percentage())
+        self.sim = None
+
+    def pause(self):
+        self.writer.emit(PAUSE)
+
+    def resume(self):
+        self.writer.emit(RESUME)
+
+    def frame(self, milliseconds):
+        times = self.frame_times
+        times.append(milliseconds)
+        now = self.clock()
+        if now - self.window_start >= 1.0:
+            times.sort()
+            count = len(times)
+            self.writer.emit(FRAMES, min(count, 0xFFFF), times[count // 2], times[min(count - 1, count * 99 // 100)],
+                             times[-1])
+            times.clear()
+            self.window_start = now
+
+    def close(self):
+        if self.sim is not None:
+            self.end_round(self.sim, 'quit')
+        self.writer.emit(SESSION_END, self.writer.dropped)
+        self.writer.close()
+
+
+class TelemetryReader:
+    """Streams the records of one log file in chunks, whatever its size.
+
+    Iterating yields a Record per entry, with the payload as a dict. A
+    record cut short, failing its CRC or claiming a length no record has
+    ends the file early and sets `damaged`; a crash can only tear the
+    last one.
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.damaged = False
+
+    def __iter__(self):
+        header_size = RECORD_HEADER.size
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise TelemetryError(f"{self.path} is not a telemetry log")
+            buffer = b''
+            offset = 0
+            while True:
+                if len(buffer) - offset < header_size:
+                    buffer, offset = buffer[offset:] + f.read(self.chunk_size), 0
+                    if len(buffer) < header_size:
+                        self.damaged = len(buffer) > 0
+                        return
+                length, crc = RECORD_HEADER.unpack_from(buffer, offset)
+                if not BODY_HEADER.size <= length <= MAX_BODY_SIZE:
+                    self.damaged = True
+                    return
+                end = offset + header_size + length
+                if end > len(buffer):
+                    buffer, offset = buffer[offset:] + f.read(max(self.chunk_size, length + header_size)), 0
+                    end = header_size + length
+                    if end > len(buffer):
+                        self.damaged = True
+                        return
+                body = buffer[offset + header_size:end]
+                if zlib.crc32(body) != crc:
+                    self.damaged = True
+                    return
+                offset = end
+
+                kind, timestamp = BODY_HEADER.unpack_from(body)
+                if kind not in KINDS:
+                    raise TelemetryError(f"unknown record kind {kind} in {self.path}")
+                name, payload, fields = KINDS[kind]
+                yield Record(name, timestamp, dict(zip(fields, payload.unpack_from(body, BODY_HEADER.size))))
+
+
+def summarize(paths):
+    """Aggregate any number of log files into one summary dict, one record at a time"""
+    records = Counter()
+    deaths = Counter()
+    outcomes = Counter()
+    captures = area = vertices = rounds = 0
+    final_percentage = 0.0
+    frame_seconds = frames = slow_seconds = 0
+    worst_frame = 0.0
+    damaged = []
+    first = last = None
+
+    for path in paths:
+        reader = TelemetryReader(path)
+        for record in reader:
+            records[record.kind] += 1
+            first = record.time if first is None else min(first, record.time)
+            last = record.time if last is None else max(last, record.time)
+            values = record.values
+            if record.kind == 'capture':
+                captures += 1
+                area += values['area']
+                vertices += values['vertices']
+            elif record.kind == 'death':
+                deaths[DEATH_CAUSES[values['cause']]] += 1
+            elif record.kind == 'round_end':
+                rounds += 1
+                outcomes[OUTCOMES[values['outcome']]] += 1
+                final_percentage += values['percentage']
+            elif record.kind == 'frames':
+                frame_seconds += 1
+                frames += values['count']
+                slow_seconds += values['p99_ms'] > BUDGET_MS
+                worst_frame = max(worst_frame, values['max_ms'])
+        if reader.damaged:
+            damaged.append(path)
+
+    return {
+        'files': len(paths),
+        'damaged_files': damaged,
+        'first_record': first,
+        'last_record': last,
+        'records': dict(records),
+        'sessions': records['session_start'],
+        'rounds': rounds,
+        'outcomes': dict(outcomes),
+        'mean_final_percentage': final_percentage / rounds if rounds else None,
+        'captures': captures,
+        'mean_capture_area': area / captures if captures else None,
+        'mean_capture_vertices': vertices / captures if captures else None,
+        'deaths': dict(deaths),
+        'pauses': records['pause'],
+        'frame_seconds': frame_seconds,
+        'mean_fps': frames / frame_seconds if frame_seconds else None,
+        'seconds_with_p99_over_budget': slow_seconds,
+        'worst_frame_ms': worst_frame,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize gameplay telemetry logs")
+    parser.add_argument('logs', nargs='+', metavar='LOG',
+                        help="log files; a path with rotated backups (path.1, path.2...) includes them")
+    parser.add_argument('--output', metavar='PATH', help="write the JSON summary here instead of stdout")
+    args = parser.parse_args()
+
+    paths = []
+    for log in args.logs:
+        for path in log_files(log) or [log]:
+            if path not in paths:
+                paths.append(path)
+    report = json.dumps(summarize(paths), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import math
+
+
+class TerritoryGrid:
+    """Occupancy grid of claimed territory over the play field.
+
+    One byte per cell, row major, 1 for claimed. A running count of claimed
+    cells is kept as polygons are claimed, so the coverage percentage and
+    point lookups are O(1) and overlapping claims are only counted once.
+    """
+
+    def __init__(self, left, top, width, height, cell_size=1):
+        self.left = left
+        self.top = top
+        self.cell_size = cell_size
+        self.cols = max(1, math.ceil(width / cell_size))
+        self.rows = max(1, math.ceil(height / cell_size))
+        self.cells = bytearray(self.cols * self.rows)
+        self.total = self.cols * self.rows
+        self.claimed = 0
+
+    def copy(self):
+        grid = TerritoryGrid.__new__(TerritoryGrid)
+        grid.__dict__.update(self.__dict__)
+        grid.cells = bytearray(self.cells)
+        return grid
+
+    def percentage(self):
+        """Percentage of the play field that has been claimed"""
+        return self.claimed * 100 / self.total
+
+    def cell_of(self, x, y):
+        """Grid (col, row) holding a board point, or None when outside the field"""
+        col = int((x - self.left) // self.cell_size)
+        row = int((y - self.top) // self.cell_size)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return col, row
+        return None
+
+    def contains(self, x, y):
+        """Whether a board point lies in claimed territory"""
+        # cell_of() inlined, this is called several times every tick
+        col = int((x - self.left) // self.cell_size)
+        row = int((y - self.top) // self.cell_size)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.cells[row * self.cols + col] == 1
+        return False
+
+    def claim(self, polygon):
+        """Mark every cell whose center is inside the polygon as claimed.
+
+        Uses an even-odd scanline fill, so self-intersecting stix paths
+        fill the same way pygame.draw.polygon draws them. Returns the
+        number of cells that were newly claimed.
+        """
+        cs = self.cell_size
+        left, top, cols, cells = self.left, self.top, self.cols, self.cells
+
+        # Bucket the x of every edge crossing by the row whose center it crosses
+        crossings = {}
+        n = len(polygon)
+        for i in range(n):
+            x0, y0 = polygon[i]
+            x1, y1 = polygon[(i + 1) % n]
+            if y0 == y1:
+                continue
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+            # Rows whose center c satisfies y0 <= c < y1
+            first = max(0, math.ceil((y0 - top) / cs - 0.5))
+            last = min(self.rows, math.ceil((y1 - top) / cs - 0.5))
+            slope = (x1 - x0) / (y1 - y0)
+            for row in range(first, last):
+                yc = top + (row + 0.5) * cs
+                crossings.setdefault(row, []).append(x0 + (yc - y0) * slope)
+
+        added = 0
+        for row, xs in crossings.items():
+            xs.sort()
+            offset = row * cols
+            for i in range(0, len(xs) - 1, 2):
+                # Columns whose center c satisfies xa <= c < xb
+                start = max(0, math.ceil((xs[i] - left) / cs - 0.5))
+                end = min(cols, math.ceil((xs[i + 1] - left) / cs - 0.5))
+                if end <= start:
+                    continue
+                span = slice(offset + start, offset + end)
+                added += cells[span].count(0)
+                cells[span] = b'\x01' * (end - start)
+
+        self.claimed += added
+        return added
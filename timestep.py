@@ -0,0 +1,65 @@
+import time
+
+from simulation import TICK_RATE
+
+
+class FixedTimestep:
+    """Decides how many simulation ticks to run for each rendered frame.
+
+    Wall time is banked into an accumulator and spent in whole ticks of
+    1 / tick_rate seconds. Game speed is then the same at any frame rate,
+    and `alpha` says how far between the last two ticks the current frame
+    falls, for interpolated drawing.
+
+    In unthrottled mode there is no accumulator: ticks run back to back
+    until `frame_budget` seconds of wall time have gone by, so the game
+    runs as fast as the CPU allows while still drawing now and then.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE, max_ticks_per_frame=5, unthrottled=False,
+                 frame_budget=1 / 60, time_source=time.perf_counter):
+        self.tick_duration = 1 / tick_rate
+        self.max_ticks_per_frame = max_ticks_per_frame
+        self.unthrottled = unthrottled
+        self.frame_budget = frame_budget
+        self.time_source = time_source
+        self.accumulator = 0.0
+        self.last_time = None
+
+    def reset(self):
+        """Forget banked time, e.g. when resuming from the pause menu"""
+        self.accumulator = 0.0
+        self.last_time = None
+
+    @property
+    def alpha(self):
+        """Fraction of a tick since the last one ran, 0 <= alpha < 1"""
+        if self.unthrottled:
+            return 1.0
+        return self.accumulator / self.tick_duration
+
+    def ticks(self):
+        """Yield once per simulation tick due for this frame"""
+        now = self.time_source()
+        if self.unthrottled:
+            deadline = now + self.frame_budget
+            yield
+            while self.time_source() < deadline:
+                yield
+            return
+
+        if self.last_time is None:
+            # First frame after a reset runs exactly one tick
+            self.last_time = now
+            self.accumulator = self.tick_duration
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        # Drop time we cannot catch up on instead of spiralling
+        max_time = self.tick_duration * self.max_ticks_per_frame
+        if self.accumulator > max_time:
+            self.accumulator = max_time
+
+        while self.accumulator >= self.tick_duration:
+            self.accumulator -= self.tick_duration
+            yield
@@ -0,0 +1,198 @@
+import struct
+import zlib
+from array import array
+from collections import namedtuple
+
+from path import PlayerPath
+from simulation import (QixSimulation, NO_INPUT, STATE_PLAYING, STATE_WON, START_LIVES, WIN_PERCENTAGE,
+                        EVENT_CAPTURE, EVENT_LEVEL_PASSED, EVENT_GAME_OVER)
+
+# Attributes of QixSimulation that belong to one player. The simulation
+# holds the active player's values in them; the rest wait in `players`.
+PLAYER_FIELDS = ('xpos', 'ypos', 'last_position', 'push_enabled', 'player_path', 'path_grid',
+                 'shared_path', 'lives', 'invulnerable', 'invulnerability_start_tick')
+
+VersusSnapshot = namedtuple('VersusSnapshot', ['game', 'others', 'claimed', 'owners', 'winner'])
+
+
+class VersusSimulation(QixSimulation):
+    """Two players claiming territory on one board against the same Sparx and Qix.
+
+    Each tick runs the single-player rules once per player: the player's
+    state is swapped into the simulation's player attributes, so toggle_push,
+    move_player and the collision checks are the same code as in a
+    one-player game. Player 0 starts at the bottom of the board and player 1
+    at the top.
+
+    step() takes one Inputs per player. Events get the index of the player
+    they concern appended. Claimed territory counts for the player who
+    captured it; the first to WIN_PERCENTAGE, or the last one with lives
+    left, is the `winner`.
+    """
+
+    def __init__(self, board_width=700, board_height=700, seed=None, sparx_count=1, qix_count=1,
+                 player_count=2):
+        self.player_count = player_count
+        super().__init__(board_width, board_height, seed, sparx_count, qix_count)
+
+    def reset(self):
+        super().reset()
+        self.active = 0
+        self.claimed = [0] * self.player_count
+        self.owners = []
+        self.winner = None
+        self.players = [None] * self.player_count
+        for i in range(self.player_count):
+            self.active = i
+            self.reset_player()
+            self.players[i] = self.player_state()
+        self.active = 0
+        self.load_player(0)
+
+    def player_state(self):
+        return {name: getattr(self, name) for name in PLAYER_FIELDS}
+
+    def load_player(self, index):
+        for name, value in self.players[index].items():
+            setattr(self, name, value)
+        self.active = index
+
+    def switch_to(self, index):
+        """Make `index` the player the single-player rules act on"""
+        if index != self.active:
+            self.players[self.active] = self.player_state()
+            self.load_player(index)
+
+    def player(self, index):
+        """Attributes of any player, whether active or not"""
+        return self.player_state() if index == self.active else self.players[index]
+
+    def spawn_point(self):
+        if self.active % 2:
+            return self.board_width / 2, self.min_y
+        return self.board_width / 2, self.max_y
+
+    def reset_player(self):
+        self.xpos, self.ypos = self.spawn_point()
+        self.push_enabled = False
+        self.start_path([])
+        self.return_to_border()
+        self.lives = START_LIVES
+        self.invulnerable = False
+        self.invulnerability_start_tick = 0
+
+    def reset_player_position(self):
+        super().reset_player_position()
+        self.xpos, self.ypos = self.spawn_point()
+        self.return_to_border()
+
+    def step(self, inputs=None):
+        """Advance one tick with one Inputs per player, returning the events raised"""
+        events = []
+        if self.state != STATE_PLAYING:
+            return events
+        if inputs is None:
+            inputs = (NO_INPUT,) * self.player_count
+
+        self.tick += 1
+        for i, player_inputs in enumerate(inputs):
+            self.switch_to(i)
+            raised = []
+            if player_inputs.space:
+                self.toggle_push(raised)
+            self.move_player(player_inputs)
+            events += [event + (i,) for event in raised]
+            if self.state != STATE_PLAYING:
+                break
+        self.sparx.update()
+        for i in range(self.player_count):
+            self.switch_to(i)
+            raised = []
+            self.check_sparx_collision(raised)
+            self.check_qix_collision(raised)
+            events += [event + (i,) for event in raised]
+        self.qix.update(self.territory)
+        self.switch_to(0)
+
+        if self.state == STATE_PLAYING:
+            alive = [i for i in range(self.player_count) if self.player(i)['lives'] > 0]
+            if len(alive) < self.player_count:
+                self.state = STATE_WON
+                self.winner = alive[0] if len(alive) == 1 else None
+                events.append((EVENT_GAME_OVER, self.winner))
+        return events
+
+    def capture(self, polygon, events):
+        """Claim a polygon for the active player"""
+        if self.shared_territory:
+            self.unshare_territory()
+        self.filled_areas.append(polygon)
+        self.owners.append(self.active)
+        self.claimed[self.active] += self.territory.claim(polygon)
+        self.border.claim(polygon)
+        self.sparx.retarget()
+        events.append((EVENT_CAPTURE, polygon))
+        self.clear_others()
+
+        percentage = self.player_percentage(self.active)
+        if percentage >= WIN_PERCENTAGE and not self.level_passed:
+            self.level_passed = True
+            self.level_pass_tick = self.tick
+            self.state = STATE_WON
+            self.winner = self.active
+            events.append((EVENT_LEVEL_PASSED, percentage))
+
+    def clear_others(self):
+        """Put the other players back on the border if a capture swallowed them"""
+        capturer = self.active
+        for i in range(self.player_count):
+            if i == capturer:
+                continue
+            self.switch_to(i)
+            x, y = self.player_center()
+            if self.push_enabled and self.territory.contains(x, y):
+                # The push line ends inside someone else's capture and is lost
+                self.push_enabled = False
+                self.start_path([])
+            if not self.push_enabled:
+                self.return_to_border()
+        self.switch_to(capturer)
+
+    def player_percentage(self, index):
+        return self.claimed[index] * 100 / self.territory.total
+
+    def snapshot(self):
+        self.switch_to(0)
+        others = []
+        for state in self.players[1:]:
+            state['shared_path'] = True
+            others.append(dict(state, player_path=copy_path(state['player_path'])))
+        return VersusSnapshot(super().snapshot(), others, list(self.claimed), tuple(self.owners), self.winner)
+
+    def restore(self, snapshot):
+        self.switch_to(0)
+        super().restore(snapshot.game)
+        self.players[0] = self.player_state()
+        for i, state in enumerate(snapshot.others, 1):
+            self.players[i] = dict(state, player_path=copy_path(state['player_path']))
+        self.claimed = list(snapshot.claimed)
+        self.owners = list(snapshot.owners)
+        self.winner = snapshot.winner
+
+    def digest(self):
+        """CRC of the state two peers must agree on, cheap enough to take often"""
+        crc = zlib.crc32(struct.pack('<qi', self.tick, self.territory.claimed))
+        for i in range(self.player_count):
+            player = self.player(i)
+            crc = zlib.crc32(struct.pack('<ddii', player['xpos'], player['ypos'], player['lives'],
+                                         player['push_enabled']), crc)
+            crc = zlib.crc32(player['player_path'].coords.tobytes(), crc)
+        crc = zlib.crc32(self.sparx.pos.tobytes(), crc)
+        return zlib.crc32(self.qix.ends.tobytes(), crc)
+
+
+def copy_path(path):
+    copy = PlayerPath()
+    copy.coords = array('h', path.coords)
+    copy.raw_length = path.raw_length
+    return copy